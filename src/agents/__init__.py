@@ -1,18 +1,32 @@
-from .code_agent import CodeAgent
-from .docs_agent import DocsAgent
-from .idl_agent import IDLAgent
-from .manifest_agent import ManifestAgent
-from .review_agent import ReviewAgent
-from .run_agent import RunAgent
-from .test_agent import TestAgent
-
-
-__all__ = [
-    'CodeAgent',
-    'DocsAgent',
-    'IDLAgent',
-    'ManifestAgent',
-    'ReviewAgent',
-    'RunAgent',
-    'TestAgent',
-]
\ No newline at end of file
+import importlib
+
+
+# Exported name -> defining module. Modules are imported on first access,
+# so `import agents` stays cheap for callers that need only some agents.
+_EXPORTS = {
+    'AgentRegistry': '.registry',
+    'CodeAgent': '.code_agent',
+    'DocsAgent': '.docs_agent',
+    'FileAgent': '.file',
+    'IDLAgent': '.idl_agent',
+    'ManifestAgent': '.manifest_agent',
+    'ReviewAgent': '.review_agent',
+    'RunAgent': '.run_agent',
+    'TestAgent': '.test_agent',
+}
+
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,7 +1,10 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 
 
 class CodeAgent:
+    stage = 'code'
+    depends_on = ('idl',)
+
     @staticmethod
     def create(llm):
         return Agent(
@@ -44,3 +47,30 @@ class CodeAgent:
             - The output is in plain text with no markdown formatting""",
             output_file=output_file
         )
+
+    @staticmethod
+    def create_patch_task(agent, feature_desc, path, api_summary, regions, output_file=None):
+        if output_file is None:
+            output_file = f"patches/{path}.diff"
+
+        return Task(
+            description=f"""Add the following feature to {path} by changing only what it needs:
+            {feature_desc}
+
+            Public API of the current file:
+            {api_summary}
+
+            The parts of {path} the feature most likely touches:
+            {regions}
+
+            Ensure the change:
+            0. Keeps the existing language, style and error handling
+            1. Leaves unrelated code untouched
+            2. Includes type hints and docstrings for new code""",
+            agent=agent,
+            expected_output=f"""A unified diff against {path} only:
+            - Hunks start with @@ -<line>,<count> +<line>,<count> @@ using the line numbers above
+            - Every hunk has at least two unchanged context lines copied exactly from the excerpts
+            - No explanations before or after the diff""",
+            output_file=output_file
+        )
@@ -1,7 +1,10 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 
 
 class DocsAgent:
+    stage = 'docs'
+    depends_on = ('code',)
+
     @staticmethod
     def create(llm):
         return Agent(
@@ -40,4 +43,31 @@ class DocsAgent:
             output_file=output_file
         )
 
+    @staticmethod
+    def create_patch_task(agent, feature_desc, path, changed_code, outline, regions,
+                          output_file=None):
+        if output_file is None:
+            output_file = f"patches/{path}.diff"
+
+        return Task(
+            description=f"""A feature was added to the application:
+            {feature_desc}
+
+            The new and changed code:
+            {changed_code}
 
+            Headings of {path}:
+            {outline}
+
+            The sections of {path} that describe the changed code:
+            {regions}
+
+            Update these sections, or add a section for the feature, with usage
+            examples. Do not touch unrelated sections.""",
+            agent=agent,
+            expected_output=f"""A unified diff against {path} only:
+            - Hunks start with @@ -<line>,<count> +<line>,<count> @@ using the line numbers above
+            - Every hunk has at least two unchanged context lines copied exactly from the excerpts
+            - No explanations before or after the diff""",
+            output_file=output_file
+        )
@@ -0,0 +1,155 @@
+from utils.lazy_crewai import Agent, Task
+import os, re
+
+
+class FileSpec:
+    """One file of the manifest's file-mapping, generated as its own stage."""
+
+    def __init__(self, path, description, depends_on=(), content=None):
+        self.path = path
+        self.description = description
+        self.stage = FileAgent.stage_for(path)
+        self.depends_on = tuple(depends_on)
+        # Set when the manifest already determines the content, no LLM needed
+        self.content = content
+
+
+class FileAgent:
+    stage = 'file'
+    depends_on = ('idl',)
+    # File stages run concurrently, so each checks out its own agent from the registry
+    pooled = True
+
+    SOURCE_EXTENSIONS = ('.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.go', '.rs', '.rb',
+                         '.c', '.h', '.cpp', '.hpp', '.cs', '.php', '.kt', '.swift', '.html', '.css')
+    DOC_EXTENSIONS = ('.md', '.rst', '.txt')
+    TEST_PATTERN = re.compile(r'(^|/)(tests?/|test_)|[._-]test\.|_test\.go$|\.spec\.')
+    EMPTY_PATTERN = re.compile(r'\b(an? )?empty file\b', re.IGNORECASE)
+
+    @staticmethod
+    def create(llm):
+        return Agent(
+            role='Software Engineer',
+            goal='Write individual project files that fit together into a working application',
+            backstory="""You are a versatile software engineer who writes exactly the file
+            you are asked for, whether it is source code, tests, configuration or
+            documentation, consistent with the rest of the project.""",
+            verbose=False,
+            llm=llm
+        )
+
+    @staticmethod
+    def create_task(agent, project_spec, file_spec, upstream, output_file=None):
+        if output_file is None:
+            output_file = file_spec.path
+
+        context = "\n\n".join(
+            f"Contents of {name}:\n{content}" for name, content in upstream.items())
+        return Task(
+            description=f"""Write the file {file_spec.path} of the following project.
+            Project Spec:
+            {project_spec}
+
+            What the file contains:
+            {file_spec.description}
+
+            Related project files:
+            {context}
+
+            The file must be complete and consistent with the related files.""",
+            agent=agent,
+            expected_output=f"""The complete contents of {file_spec.path} only:
+            - No explanations before or after the contents
+            - The output is in plain text with no markdown formatting""",
+            output_file=output_file
+        )
+
+    @staticmethod
+    def stage_for(path):
+        return f"file:{path}"
+
+    @staticmethod
+    def normalize_path(path):
+        """Returns a relative, normalized path, or None for paths outside the project."""
+        path = os.path.normpath(str(path).strip().lstrip('/'))
+        if path in ('', '.') or path.startswith('..'):
+            return None
+        return path.replace(os.sep, '/')
+
+    @staticmethod
+    def file_mapping(manifest):
+        """The manifest's mapping of file path -> description, under either key spelling."""
+        mapping = manifest.get('file-mapping') or manifest.get('file_mapping') or {}
+        return mapping if isinstance(mapping, dict) else {}
+
+    @staticmethod
+    def _tier(path):
+        """0 for source files, 1 for tests, 2 for documentation, configuration and scripts."""
+        if FileAgent.TEST_PATTERN.search(path):
+            return 1
+        if path.endswith(FileAgent.SOURCE_EXTENSIONS):
+            return 0
+        return 2
+
+    @staticmethod
+    def plan(manifest, stage_files):
+        """
+        Turns every file-mapping entry not produced by a fixed stage into a
+        FileSpec. `stage_files` maps the paths of the fixed stages to their
+        stage names.
+
+        Dependencies are inferred from the descriptions: a file depends on
+        the files it mentions, as long as they are source files before tests
+        before everything else (or the same kind listed earlier), which keeps
+        the graph acyclic. Source files also depend on the IDL, tests and
+        documentation on the main implementation.
+        """
+        fixed = {FileAgent.normalize_path(path): stage
+                 for path, stage in stage_files.items() if path}
+        entries = []
+        for path, description in FileAgent.file_mapping(manifest).items():
+            normalized = FileAgent.normalize_path(path)
+            if normalized is None or normalized in fixed:
+                continue
+            if normalized in (entry[0] for entry in entries):
+                continue
+            entries.append((normalized, str(description or "")))
+
+        known = list(fixed) + [path for path, _ in entries]
+        order = {path: index for index, (path, _) in enumerate(entries)}
+        specs = []
+        for index, (path, description) in enumerate(entries):
+            tier = FileAgent._tier(path)
+            depends_on = ['idl'] if tier == 0 else []
+            if tier == 1 or path.endswith(FileAgent.DOC_EXTENSIONS):
+                depends_on.append('code')
+            for other in known:
+                if other == path or not FileAgent._mentions(description, other):
+                    continue
+                if other in fixed:
+                    dependency = fixed[other]
+                else:
+                    other_tier = FileAgent._tier(other)
+                    if other_tier > tier or (other_tier == tier and order[other] > index):
+                        continue
+                    dependency = FileAgent.stage_for(other)
+                if dependency not in depends_on:
+                    depends_on.append(dependency)
+            specs.append(FileSpec(path, description, depends_on,
+                                  FileAgent.local_content(manifest, path, description)))
+        return specs
+
+    @staticmethod
+    def _mentions(description, path):
+        name = os.path.basename(path)
+        return re.search(rf'(?<![\w.]){re.escape(name)}(?![\w])', description) is not None
+
+    @staticmethod
+    def local_content(manifest, path, description):
+        """Content known without an LLM: declared empty files and `<path>_content` manifest entries."""
+        for key in (f"{path}_content", f"{os.path.basename(path)}_content"):
+            if isinstance(manifest.get(key), str):
+                return manifest[key]
+        if FileAgent.EMPTY_PATTERN.search(description):
+            return ""
+        return None
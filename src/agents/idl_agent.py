@@ -1,7 +1,10 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 
 
 class IDLAgent:
+    stage = 'idl'
+    depends_on = ()
+
     @staticmethod
     def create(llm):
         return Agent(
@@ -1,6 +1,8 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 import json, re
 class ManifestAgent:
+    stage = 'manifest'
+    depends_on = ()
 
     @staticmethod
     def create(llm):
@@ -16,8 +18,11 @@ class ManifestAgent:
         )
 
     @staticmethod
-    def create_task(agent, project_spec):
+    def create_task(agent, project_spec, output_file=None):
         """Create a task for determining project file structure."""
+        if output_file is None:
+            output_file = 'src/manifest.json'
+
         return Task(
             description=f"Analyze the following project specification and determine appropriate file structure:{project_spec}"
                         "Your task is to process this specification and return a JSON string with file structure information that"
@@ -44,25 +49,82 @@ class ManifestAgent:
                             " \"tests/game.test.js\":\"contains javascript\","
                             " }} The file-mapping will differ between languages and will identify what a language a "
                             "file contains",
-            output_file='src/manifest.json'
+            output_file=output_file
         )
 
+    # Keywords pointing at each language, compiled into a single scanner so a
+    # specification is read once instead of once per language.
+    LANGUAGE_KEYWORDS = {
+        'python': ('python', 'flask', 'django', 'fastapi', 'pytest'),
+        'cpp': ('c\\+\\+', 'cpp', 'gcc', 'cmake'),
+        'javascript': ('javascript', 'node', 'nodejs', 'express', 'react', 'npm'),
+        'java': ('java', 'spring', 'maven', 'gradle'),
+        'go': ('golang', 'go'),
+    }
+    LANGUAGE_SCANNER = re.compile(
+        "|".join(f"(?P<{lang}>(?<![\\w+])(?:{'|'.join(words)})(?![\\w+]))"
+                 for lang, words in LANGUAGE_KEYWORDS.items()),
+        re.IGNORECASE)
+    # "written in Python", "a REST server in Go", "using Node.js"
+    EXPLICIT_LANGUAGE = re.compile(
+        r"\b(?:in|using)\s+(python|c\+\+|cpp|javascript|node(?:\.js)?|java|golang|go)(?![\w+])",
+        re.IGNORECASE)
+    EXPLICIT_ALIASES = {'c++': 'cpp', 'node': 'javascript', 'node.js': 'javascript', 'golang': 'go'}
+    LANGUAGE_NAMES = {'python': 'Python', 'cpp': 'C++', 'javascript': 'JavaScript',
+                      'java': 'Java', 'go': 'Go'}
+    DEPENDENCY_FILES = {
+        'python': ('pyproject.toml', "project metadata and dependencies in TOML format"),
+        'cpp': ('CMakeLists.txt', "CMake build configuration for the application and its tests"),
+        'javascript': ('package.json', "npm package metadata, scripts and dependencies"),
+        'java': ('pom.xml', "Maven build configuration and dependencies"),
+        'go': ('go.mod', "Go module definition and dependencies"),
+    }
+    BASE_NAME_SCANNER = re.compile(r"\b(calculator|server|api|service|app)\b", re.IGNORECASE)
+    # "Develop a command-line calculator application" -> "command-line calculator"
+    PROJECT_PHRASE = re.compile(
+        r"\b(?:develop|build|create|implement|write|make)\s+an?\s+([\w\- ]{3,60}?)\s+"
+        r"(?:application|app|tool|service|server|program|library|game)\b",
+        re.IGNORECASE)
+    GENERIC_HEADINGS = {'overview', 'requirements', 'introduction', 'description', 'summary'}
+
     @staticmethod
-    def determine_language(spec):
-        """Analyze specification to determine primary programming language."""
-        spec = spec.lower() if isinstance(spec, str) else ""
-        language_patterns = {
-            'python': r'\b(python|flask|django|fastapi)\b',
-            'cpp': r'\b(c\+\+|cpp|gcc)\b',
-            'javascript': r'\b(javascript|node|express|react)\b',
-            'java': r'\b(java|spring|maven)\b',
-            'go': r'\b(go|golang)\b',
-        }
+    def scan_languages(spec):
+        """Counts keyword evidence for each language and notes an explicit statement."""
+        counts = {}
+        explicit = None
+        if isinstance(spec, str):
+            for match in ManifestAgent.LANGUAGE_SCANNER.finditer(spec):
+                counts[match.lastgroup] = counts.get(match.lastgroup, 0) + 1
+            for statement in ManifestAgent.EXPLICIT_LANGUAGE.finditer(spec):
+                word = statement.group(1)
+                # "in go" is usually English; only the capitalised language name counts
+                if word.lower() == 'go' and word != 'Go':
+                    continue
+                word = word.lower()
+                explicit = ManifestAgent.EXPLICIT_ALIASES.get(word, word)
+                break
+        return counts, explicit
 
-        for lang, pattern in language_patterns.items():
-            if re.search(pattern, spec):
-                return lang
-        return 'python'  # Note: Default to Python if no specific language is detected
+    @staticmethod
+    def determine_language(spec, with_confidence=False):
+        """
+        Analyze specification to determine primary programming language.
+        With `with_confidence`, returns (language, confidence between 0 and 1).
+        """
+        counts, explicit = ManifestAgent.scan_languages(spec)
+        if explicit:
+            language = explicit
+            confidence = 1.0 if counts.get(language, 0) >= sum(counts.values()) / 2 else 0.8
+        elif counts:
+            language = max(counts, key=counts.get)
+            share = counts[language] / sum(counts.values())
+            # Bare "go" is an ordinary English word, so it alone is weak evidence
+            strength = 0.5 if language == 'go' else min(0.9, 0.6 + 0.1 * counts[language])
+            confidence = share * strength
+        else:
+            language = 'python'  # Note: Default to Python if no specific language is detected
+            confidence = 0.2
+        return (language, confidence) if with_confidence else language
 
     @staticmethod
     def get_file_names(language, spec):
@@ -74,7 +136,7 @@ class ManifestAgent:
             'cpp': {'impl': '.cpp', 'test': '_test.cpp', 'docs': '.md', 'interface': '.idl'},
             'javascript': {'impl': '.js', 'test': '.test.js', 'docs': '.md', 'interface': '.idl'},
             'java': {'impl': '.java', 'test': 'Test.java', 'docs': '.md', 'interface': '.idl'},
-            'go': {'impl': '.go', 'test': '.test.go', 'docs': '.md', 'interface': '.idl'},
+            'go': {'impl': '.go', 'test': '_test.go', 'docs': '.md', 'interface': '.idl'},
         }
 
         ext = extensions.get(language, extensions['python'])
@@ -93,15 +155,65 @@ class ManifestAgent:
         if not isinstance(spec, str):
             return 'app'
 
-        words = spec.lower().split()
-        key_indicators = ['calculator', 'server', 'api', 'service', 'app']
-
-        for word in words:
-            if word in key_indicators:
-                return word
+        match = ManifestAgent.BASE_NAME_SCANNER.search(spec)
+        if match:
+            return match.group(1).lower()
 
         return 'app'  # Default base name if no specific indicator is found
 
+    @staticmethod
+    def _extract_project_name(spec, base_name):
+        """
+        Uses the first top-level markdown title, else the phrase describing
+        what to build, else names the project after its base name.
+        """
+        for line in spec.splitlines():
+            heading = line.strip()
+            if heading.startswith('# ') or heading.startswith('## '):
+                title = heading.lstrip('#').strip()
+                if title and title.lower() not in ManifestAgent.GENERIC_HEADINGS:
+                    return title
+        phrase = ManifestAgent.PROJECT_PHRASE.search(spec)
+        if phrase:
+            return re.sub(r"\b\w", lambda m: m.group().upper(), phrase.group(1))
+        return f"{base_name.capitalize()} Application"
+
+    @staticmethod
+    def local_manifest(spec):
+        """
+        Builds the full manifest schema from the specification without an LLM.
+        Returns (manifest, confidence); callers fall back to the manifest agent
+        when the confidence is too low to trust the detected language.
+        """
+        language, confidence = ManifestAgent.determine_language(spec, with_confidence=True)
+        files = ManifestAgent.get_file_names(language, spec)
+        base_name = ManifestAgent._extract_base_name(spec)
+        if base_name == 'app' and not ManifestAgent.BASE_NAME_SCANNER.search(spec or ""):
+            confidence *= 0.9
+        language_name = ManifestAgent.LANGUAGE_NAMES[language]
+        dependency_file, dependency_description = ManifestAgent.DEPENDENCY_FILES[language]
+        run_script = 'build_and_run.sh'
+
+        manifest = {
+            'name': ManifestAgent._extract_project_name(spec, base_name),
+            'language': language_name,
+            'implementation_file': files['implementation_file'],
+            'review_file': files['review_file'],
+            'test_file': files['test_file'],
+            'docs_file': files['docs_file'],
+            'interface_file': files['interface_file'],
+            'run_script': run_script,
+            'file-mapping': {
+                files['implementation_file']: f"contains the {language_name} implementation of the application",
+                files['test_file']: f"contains {language_name} unit tests for the implementation",
+                files['docs_file']: "contains markdown documentation",
+                files['interface_file']: f"contains the interface definition, commented if {language_name} has no IDL",
+                run_script: "contains a bash script to install dependencies, build and run the tests",
+                dependency_file: f"contains {dependency_description}",
+            },
+        }
+        return manifest, confidence
+
     @staticmethod
     def process_specification(spec):
         """Process the specification and return file structure as JSON string."""
@@ -109,9 +221,8 @@ class ManifestAgent:
             if not spec or not isinstance(spec, str):
                 raise ValueError("Invalid specification provided")
 
-            language = ManifestAgent.determine_language(spec)
-            file_structure = ManifestAgent.get_file_names(language, spec)
-            return json.dumps(file_structure, indent=2)
+            manifest, _ = ManifestAgent.local_manifest(spec)
+            return json.dumps(manifest, indent=2)
         except Exception as e:
             # Return a default structure on error
             default_structure = {
@@ -0,0 +1,56 @@
+import threading
+from contextlib import contextmanager
+
+
+class AgentRegistry:
+    """
+    The agents of a workflow, each created on first use and then shared.
+    Workflows that never reach a stage never pay for its agent. Stages run
+    on several threads, so creation happens under a lock.
+
+    Agent classes marked `pooled` back many concurrent stages (one per
+    file); those stages `checkout` an agent of their own from a pool
+    that keeps returned agents for the next stage.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self._agents = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, agent_cls):
+        with self._lock:
+            agent = self._agents.get(agent_cls)
+            if agent is None:
+                agent = self._agents[agent_cls] = agent_cls.create(self.llm)
+            return agent
+
+    @contextmanager
+    def checkout(self, agent_cls):
+        """An agent of `agent_cls` for the exclusive use of the block; created if none is idle."""
+        with self._lock:
+            idle = self._idle.setdefault(agent_cls, [])
+            agent = idle.pop() if idle else None
+        if agent is None:
+            agent = agent_cls.create(self.llm)
+        try:
+            yield agent
+        finally:
+            with self._lock:
+                self._idle[agent_cls].append(agent)
+
+    def warm(self, agent_classes):
+        """Creates the agents of `agent_classes` now rather than on first use."""
+        for agent_cls in agent_classes:
+            if getattr(agent_cls, 'pooled', False):
+                with self.checkout(agent_cls):
+                    pass
+            else:
+                self.get(agent_cls)
+
+    def created(self):
+        """Names of the agent classes whose agent exists so far."""
+        with self._lock:
+            return [agent_cls.__name__ for agent_cls in self._agents] + [
+                agent_cls.__name__ for agent_cls in self._idle if agent_cls not in self._agents]
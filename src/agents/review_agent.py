@@ -1,5 +1,8 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 class ReviewAgent:
+    stage = 'review'
+    depends_on = ('code',)
+
     @staticmethod
     def create(llm):
         return Agent(
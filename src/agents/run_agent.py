@@ -1,7 +1,10 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 
 
 class RunAgent:
+    stage = 'run'
+    depends_on = ('idl',)
+
     @staticmethod
     def create(llm):
         return Agent(
@@ -1,7 +1,10 @@
-from crewai import Agent, Task
+from utils.lazy_crewai import Agent, Task
 
 
 class TestAgent:
+    stage = 'test'
+    depends_on = ('code',)
+
     @staticmethod
     def create(llm):
         return Agent(
@@ -39,3 +42,28 @@ class TestAgent:
             - Plain Text, remove Markdown""",
             output_file=output_file
         )
+
+    @staticmethod
+    def create_patch_task(agent, feature_desc, path, changed_code, regions, output_file=None):
+        if output_file is None:
+            output_file = f"patches/{path}.diff"
+
+        return Task(
+            description=f"""A feature was added to the code under test:
+            {feature_desc}
+
+            The new and changed code:
+            {changed_code}
+
+            The existing tests of {path} that exercise it:
+            {regions}
+
+            Update these tests and add tests for the new behaviour, covering
+            error handling and edge cases. Do not touch unrelated tests.""",
+            agent=agent,
+            expected_output=f"""A unified diff against {path} only:
+            - Hunks start with @@ -<line>,<count> +<line>,<count> @@ using the line numbers above
+            - Every hunk has at least two unchanged context lines copied exactly from the excerpts
+            - No explanations before or after the diff""",
+            output_file=output_file
+        )
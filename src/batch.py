@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from utils.custom_logger import get_logger, configure_logging
+from utils.metrics import percentile
+
+
+logger = get_logger(__name__)
+
+
+SPEC_EXTENSIONS = ('.txt', '.md')
+
+
+class BatchJob:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, job_id, spec):
+        self.job_id = job_id
+        self.spec = spec
+        self.status = BatchJob.QUEUED
+        self.submitted_at = None
+        self.finished_at = None
+        self.duration = None
+        self.output_dir = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'duration': self.duration,
+            'output_dir': self.output_dir,
+            'error': self.error,
+        }
+
+
+def load_specs(source):
+    """
+    Yields (job_id, spec) pairs from a directory of spec files or a JSONL file.
+
+    A directory contributes every .txt/.md file, using the file name as the
+    job id. Each JSONL line needs a "spec" (inline text) or "spec_file"
+    (path relative to the JSONL file) and may carry an "id".
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and name.endswith(SPEC_EXTENSIONS):
+                with open(path, 'r') as f:
+                    yield os.path.splitext(name)[0], f.read().strip()
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if 'spec' in entry:
+                spec = entry['spec']
+            elif 'spec_file' in entry:
+                with open(os.path.join(base_dir, entry['spec_file']), 'r') as spec_file:
+                    spec = spec_file.read()
+            else:
+                raise ValueError(
+                    f"{source}:{line_number}: entry needs a 'spec' or 'spec_file'")
+            yield str(entry.get('id', line_number)), spec.strip()
+
+
+def run_job(job_id, spec, stage_concurrency=3, started=None, index=None):
+    """
+    Runs one workflow and returns its output directory. Used by pool
+    workers, which report the job's `index` on the `started` queue first.
+    """
+    from main import ProjectWorkflow, create_llm
+
+    if started is not None:
+        started.put(index)
+
+    workflow = ProjectWorkflow(
+        spec, llm=create_llm(), max_concurrency=stage_concurrency, resume_key=job_id)
+    workflow.execute()
+    return workflow.output_dir
+
+
+class BatchRunner:
+    """
+    Runs many workflows on a bounded worker pool.
+
+    At most `workers` jobs run at once and at most `max_pending` jobs are
+    submitted but unfinished; the spec source is only read further once a
+    slot frees up, so very large batches never sit in memory at once.
+    """
+
+    def __init__(self, workers=4, max_pending=None, use_processes=False,
+                 stage_concurrency=3, status_file=None):
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.use_processes = use_processes
+        self.stage_concurrency = stage_concurrency
+        self.status_file = status_file
+        self.jobs = []
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        # Guards job status changes made by the done callbacks and the start watcher
+        self._state_lock = threading.Lock()
+
+    def _record_status(self, job):
+        logger.info("Job %s: %s", job.job_id, job.status)
+        if not self.status_file:
+            return
+        with self._lock, open(self.status_file, 'a') as f:
+            f.write(json.dumps(job.to_dict()) + "\n")
+
+    def _run_tracked(self, job):
+        job.status = BatchJob.RUNNING
+        self._record_status(job)
+        return run_job(job.job_id, job.spec, self.stage_concurrency)
+
+    def _watch_starts(self, started):
+        """Marks process-pool jobs running as their workers report them; stops at None."""
+        for index in iter(started.get, None):
+            job = self.jobs[index]
+            with self._state_lock:
+                # The report can arrive after a quick job has already finished
+                if job.status != BatchJob.QUEUED:
+                    continue
+                job.status = BatchJob.RUNNING
+            self._record_status(job)
+
+    def _on_done(self, job, future):
+        job.finished_at = time.monotonic()
+        job.duration = job.finished_at - job.submitted_at
+        with self._state_lock:
+            try:
+                job.output_dir = future.result()
+                job.status = BatchJob.SUCCEEDED
+            except Exception as e:
+                job.status = BatchJob.FAILED
+                job.error = str(e)
+        self._record_status(job)
+        self._slots.release()
+
+    def run(self, specs):
+        """Runs every (job_id, spec) pair and returns the aggregate report."""
+        executor_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        started = time.monotonic()
+
+        manager = started_queue = watcher = None
+        if self.use_processes:
+            # Pool workers cannot touch self.jobs; they report starts through a managed queue
+            manager = multiprocessing.Manager()
+            started_queue = manager.Queue()
+            watcher = threading.Thread(target=self._watch_starts, args=(started_queue,),
+                                       name="batch-start-watcher", daemon=True)
+            watcher.start()
+
+        try:
+            with executor_cls(max_workers=self.workers) as executor:
+                for job_id, spec in specs:
+                    # Backpressure: wait for a free slot before reading the next spec
+                    self._slots.acquire()
+                    job = BatchJob(job_id, spec)
+                    self.jobs.append(job)
+                    job.submitted_at = time.monotonic()
+                    self._record_status(job)
+                    if self.use_processes:
+                        future = executor.submit(
+                            run_job, job.job_id, job.spec, self.stage_concurrency,
+                            started_queue, len(self.jobs) - 1)
+                    else:
+                        future = executor.submit(self._run_tracked, job)
+                    future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+        finally:
+            if manager is not None:
+                started_queue.put(None)
+                watcher.join()
+                manager.shutdown()
+
+        return self.report(time.monotonic() - started)
+
+    def report(self, wall_time):
+        durations = [job.duration for job in self.jobs if job.duration is not None]
+        succeeded = [job for job in self.jobs if job.status == BatchJob.SUCCEEDED]
+        failed = [job for job in self.jobs if job.status == BatchJob.FAILED]
+        return {
+            'jobs': len(self.jobs),
+            'succeeded': len(succeeded),
+            'failed': len(failed),
+            'workers': self.workers,
+            'wall_time': wall_time,
+            'throughput_per_minute': len(succeeded) / wall_time * 60 if wall_time else 0.0,
+            'job_latency_p50': percentile(durations, 0.50),
+            'job_latency_p95': percentile(durations, 0.95),
+            'failures': {job.job_id: job.error for job in failed},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate many projects from a directory or JSONL file of specifications.")
+    parser.add_argument('source', help="Directory of spec files or a JSONL file")
+    parser.add_argument('--workers', type=int, default=4,
+                        help="Number of workflows running at once")
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="Submitted but unfinished jobs allowed (default: 2 x workers)")
+    parser.add_argument('--processes', action='store_true',
+                        help="Use a process pool instead of a thread pool")
+    parser.add_argument('--stage-concurrency', type=int, default=3,
+                        help="Concurrent stages inside each workflow")
+    parser.add_argument('--status-file', default='batch_status.jsonl',
+                        help="JSONL file receiving per-job status updates")
+    parser.add_argument('--report', default='batch_report.json',
+                        help="File receiving the aggregate report")
+    parser.add_argument('--log-json', default=None,
+                        help="Also append structured JSON-lines logs from every worker to this file")
+    args = parser.parse_args(argv)
+
+    if args.log_json:
+        # Spawned worker processes pick the sink up from the environment
+        os.environ["LOG_JSON"] = args.log_json
+        configure_logging(json_path=args.log_json)
+
+    runner = BatchRunner(
+        workers=args.workers,
+        max_pending=args.max_pending,
+        use_processes=args.processes,
+        stage_concurrency=args.stage_concurrency,
+        status_file=args.status_file,
+    )
+    report = runner.run(load_specs(args.source))
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info("Batch finished: %d/%d succeeded in %.1fs (%.2f projects/min)",
+                report['succeeded'], report['jobs'], report['wall_time'],
+                report['throughput_per_minute'])
+    return 0 if not report['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark of JSON extraction from multi-megabyte LLM responses.
+
+Compares the streaming extractor (whole text and fed in chunks) with the
+regex-over-fences approach it replaced, on a JSON-heavy response and on a
+brace-dense code response with one small JSON object at the end (the
+extractor's worst case: every code block is a candidate it has to reject).
+
+    cd src
+    python -m benchmarks.bench_extract_json --size-mb 4 --repeat 5
+"""
+import re
+import sys
+import json
+import time
+import argparse
+
+from utils.json_stream import JSONStreamExtractor, extract_json_objects
+
+
+def regex_extract_json(text):
+    """The previous implementation, kept here as the comparison point."""
+    matches = re.findall(r"\`\`\`json(.*?)\`\`\`", text, re.DOTALL)
+    return [json.loads(match.strip()) for match in matches]
+
+
+def build_response(size_mb, objects=3, nested_fences=False):
+    """Prose followed by fenced JSON objects, about `size_mb` megabytes in total."""
+    fence = " and fences ```" if nested_fences else ""
+    description = f"contains code with braces {{}}{fence} #"
+    entry_size = len(json.dumps({"src/module_00000.py": description + "00000"}))
+    entry_count = max(1, int(size_mb * 1024 * 1024) // (objects * entry_size))
+    parts = ["Here is the manifest you asked for. It uses {placeholders} in prose.\n"]
+    for index in range(objects):
+        payload = {
+            'name': f"object {index}",
+            'files': {
+                f"src/module_{i:05d}.py": f"{description}{i:05d}"
+                for i in range(entry_count)
+            },
+        }
+        parts.append(f"```json\n{json.dumps(payload)}\n```\nSome commentary in between.\n")
+    return "".join(parts)
+
+
+CODE_LINE = "function f{i}(a) {{ if (a) {{ return {{x: a, y: [{i}]}}; }} g({{k: a}}); }}\n"
+
+
+def build_code_response(size_mb):
+    """Generated JavaScript of about `size_mb` megabytes, then a fenced JSON object."""
+    lines = []
+    size = 0
+    index = 0
+    while size < size_mb * 1024 * 1024:
+        lines.append(CODE_LINE.format(i=index))
+        size += len(lines[-1])
+        index += 1
+    lines.append('```json\n{"status": "ok"}\n```\n')
+    return "".join(lines)
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--objects', type=int, default=3)
+    parser.add_argument('--chunk-kb', type=int, default=64,
+                        help="Chunk size for the streamed variant")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--nested-fences', action='store_true',
+                        help="Put ``` inside JSON strings (the regex extractor fails on these)")
+    args = parser.parse_args(argv)
+
+    chunk_size = args.chunk_kb * 1024
+    responses = [
+        (f"JSON-heavy, {args.objects} objects",
+         build_response(args.size_mb, args.objects, args.nested_fences)),
+        ("code-heavy, 1 object", build_code_response(args.size_mb)),
+    ]
+    print(f"Best of {args.repeat}")
+    for title, text in responses:
+        megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+
+        def streamed(text=text):
+            extractor = JSONStreamExtractor()
+            for start in range(0, len(text), chunk_size):
+                extractor.feed(text[start:start + chunk_size])
+            return extractor.close()
+
+        cases = [
+            ('regex (previous)', lambda text=text: regex_extract_json(text)),
+            ('stream, whole text', lambda text=text: extract_json_objects(text)),
+            (f"stream, {args.chunk_kb}KB chunks", streamed),
+            ('stream, first object', lambda text=text: extract_json_objects(text, limit=1)),
+        ]
+
+        print(f"\n{title}: {megabytes:.2f} MB")
+        for label, func in cases:
+            try:
+                seconds, result = timed(func, args.repeat)
+            except ValueError as e:
+                print(f"{label:<24} failed: {e}")
+                continue
+            print(f"{label:<24} {seconds * 1000:9.1f}ms {megabytes / seconds:9.1f} MB/s  "
+                  f"objects={len(result)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Start-up benchmark of the workflow.
+
+Every sample runs in a fresh interpreter, as a CLI invocation or a batch
+worker does, and measures the time to import `main` and the time from
+interpreter start to the first LLM call of a workflow (made to a FakeLLM,
+which ends the process).
+
+    cd src
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --save-baseline main
+    python -m benchmarks.bench_startup --compare main
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.bench_workflow import BASELINE_DIR, BENCHMARK_SPEC, summarize
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Prefix of the probe's report line, which may be interleaved with workflow logging
+REPORT_MARKER = 'STARTUP-REPORT '
+# Modules that should only be loaded once an LLM is actually used
+HEAVY_MODULES = ('crewai', 'litellm', 'openai', 'httpx', 'dotenv')
+
+IMPORT_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import main
+print(%(marker)r + json.dumps({
+    'import_seconds': time.perf_counter() - started,
+    'modules': len(sys.modules),
+    'heavy_modules': [name for name in %(heavy)r if name in sys.modules],
+}))
+"""
+
+FIRST_CALL_PROBE = """
+import os, sys, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from benchmarks.fake_llm import FakeLLM
+
+class FirstCallProbe(FakeLLM):
+    def call(self, *args, **kwargs):
+        print(%(marker)r + json.dumps({
+            'import_seconds': imported - started,
+            'first_call_seconds': time.perf_counter() - started,
+            'agents_created': workflow.agents.created(),
+        }), flush=True)
+        os._exit(0)
+
+# The manifest agent is asked, so the first call is the workflow's first stage
+workflow = main.ProjectWorkflow(
+    %(spec)r, llm=FirstCallProbe(), llm_cache=False, review_cache=False,
+    manifest_confidence=2)
+workflow.execute()
+"""
+
+
+def run_probe(script, workdir):
+    """Runs a probe script in a fresh interpreter; returns its report and the process wall time."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [SRC_DIR, os.environ.get('PYTHONPATH')])))
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', script], cwd=workdir, env=env,
+        capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    for line in completed.stdout.splitlines():
+        if line.startswith(REPORT_MARKER):
+            return json.loads(line[len(REPORT_MARKER):]), elapsed
+    raise RuntimeError(f"Probe printed no report:\n{completed.stdout}\n{completed.stderr}")
+
+
+def run_benchmark(runs=5):
+    interpreter, imports, import_processes, first_calls = [], [], [], []
+    import_report = first_call_report = None
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as workdir:
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'pass'], check=True)
+            interpreter.append(time.perf_counter() - started)
+
+            import_report, elapsed = run_probe(
+                IMPORT_PROBE % {'heavy': HEAVY_MODULES, 'marker': REPORT_MARKER}, workdir)
+            imports.append(import_report['import_seconds'])
+            import_processes.append(elapsed)
+
+            first_call_report, _ = run_probe(
+                FIRST_CALL_PROBE % {'spec': BENCHMARK_SPEC, 'marker': REPORT_MARKER}, workdir)
+            first_calls.append(first_call_report['first_call_seconds'])
+
+    return {
+        'config': {'runs': runs},
+        'interpreter': summarize(interpreter),
+        'import_main': summarize(imports),
+        'import_process': summarize(import_processes),
+        'first_llm_call': summarize(first_calls),
+        'modules_after_import': import_report['modules'],
+        'heavy_modules_after_import': import_report['heavy_modules'],
+        'agents_at_first_call': first_call_report['agents_created'],
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions of p50/p95 start-up times against a baseline."""
+    regressions = []
+    for label in ('import_main', 'first_llm_call'):
+        for key in ('p50', 'p95'):
+            now = report[label].get(key)
+            before = baseline.get(label, {}).get(key)
+            if now is None or before is None:
+                continue
+            if now > before * (1 + tolerance) and now - before > 0.005:
+                regressions.append(f"{label} {key}: {before * 1000:.1f}ms -> {now * 1000:.1f}ms")
+    newly_heavy = set(report['heavy_modules_after_import']) - set(
+        baseline.get('heavy_modules_after_import', []))
+    if newly_heavy:
+        regressions.append(f"import main now loads {', '.join(sorted(newly_heavy))}")
+    return regressions
+
+
+def print_report(report):
+    print(f"Start-up over {report['config']['runs']} fresh interpreters")
+    for label in ('interpreter', 'import_main', 'import_process', 'first_llm_call'):
+        stats = report[label]
+        print(f"{label:<15} p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms")
+    print(f"Modules after import: {report['modules_after_import']}, heavy: "
+          f"{', '.join(report['heavy_modules_after_import']) or 'none'}")
+    print(f"Agents created by the first LLM call: {', '.join(report['agents_at_first_call'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help="Save the report as benchmarks/baselines/startup-NAME.json")
+    parser.add_argument('--compare', metavar='NAME',
+                        help="Compare against benchmarks/baselines/startup-NAME.json")
+    parser.add_argument('--tolerance', type=float, default=0.20,
+                        help="Allowed relative slowdown before reporting a regression")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(runs=args.runs)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"startup-{args.save_baseline}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"startup-{args.compare}.json"), 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against baseline '{args.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Offline benchmark of the orchestration layer.
+
+Drives ProjectWorkflow.execute and add_feature end to end against a
+deterministic FakeLLM, so differences between runs come from the workflow,
+FileHandler and parsing code rather than from the provider.
+
+    cd src
+    python -m benchmarks.bench_workflow --iterations 20 --latency uniform:0.01:0.05
+    python -m benchmarks.bench_workflow --save-baseline main
+    python -m benchmarks.bench_workflow --compare main
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+from benchmarks.fake_llm import FakeLLM
+from main import ProjectWorkflow
+from utils.metrics import percentile
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+BENCHMARK_SPEC = """Develop a command-line calculator application in Python.
+The application must support addition, subtraction, multiplication and division.
+The application should keep a history of the last 5 calculations."""
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'mean': sum(values) / len(values) if values else None,
+    }
+
+
+def run_benchmark(iterations=10, latency='constant:0.01', output_lines=40,
+                  stage_concurrency=3, seed=0):
+    """Runs the workflow `iterations` times in a scratch directory and returns the report."""
+    execute_times, feature_times = [], []
+    stage_times, stage_overheads = {}, {}
+    original_dir = os.getcwd()
+
+    with tempfile.TemporaryDirectory(prefix='bench_workflow_') as workdir:
+        os.chdir(workdir)
+        try:
+            started = time.perf_counter()
+            for iteration in range(iterations):
+                llm = FakeLLM(latency=latency, output_lines=output_lines, seed=seed)
+                workflow = ProjectWorkflow(
+                    f"{BENCHMARK_SPEC}\nVariant {iteration}", llm=llm,
+                    max_concurrency=stage_concurrency, llm_cache=False,
+                    review_cache=False)
+
+                def current_stage(workflow=workflow):
+                    stage = workflow.metrics.current()
+                    return stage.name if stage else None
+                llm.stage_lookup = current_stage
+
+                run_started = time.perf_counter()
+                workflow.execute()
+                execute_times.append(time.perf_counter() - run_started)
+
+                for name, stage in workflow.metrics.stages.items():
+                    stage_times.setdefault(name, []).append(stage.wall_time)
+                    stage_overheads.setdefault(name, []).append(
+                        stage.wall_time - llm.simulated.get(name, 0.0))
+
+                feature_started = time.perf_counter()
+                workflow.add_feature("Add a command that clears the calculation history")
+                feature_times.append(time.perf_counter() - feature_started)
+            total = time.perf_counter() - started
+        finally:
+            os.chdir(original_dir)
+
+    return {
+        'config': {
+            'iterations': iterations,
+            'latency': latency,
+            'output_lines': output_lines,
+            'stage_concurrency': stage_concurrency,
+            'seed': seed,
+        },
+        'total_time': total,
+        'throughput_per_minute': iterations / total * 60 if total else 0.0,
+        'execute': summarize(execute_times),
+        'add_feature': summarize(feature_times),
+        'stages': {
+            name: {
+                'latency': summarize(stage_times[name]),
+                'overhead': summarize(stage_overheads[name]),
+            }
+            for name in stage_times
+        },
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Returns a list of regressions of p50/p95 latencies against a baseline."""
+    regressions = []
+
+    def check(label, current, previous):
+        for key in ('p50', 'p95'):
+            now, before = current.get(key), previous.get(key)
+            if now is None or before is None:
+                continue
+            # Ignore sub-millisecond noise on near-zero timings
+            if now > before * (1 + tolerance) and now - before > 0.001:
+                regressions.append(
+                    f"{label} {key}: {before * 1000:.1f}ms -> {now * 1000:.1f}ms")
+
+    check('execute', report['execute'], baseline.get('execute', {}))
+    check('add_feature', report['add_feature'], baseline.get('add_feature', {}))
+    for name, stage in report['stages'].items():
+        previous = baseline.get('stages', {}).get(name)
+        if previous:
+            check(f"stage {name} overhead", stage['overhead'], previous['overhead'])
+    return regressions
+
+
+def print_report(report):
+    print(f"Throughput: {report['throughput_per_minute']:.1f} workflows/min "
+          f"({report['config']['iterations']} iterations, latency {report['config']['latency']})")
+    for label in ('execute', 'add_feature'):
+        stats = report[label]
+        print(f"{label:<12} p50 {stats['p50'] * 1000:8.1f}ms  p95 {stats['p95'] * 1000:8.1f}ms")
+    print(f"{'stage':<10} {'p50':>10} {'p95':>10} {'overhead p50':>14} {'overhead p95':>14}")
+    for name, stage in report['stages'].items():
+        print(f"{name:<10} {stage['latency']['p50'] * 1000:8.1f}ms {stage['latency']['p95'] * 1000:8.1f}ms "
+              f"{stage['overhead']['p50'] * 1000:12.1f}ms {stage['overhead']['p95'] * 1000:12.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--latency', default='constant:0.01',
+                        help="constant:S, uniform:LOW:HIGH or lognormal:MU:SIGMA (seconds)")
+    parser.add_argument('--output-lines', type=int, default=40,
+                        help="Lines in every fake LLM response")
+    parser.add_argument('--stage-concurrency', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help="Save the report as benchmarks/baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME',
+                        help="Compare against benchmarks/baselines/NAME.json")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed relative slowdown before reporting a regression")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        iterations=args.iterations,
+        latency=args.latency,
+        output_lines=args.output_lines,
+        stage_concurrency=args.stage_concurrency,
+        seed=args.seed,
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against baseline '{args.compare}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
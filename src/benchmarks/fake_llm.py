@@ -0,0 +1,133 @@
+import json
+import time
+import random
+import hashlib
+import threading
+
+from crewai import BaseLLM
+
+from utils.streaming import open_sink
+
+
+class LatencyDistribution:
+    """
+    Simulated LLM latency, parsed from specs such as `constant:0.05`,
+    `uniform:0.02:0.2` or `lognormal:-2.5:0.6` (seconds).
+    """
+
+    def __init__(self, spec='constant:0'):
+        kind, *params = spec.split(':')
+        params = [float(p) for p in params]
+        if kind == 'constant' and len(params) == 1:
+            self._sample = lambda rng: params[0]
+        elif kind == 'uniform' and len(params) == 2:
+            self._sample = lambda rng: rng.uniform(params[0], params[1])
+        elif kind == 'lognormal' and len(params) == 2:
+            self._sample = lambda rng: rng.lognormvariate(params[0], params[1])
+        else:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+        self.spec = spec
+
+    def sample(self, rng):
+        return max(0.0, self._sample(rng))
+
+
+class FakeLLM(BaseLLM):
+    """
+    Deterministic stand-in for the Gemini LLM used by the agents.
+
+    Responses depend only on the prompt and the seed, so repeated runs do
+    identical work. Each response is shaped like the output of the agent
+    that asked for it (manifest JSON, IDL, code, tests, docs, run script,
+    review verdict or a feature diff) and has `output_lines` lines. The simulated latency of
+    every call is added to `simulated` under the name returned by
+    `stage_lookup`, so benchmarks can subtract it from measured stage time.
+    Responses are fed to the workflow's stream sink in `chunk_size`
+    character chunks, like a streamed completion.
+    """
+
+    def __init__(self, latency='constant:0', output_lines=40, seed=0, stage_lookup=None,
+                 chunk_size=64):
+        super().__init__(model='fake/deterministic', temperature=0)
+        self.latency = LatencyDistribution(latency)
+        self.output_lines = output_lines
+        self.seed = seed
+        self.stage_lookup = stage_lookup
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.simulated = {}
+        self._lock = threading.Lock()
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, **kwargs):
+        if isinstance(messages, str):
+            prompt = messages
+        else:
+            prompt = "\n".join(str(m.get('content', '')) for m in messages)
+
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).hexdigest()
+        rng = random.Random(digest)
+        latency = self.latency.sample(rng)
+        time.sleep(latency)
+
+        stage = self.stage_lookup() if self.stage_lookup else None
+        with self._lock:
+            self.calls += 1
+            key = stage or 'unattributed'
+            self.simulated[key] = self.simulated.get(key, 0.0) + latency
+
+        response = f"Thought: I now know the final answer\nFinal Answer: {self._render(prompt, rng)}"
+        sink = open_sink()
+        try:
+            for start in range(0, len(response), self.chunk_size):
+                if sink.feed(response[start:start + self.chunk_size]):
+                    break
+        finally:
+            sink.close()
+        return sink.result()
+
+    def _render(self, prompt, rng):
+        lines = self.output_lines
+        if 'A unified diff against' in prompt:
+            name = f"feature_{rng.randrange(10 ** 6)}"
+            return (f"@@ -0,0 +1,3 @@\n+def {name}(value):\n+    return value\n+\n")
+        if 'Project Architect' in prompt:
+            manifest = {
+                'name': 'Benchmark Project',
+                'language': 'Python',
+                'implementation_file': 'src/app.py',
+                'test_file': 'tests/test_app.py',
+                'docs_file': 'docs/README.md',
+                'interface_file': 'src/app.idl',
+                'run_script': 'build_and_run.sh',
+                'file-mapping': {'src/app.py': 'contains python'},
+            }
+            return f"```json\n{json.dumps(manifest, indent=2)}\n```"
+        if 'Senior Code Reviewer' in prompt:
+            return "Approved"
+        if 'IDL Specification Expert' in prompt:
+            body = [f"    int field_{i};" for i in range(lines)]
+            return ("struct Record {\n" + "\n".join(body) + "\n};\n"
+                    "interface Service {\n    Record get(in long id);\n};\n"
+                    "typedef long RecordId;\n"
+                    "exception NotFound {\n    string message;\n};")
+        if 'Create a script' in prompt:
+            return "#!/bin/bash\nset -e\n" + "\n".join(
+                f"echo step {i}" for i in range(lines))
+        if 'Testing Specialist' in prompt:
+            return "import unittest\n\n" + "\n".join(
+                f"def test_case_{i}():\n    assert {i} == {i}" for i in range(lines))
+        if 'Technical Writer' in prompt:
+            return "# Documentation\n\n" + "\n".join(
+                f"- Item {i}: {rng.random():.6f}" for i in range(lines))
+        return "\n".join(
+            f"def function_{i}(value):\n    return value + {i}" for i in range(lines))
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return False
+
+    def get_context_window_size(self):
+        return 1_000_000
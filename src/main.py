@@ -1,101 +1,270 @@
 import os
 import sys
 import json
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
 
-from crewai import  Crew, LLM
-from httpx import HTTPStatusError
-from openai import RateLimitError
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+from tenacity import retry, stop_after_attempt
 
 
-from agents import CodeAgent,  DocsAgent, ManifestAgent, IDLAgent, ReviewAgent, RunAgent, TestAgent
+from agents import (AgentRegistry, CodeAgent, DocsAgent, FileAgent, ManifestAgent, IDLAgent,
+                    ReviewAgent, RunAgent, TestAgent)
 from tools.file_hanler import ProjectValidator, FileHandler
+from tools.patch import PatchError, apply_unified_diff
+from tools.validation import ArtifactValidator
 from utils.custom_logger import get_logger
-from utils.utils import extract_json, extract_json_to_str
+from utils.checkpoint import CheckpointStore
+from utils.context_compactor import ContextCompactor, estimate_tokens
+from utils.fingerprint import BuildFingerprints
+from utils.llm_cache import LLMCache, CachedOutput
+from utils.review_cache import ReviewCache, review_verdict
+from utils.metrics import MetricsRecorder
+from utils.rate_limiter import get_rate_limiter, wait_for_rate_limit
+from utils.scheduler import StageScheduler
+from utils.lazy_crewai import Crew, LLM
+from utils.streaming import stop_condition_for, stream_to
+from utils.tracing import Tracer
+from utils import symbols
+from utils.utils import extract_json
 
 
-from dotenv import load_dotenv
+logger = get_logger(__name__)
 
-load_dotenv()
 
 
-logger = get_logger(__name__)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 
+# Agents whose stages make up the generation graph. Each agent class declares
+# its `stage` name and the stages it `depends_on`.
+GENERATION_AGENTS = (IDLAgent, CodeAgent, RunAgent, TestAgent, DocsAgent)
+# Every agent a workflow's AgentRegistry creates ahead of time when warmed
+WORKFLOW_AGENTS = (ManifestAgent, ReviewAgent, FileAgent) + GENERATION_AGENTS
+STAGE_AGENT_CLASSES = {agent_cls.stage: agent_cls for agent_cls in GENERATION_AGENTS}
+# Run metadata that a feature run does not carry over from the project it patches
+FEATURE_EXCLUDED_FILES = ('generation_summary.txt', 'metrics.json', 'metrics.prom',
+                          'validation_report.json', 'build_report.json',
+                          BuildFingerprints.FILE_NAME, 'patches')
+# Test functions or documentation sections sent along with a feature patch
+MAX_PATCH_REGIONS = 6
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+@lru_cache(maxsize=None)
+def load_environment():
+    """Loads `.env` into the environment once, on first use rather than at import."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _before_retry_sleep(retry_state):
+    """Counts the retry and traces the backoff tenacity is about to sleep through."""
+    workflow = retry_state.args[0]
+    workflow.metrics.record_retry()
+    now = time.monotonic()
+    workflow.tracer.add_span(
+        'retry_backoff', now, now + retry_state.next_action.sleep, category='llm',
+        attempt=retry_state.attempt_number,
+        error=type(retry_state.outcome.exception()).__name__)
 
 
 class ProjectWorkflow:
-    def __init__(self, project_spec, llm):
+    def __init__(self, project_spec, llm, max_concurrency=3, llm_cache=None,
+                 incremental=False, manifest_confidence=0.75, trace_dir=None,
+                 max_regenerations=2, review_cache=None, prompt_budget=None, agents=None,
+                 resume_key=None, project_name=None):
+        load_environment()
         self.project_spec = project_spec
+        self.llm = llm
+        # Minimum confidence for the local manifest; set above 1 to always ask the agent
+        self.manifest_confidence = manifest_confidence
+        self.max_concurrency = max_concurrency
+        self.model = getattr(llm, 'model', None)
+        self.incremental = incremental
+        self.fingerprints = None
+        self.metrics = MetricsRecorder()
+        # Chrome trace files of every run are written here when set (TRACE_DIR)
+        self.trace_dir = trace_dir if trace_dir is not None else os.environ.get("TRACE_DIR")
+        self.tracer = Tracer()
+        # Pass llm_cache=False to always call the LLM
+        if llm_cache is None:
+            llm_cache = LLMCache(os.environ.get("LLM_CACHE_PATH", LLMCache.DEFAULT_PATH))
+        self.llm_cache = llm_cache
+        # Verdicts for code already reviewed up to whitespace and comments; False disables
+        if review_cache is None:
+            review_cache = ReviewCache(
+                os.environ.get("REVIEW_CACHE_PATH", ReviewCache.DEFAULT_PATH))
+        self.review_cache = review_cache
+        self.output_dir = None
+        self.run_id = None
+        self.staging_dir = None
+        # Scopes the checkpoints to a job (batch, service or queue job id), so
+        # concurrent jobs with the same spec never resume each other's stages
+        self.resume_key = resume_key
+        self.checkpoints = CheckpointStore(
+            CheckpointStore.key_for(project_spec, self.model, resume_key))
+        self.private_checkpoints = False
+        # Fixed name of the published project directory instead of a timestamped one
+        self.project_name = project_name
         self.validator = ProjectValidator()
+        self.artifact_validator = ArtifactValidator()
+        # Fresh LLM attempts for a stage whose output fails static validation
+        self.max_regenerations = max_regenerations
+        self.validation = {}
+        # Upstream code in test, docs and file prompts is compacted to fit this many tokens
+        if prompt_budget is None:
+            prompt_budget = int(os.environ.get("PROMPT_TOKEN_BUDGET", 8000))
+        self.prompt_budget = prompt_budget
+        self.context_compactor = ContextCompactor(prompt_budget)
+        # Extra files of the manifest's file-mapping, by stage name
+        self.file_specs = {}
+        self.stage_paths = {}
         self.file_handler = FileHandler()
+        # Agents are created when a stage first needs them; a long-running
+        # service passes one registry per worker so they outlive the workflow
+        self.agents = agents if agents is not None else AgentRegistry(llm)
+
 
-        # Initialize agents
-        logger.info("Initializing agents...")
-        self.manifest_agent = ManifestAgent.create(llm)
-        self.idl_agent = IDLAgent.create(llm)
-        self.code_agent = CodeAgent.create(llm)
-        self.run_agent = RunAgent.create(llm)
-        self.test_agent = TestAgent.create(llm)
-        self.docs_agent = DocsAgent.create(llm)
-        self.review_agent = ReviewAgent.create(llm)
-        logger.info("Agents initialized successfully")
-        
-        
-        
-
-    @retry(wait=wait_random_exponential(multiplier=1, max=60), stop=stop_after_attempt(5))
     def execute_with_retry(self, crew):
-        """Executes the crew tasks with retry logic."""
-        try:
-            # Ensure the input is a Crew object before calling kickoff
-            if not isinstance(crew, Crew):
-                raise TypeError("execute_with_retry expects a Crew object")
-            return crew.kickoff()
-        except (RateLimitError, HTTPStatusError) as e:
-            logger.warning(
-                f"Rate limit or HTTP error encountered: {e}. Retrying...")
-            raise  # Re-raise to trigger retry
-        except Exception as e:
-            # Catch other potential errors during kickoff and log them
-            logger.error(
-                f"An error occurred during crew kickoff: {e}", exc_info=True)
-            raise  # Re-raise to allow tenacity to handle retries if configured
+        """
+        Executes the crew tasks with retry logic. Single-task crews are
+        served from the LLM response cache when the same agent has already
+        answered the same prompt.
+        """
+        # Ensure the input is a Crew object before calling kickoff; utils.lazy_crewai.Crew
+        # only builds one, the class comes from crewai itself (loaded by then)
+        from crewai import Crew
+        if not isinstance(crew, Crew):
+            raise TypeError("execute_with_retry expects a Crew object")
+
+        if not self.llm_cache or len(crew.tasks) != 1:
+            return self._kickoff_with_retry(crew)
+
+        task = crew.tasks[0]
+        with self.tracer.span('llm_cache_lookup', category='cache', agent=task.agent.role) as span:
+            key = LLMCache.make_key(task.agent, LLMCache.task_prompt(task))
+            cached = self.llm_cache.get(key)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            logger.info("LLM cache hit for '%s'", task.agent.role)
+            self.metrics.record_cache_hit()
+            if task.output_file:
+                self._write_output(task.output_file, cached)
+            return CachedOutput(cached)
+
+        result = self._kickoff_with_retry(crew)
+        self.llm_cache.set(key, result.raw)
+        return result
+
+    @staticmethod
+    def _estimate_tokens(crew):
+        """Rough prompt size of a crew (about four characters per token)."""
+        return sum(estimate_tokens(LLMCache.task_prompt(task)) for task in crew.tasks)
+
+    @retry(wait=wait_for_rate_limit, stop=stop_after_attempt(5),
+           before_sleep=_before_retry_sleep)
+    def _kickoff_with_retry(self, crew):
+        """
+        Kicks off the crew, retrying on rate limits and HTTP errors. Every
+        attempt first waits for the process-wide rate limiter.
+        """
+        # crewai has loaded these by now; importing them up front slows start-up
+        from httpx import HTTPStatusError
+        from openai import RateLimitError
+
+        limiter = get_rate_limiter()
+        estimated_tokens = self._estimate_tokens(crew)
+        with self.tracer.span('llm_call', category='llm', estimated_tokens=estimated_tokens,
+                              agents=[agent.role for agent in crew.agents]) as span:
+            with self.tracer.span('rate_limit_wait', category='llm'):
+                limiter.acquire(estimated_tokens)
+            output_file = crew.tasks[0].output_file if len(crew.tasks) == 1 else None
+            try:
+                # A streaming LLM writes the answer into the task's output file as it arrives
+                with stream_to(output_file, stop_condition_for(output_file),
+                               on_first_token=self.metrics.record_first_token) as streams:
+                    result = crew.kickoff()
+                early_stops = sum(stream.stopped_early for stream in streams)
+                for _ in range(early_stops):
+                    self.metrics.record_early_stop()
+                if streams:
+                    span.set(time_to_first_token=streams[0].time_to_first_token,
+                             early_stops=early_stops)
+                usage = getattr(result, 'token_usage', None)
+                self.metrics.record_usage(usage)
+                limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+                limiter.on_success()
+                span.set(
+                    prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                    completion_tokens=getattr(usage, 'completion_tokens', None),
+                    output_bytes=len((result.raw or '').encode('utf-8')))
+                return result
+            except (RateLimitError, HTTPStatusError) as e:
+                logger.warning("Rate limit or HTTP error encountered: %s. Retrying...", e)
+                raise  # Re-raise to trigger retry
+            except Exception as e:
+                # Catch other potential errors during kickoff and log them
+                logger.error("An error occurred during crew kickoff: %s", e, exc_info=True)
+                raise  # Re-raise to allow tenacity to handle retries if configured
 
     def execute(self):
         """
         Executes the complete project generation workflow.
         """
+        with self._traced_run('workflow'):
+            return self._execute_workflow()
+
+    @contextmanager
+    def _traced_run(self, name):
+        """Traces one run and exports it to `trace_dir/<run id>.json` when tracing is enabled."""
+        self.tracer = Tracer()
+        self.file_handler.tracer = self.tracer
+        try:
+            with self.tracer.span(name, model=self.model) as span:
+                try:
+                    yield span
+                finally:
+                    span.set(run_id=self.run_id)
+        finally:
+            self.checkpoints.release()
+            if self.trace_dir:
+                name = self.run_id or self.tracer.trace_id
+                path = self.tracer.write(os.path.join(self.trace_dir, f"{name}.json"))
+                logger.info("Trace written to %s", path)
+
+    @contextmanager
+    def _stage(self, name):
+        """Times a stage in the metrics and as a trace span carrying its metrics."""
+        with self.tracer.span(name, category='stage') as span:
+            stage_metrics = None
+            try:
+                with self.metrics.stage(name) as stage_metrics:
+                    yield stage_metrics
+            finally:
+                if stage_metrics is not None:
+                    span.set(**stage_metrics.to_dict())
+
+    def _execute_workflow(self):
         try:
             logger.info("Starting project generation workflow")
-            logger.info(f"Processing specification:\n{self.project_spec}")
+            logger.debug("Processing specification:\n%s", self.project_spec)
 
             # Validate initial specification
             logger.info("Validating project specification")
             self.validator.validate_specification(self.project_spec)
             logger.info("Project specification validated")
 
-            # Create and execute manifest task first
-            logger.info("Creating manifest task")
-            manifest_task = ManifestAgent.create_task(
-                self.manifest_agent, self.project_spec)
-
-            # Create a Crew for the manifest task
-            manifest_crew = Crew(
-                agents=[self.manifest_agent],
-                tasks=[manifest_task],
-                verbose=False
-            )
+            self.fingerprints = BuildFingerprints(
+                self.file_handler.base_output_dir, incremental=self.incremental)
+            self.metrics = MetricsRecorder()
+            self.validation = {}
+            self._start_run()
 
-            logger.info("Executing manifest crew")
-            # Pass the Crew object to execute_with_retry
-            manifest_result = self.execute_with_retry(manifest_crew)
-            logger.debug(f"manifest_result {type(manifest_result)}")
-            manifest_result = extract_json(manifest_result.raw)
-            logger.debug(f"manifest_result {type(manifest_result)}")
+            # Create and execute manifest task first
+            manifest_raw = self._run_manifest_stage()
+            manifest_result = extract_json(manifest_raw)
+            logger.debug("manifest_result %s", type(manifest_result))
 
             logger.info("Manifest crew executed")
 
@@ -105,18 +274,17 @@ class ProjectWorkflow:
                 # We expect the manifest task to be the only one here.
                 manifest_output = manifest_result[0] if isinstance(
                     manifest_result, list) and manifest_result else manifest_result
-                print(
-                    f"---------------->manifest {manifest_output} <----------------")
+                logger.debug("Manifest output: %s", manifest_output)
                 if not manifest_output:
                     raise ValueError("Manifest task returned no output")
 
                 # Ensure the output is treated as a string before json.loads
                 manifest_output = json.dumps(manifest_output)
                 manifest_data = json.loads(manifest_output)
-                logger.info(f"Manifest data: {manifest_data}")
+                logger.info("Manifest data: %s", manifest_data)
 
             except (json.JSONDecodeError, ValueError) as e:
-                logger.error(f"Error parsing manifest output: {str(e)}")
+                logger.error("Error parsing manifest output: %s", e)
                 # Provide a robust default manifest data structure
                 manifest_data = {
                     "implementation_file": "src/app.py",
@@ -125,7 +293,7 @@ class ProjectWorkflow:
                     "interface_file": "src/app.idl",
                     "run_script": "build_and_run.sh",
                 }
-                logger.info(f"Using default manifest data: {manifest_data}")
+                logger.info("Using default manifest data: %s", manifest_data)
 
             # Extract file paths from manifest
             implementation_file = manifest_data.get(
@@ -138,97 +306,42 @@ class ProjectWorkflow:
             run_script_file = manifest_data.get(
                 'run_script', 'build_and_run.sh')
 
-            relative_project_directory = "./src"
-            
-        
-            # These paths are expected to be relative to the generated project root,
-            # but they are being prefixed with ./src, which might lead to paths like ./src/src/app.py
-            # Let's adjust this to keep the paths as intended by the manifest agent.
-            # The file_handler.save_project_files will handle placing them correctly
-            # within the timestamped directory under generated_projects.
+            # These paths are relative to the generated project root. Tasks write
+            # them into this run's staging directory, which
+            # file_handler.save_project_files moves into the timestamped
+            # directory under generated_projects.
 
             # Create required directories based on the raw manifest paths
-            os.makedirs(os.path.dirname(os.path.join(
-                './src', implementation_file)), exist_ok=True)
-            os.makedirs(os.path.dirname(os.path.join(
-                './src', test_file)), exist_ok=True)
-            os.makedirs(os.path.dirname(os.path.join(
-                './src', docs_file)), exist_ok=True)
-            os.makedirs(os.path.dirname(os.path.join(
-                './src', interface_file)), exist_ok=True)
-            os.makedirs(os.path.dirname(os.path.join(
-                './src', run_script_file)), exist_ok=True)
-
-            logger.info(f"--------------------------------------------")
-            logger.info(f"Implementation file: {implementation_file}")
-            logger.info(f"Test file: {test_file}")
-            logger.info(f"Docs file: {docs_file}")
-            logger.info(f"Interface file: {interface_file}")
-            logger.info(f"Run script file: {run_script_file}")
-
-            # IDL Task
-            idl_task = IDLAgent.create_task(
-                self.idl_agent,
-                self.project_spec,
-                # Save to temporary ./src directory
-                output_file=os.path.join('./src', interface_file)
-            )
-            
-            
-            logger.info("IDL task created")
-
-            # Code Task
-            code_task = CodeAgent.create_task(
-                self.code_agent,
-                self.project_spec,
-                # Access the output of the task object, not a potential list result
-                extract_json_to_str(idl_task.row) if hasattr( idl_task, "raw") else "",
-                # Save to temporary ./src directory
-                output_file=os.path.join('./src', implementation_file)
-            )
-            logger.info("Code task created")
-
-            # Run Task
-            run_task = RunAgent.create_task(
-                self.run_agent,
-                self.project_spec,
-                # Access the output of the task object
-                idl_task.raw if hasattr(idl_task, 'raw') else "",
-                # Save to temporary ./src directory
-                output_file=os.path.join('./src', run_script_file)
-            )
-            logger.info("run task created")
-
-            # Test Task
-            test_task = TestAgent.create_task(
-                self.test_agent,
-                # Access the output of the task object
-                code_task.raw if hasattr(code_task, 'raw') else "",
-                # Save to temporary ./src directory
-                output_file=os.path.join('./src', test_file)
-            )
-            logger.info("Test task created")
-
-            # Documentation Task
-            docs_task = DocsAgent.create_task(
-                self.docs_agent,
-                f"""Project Documentation:
-                Specification: {self.project_spec}
-                Implementation: {code_task.raw if hasattr(code_task, 'raw') else ""}
-                Testing: {test_task.raw if hasattr(test_task, 'raw') else ""}""",
-                output_file=os.path.join(
-                    './src', docs_file)  # Save to temporary ./src directory
-            )
-            logger.info("Documentation task created")
-
-            # Create crew for remaining tasks
-            crew = Crew(
-                agents=[self.idl_agent, self.code_agent,
-                        self.test_agent, self.docs_agent, self.run_agent],
-                tasks=[idl_task, code_task, test_task, docs_task, run_task],
-                verbose=False
-
-            )
+            for relative_path in (implementation_file, test_file, docs_file,
+                                  interface_file, run_script_file):
+                os.makedirs(os.path.dirname(os.path.join(
+                    self.staging_dir, relative_path)), exist_ok=True)
+
+            logger.info("--------------------------------------------")
+            logger.info("Implementation file: %s", implementation_file)
+            logger.info("Test file: %s", test_file)
+            logger.info("Docs file: %s", docs_file)
+            logger.info("Interface file: %s", interface_file)
+            logger.info("Run script file: %s", run_script_file)
+
+            file_paths = {
+                IDLAgent.stage: interface_file,
+                CodeAgent.stage: implementation_file,
+                TestAgent.stage: test_file,
+                DocsAgent.stage: docs_file,
+                RunAgent.stage: run_script_file,
+            }
+            # Every other file-mapping entry becomes a stage of its own
+            self.file_specs = {spec.stage: spec for spec in FileAgent.plan(
+                manifest_data, {path: stage for stage, path in file_paths.items()})}
+            for stage, spec in self.file_specs.items():
+                file_paths[stage] = spec.path
+                os.makedirs(os.path.dirname(os.path.join(
+                    self.staging_dir, spec.path)), exist_ok=True)
+            if self.file_specs:
+                logger.info("Generating %d more files from the file-mapping: %s",
+                            len(self.file_specs), ", ".join(spec.path for spec in self.file_specs.values()))
+            self.stage_paths = file_paths
 
             # Introduce a review loop (i.e. iterative review until approved or a maximum iteration count)
             max_review_iterations = 1
@@ -237,42 +350,14 @@ class ProjectWorkflow:
 
             while review_iteration < max_review_iterations and not review_approved:
                 # Execute the workflow and get results
-                logger.info("Executing crew tasks")
-                # Pass the Crew object to execute_with_retry
-                results = self.execute_with_retry(crew)
-                logger.debug(f"execute_with_retry {type(results)}")
-                logger.debug(f"execute_with_retry {results}")
-                # The results from crew.kickoff() are directly available as a string or list of strings
-                # Let's process these results directly as they are output by the tasks.
-                generated_files = {
-                    interface_file: idl_task.raw if hasattr(idl_task, 'raw') else '',
-                    implementation_file: code_task.output if hasattr(code_task, 'raw') else '',
-                    test_file: test_task.raw if hasattr(test_task, 'raw') else '',
-                    docs_file: docs_task.raw if hasattr(docs_task, 'raw') else '',
-                    run_script_file: run_task.raw if hasattr(run_task, 'raw') else '',
-                }
-
-                logger.warning(f"output by the tasks. {type(idl_task)}")
-                logger.debug(f"output by the tasks. {idl_task}")
-                logger.debug(f"output by the tasks. {generated_files}")
-                
-                # Read the actual content from the output files written by the tasks
-                # CrewAI agents write directly to files if output_file is specified.
-                # So, we should read from these files to get the actual generated content for review.
-                actual_generated_files = {}
-                for file_key, relative_path in manifest_data.items():
-                    if file_key in ['implementation_file', 'test_file', 'docs_file', 'interface_file', 'run_script']:
-                        full_path = os.path.join('./src', relative_path)
-                        if os.path.exists(full_path):
-                            with open(full_path, 'r') as f:
-                                actual_generated_files[relative_path] = f.read(
-                                )
-                        else:
-                            logger.warning(
-                                f"Output file not found: {full_path}")
-                            # Provide an empty string if file not found
-                            actual_generated_files[relative_path] = ""
-
+                logger.info("Executing generation stages")
+                results = self.run_generation_stages(file_paths)
+                logger.debug("run_generation_stages %s", list(results))
+
+                # Every stage returns the content it wrote to its output file,
+                # so the staged files do not have to be read back from disk
+                actual_generated_files = {
+                    file_paths[stage]: output for stage, output in results.items()}
                 logger.info("Crew tasks completed")
 
                 # Using the generated code—here we review the main implementation file.
@@ -281,19 +366,17 @@ class ProjectWorkflow:
                 if not generated_code:
                     logger.warning("No generated code was found to review.")
 
-                # Create and execute the review task
-                review_task = ReviewAgent.create_task(
-                    self.review_agent, generated_code)
-                review_crew = Crew(
-                    agents=[self.review_agent],
-                    tasks=[review_task],
-                    verbose=0
-                )
-                # Pass the Crew object to execute_with_retry
-                review_result = self.execute_with_retry(review_crew)
-                review_output = review_result[0] if isinstance(
-                    review_result, list) else review_result.raw
-                logger.info(f"Review output:\n{review_output}")
+                gate = self._validation_gate(
+                    dict(actual_generated_files, **{'manifest.json': manifest_raw}),
+                    allow_empty={spec.path for spec in self.file_specs.values() if spec.content == ""})
+                implementation_check = gate.get(implementation_file)
+                if implementation_check is not None and not implementation_check.ok:
+                    # No point paying for a review of code that does not even compile
+                    logger.warning("Skipping review, %s failed static validation", implementation_file)
+                    review_output = "Revisions required\n" + implementation_check.feedback()
+                else:
+                    review_output = self._run_review_stage(generated_code, implementation_file)
+                logger.debug("Review output:\n%s", review_output)
 
                 if "Approved" in review_output:
                     review_approved = True
@@ -303,6 +386,11 @@ class ProjectWorkflow:
                         "Code review requested revisions. Re-running generation tasks with feedback...")
                     # (Optionally, you could incorporate the review feedback in subsequent iterations.)
                     review_iteration += 1
+                    if review_iteration < max_review_iterations:
+                        # The next iteration has to regenerate, not resume
+                        self.checkpoints.discard(
+                            [agent.stage for agent in GENERATION_AGENTS] + list(self.file_specs)
+                            + [ReviewAgent.stage])
 
                 if not review_approved:
                     logger.warning(
@@ -310,122 +398,565 @@ class ProjectWorkflow:
 
                 # Process and save generated files
                 logger.info("Processing and saving generated files")
-                generated_files = self._process_results(results)
+                generated_files = dict(actual_generated_files)
+                generated_files['manifest.json'] = manifest_raw
+                for name, cache in (('llm', self.llm_cache), ('review', self.review_cache)):
+                    if cache:
+                        self.metrics.record_cache_stats(name, cache.stats())
+                self.metrics.finish()
+                metadata_files = self.fingerprints.files()
+                metadata_files['validation_report.json'] = json.dumps(
+                    ArtifactValidator.report(gate), indent=2)
                 output_dir = self.file_handler.save_project_files(
-                    generated_files)
-
-                logger.info(
-                    f"Project generation completed. Output directory: {output_dir}")
+                    generated_files, metrics=self.metrics, staging_dir=self.staging_dir,
+                    metadata_files=metadata_files, project_name=self.project_name, run_info={
+                        'run_id': self.run_id,
+                        'kind': 'generate',
+                        'spec': self.project_spec,
+                        'language': manifest_data.get('language'),
+                        'review_verdict': review_verdict(review_output),
+                    })
+                self.output_dir = output_dir
+                self.checkpoints.clear()
+
+                logger.info("Project generation completed. Output directory: %s", output_dir)
+                for name, stats in self.metrics.caches.items():
+                    logger.info("%s cache: %s", name, stats)
                 return results
 
         except Exception as e:
-          logger.error(f"Error in project generation: {str(e)}", exc_info=True)
+          logger.error("Error in project generation: %s", e, exc_info=True)
+          if self.staging_dir:
+              # Finished stages survive in the checkpoints, not in the staging area
+              self.file_handler.remove_workspace(self.staging_dir)
+          if self.private_checkpoints:
+              self.checkpoints.clear()
           raise
 
-    def _process_results(self, results):
+    def _start_run(self):
+        """Gives the run a unique id and its own staging directory."""
+        self.run_id = uuid.uuid4().hex[:12]
+        if not self.checkpoints.acquire():
+            # Another live run owns these checkpoints; resuming them would mix two runs
+            logger.info("Checkpoints %s are in use by another run, starting fresh",
+                        self.checkpoints.run_key)
+            self.checkpoints = CheckpointStore(CheckpointStore.key_for(
+                self.project_spec, self.model, f"{self.resume_key}:{self.run_id}"))
+            self.checkpoints.acquire()
+            # Nothing can resume a key that contains this run's id
+            self.private_checkpoints = True
+        self.staging_dir = self.file_handler.create_workspace(self.run_id)
+        logger.info("Run %s staging in %s", self.run_id, self.staging_dir)
+
+    def _create_stage_task(self, stage, upstream, output_file, file_agent=None):
         """
-        Process the results from the crew execution into file contents.
+        Creates the task for a generation stage from its upstream outputs.
+        File stages pass the `file_agent` they checked out of the registry.
         """
-        try:
-            generated_files = {}
-
-            # Process IDL output
-            if hasattr(results, 'idl_task') and results.idl_task:
-                generated_files['src/specification.idl'] = results.idl_task
-                logger.info("Processed IDL output")
-
-            # Process code output
-            if hasattr(results, 'code_task') and results.code_task:
-                generated_files['src/app.py'] = results.code_task
-                logger.info("Processed code output")
-
-            # Process test output
-            if hasattr(results, 'test_task') and results.test_task:
-                generated_files['tests/test_app.py'] = results.test_task
-                logger.info("Processed test output")
-
-            # Process documentation output
-            if hasattr(results, 'docs_task') and results.docs_task:
-                generated_files['docs/README.md'] = results.docs_task
-                logger.info("Processed documentation output")
-
-            return generated_files
-
-        except Exception as e:
-            logger.error(f"Error processing results: {str(e)}", exc_info=True)
-            raise
+        if stage in self.file_specs:
+            return self._fit_prompt(
+                lambda files: FileAgent.create_task(
+                    file_agent, self.project_spec, self.file_specs[stage], files,
+                    output_file=output_file),
+                {self.stage_paths[name]: output for name, output in upstream.items()})
+        agent = self.agents.get(STAGE_AGENT_CLASSES[stage])
+        if stage == IDLAgent.stage:
+            return IDLAgent.create_task(
+                agent, self.project_spec, output_file=output_file)
+        if stage == CodeAgent.stage:
+            return CodeAgent.create_task(
+                agent, self.project_spec, upstream[IDLAgent.stage], output_file=output_file)
+        if stage == RunAgent.stage:
+            return RunAgent.create_task(
+                agent, self.project_spec, upstream[IDLAgent.stage], output_file=output_file)
+        code_path = self.stage_paths.get(CodeAgent.stage)
+        if stage == TestAgent.stage:
+            return self._fit_prompt(
+                lambda files: TestAgent.create_task(
+                    agent, files[code_path], output_file=output_file),
+                {code_path: upstream[CodeAgent.stage]})
+        if stage == DocsAgent.stage:
+            return self._fit_prompt(
+                lambda files: DocsAgent.create_task(
+                    agent,
+                    f"""Project Documentation:
+                Specification: {self.project_spec}
+                Implementation: {files[code_path]}""",
+                    output_file=output_file
+                ),
+                {code_path: upstream[CodeAgent.stage]})
+        raise ValueError(f"Unknown generation stage: {stage}")
 
-    def add_feature(self, feature_desc):
+    def _fit_prompt(self, make_task, files):
         """
-        Handles the addition of new features to the existing project.
+        Creates a task from upstream `files` (path -> content), compacting
+        them so the whole prompt stays within `prompt_budget` tokens.
         """
-        try:
-            logger.info(f"Starting feature addition: {feature_desc}")
+        empty = make_task(dict.fromkeys(files, ""))
+        # The agent's persona is part of the system prompt crewai sends along
+        overhead = estimate_tokens(LLMCache.task_prompt(empty)) + estimate_tokens(
+            f"{empty.agent.role}\n{empty.agent.goal}\n{empty.agent.backstory}")
+        with self.tracer.span('compact_context', category='prompt',
+                              budget=self.prompt_budget, overhead=overhead) as span:
+            compacted = self.context_compactor.compact_all(files, self.prompt_budget - overhead)
+            tokens_before = sum(context.tokens_before for context in compacted.values())
+            tokens_after = sum(context.tokens_after for context in compacted.values())
+            span.set(tokens_before=tokens_before, tokens_after=tokens_after,
+                     methods={path: context.method for path, context in compacted.items()})
+        self.metrics.record_context(tokens_before, tokens_after)
+        if overhead > self.prompt_budget:
+            logger.warning("Prompt without upstream context already needs ~%d tokens, "
+                           "over the budget of %d", overhead, self.prompt_budget)
+        elif tokens_after < tokens_before:
+            logger.info("Compacted upstream context from ~%d to ~%d tokens (%s)",
+                        tokens_before, tokens_after,
+                        ", ".join(f"{path}: {context.method}" for path, context in compacted.items()))
+        return make_task({path: context.text for path, context in compacted.items()})
+
+    def _write_output(self, output_file, content):
+        """Writes stage output to the file the task would have written."""
+        with self.tracer.span('write_output', category='io', path=output_file,
+                              output_bytes=len(content.encode('utf-8'))):
+            os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+            with open(output_file, 'w') as f:
+                f.write(content)
+
+    def _run_manifest_stage(self):
+        """Returns the raw manifest output, calling the manifest agent only if needed."""
+        with self._stage(ManifestAgent.stage):
+            inputs = BuildFingerprints.inputs_for(
+                self.project_spec, {}, ManifestAgent, self.model)
+            self.fingerprints.record(ManifestAgent.stage, inputs, 'manifest.json')
+
+            manifest_raw = self.checkpoints.load(ManifestAgent.stage)
+            if manifest_raw is not None:
+                logger.info("Resuming manifest from checkpoint")
+                self.metrics.set_source('checkpoint')
+                return manifest_raw
+
+            manifest_raw = self.fingerprints.reusable(ManifestAgent.stage, inputs)
+            if manifest_raw is not None:
+                self.metrics.set_source('previous_build')
+                return manifest_raw
+
+            manifest, confidence = ManifestAgent.local_manifest(self.project_spec)
+            if confidence >= self.manifest_confidence:
+                logger.info(
+                    "Using local manifest (confidence %.2f), skipping the manifest agent", confidence)
+                self.metrics.set_source('local')
+                # Same shape as the agent's answer so the parsing path is shared
+                manifest_raw = f"```json\n{json.dumps(manifest, indent=2)}\n```"
+                self.checkpoints.save(ManifestAgent.stage, manifest_raw)
+                self.metrics.record_bytes(len(manifest_raw.encode('utf-8')))
+                return manifest_raw
+            logger.info(
+                "Local manifest confidence %.2f is below %.2f, asking the manifest agent",
+                confidence, self.manifest_confidence)
 
-            # Create feature-specific tasks
-            code_task = CodeAgent.create_task(
-                self.code_agent,
-                f"Add this feature to the existing implementation: {feature_desc}"
+            logger.info("Creating manifest task")
+            manifest_task = ManifestAgent.create_task(
+                self.agents.get(ManifestAgent), self.project_spec,
+                output_file=os.path.join(self.staging_dir, 'manifest.json'))
+            # Create a Crew for the manifest task
+            manifest_crew = Crew(
+                agents=[manifest_task.agent],
+                tasks=[manifest_task],
+                verbose=False
             )
-        
 
-            test_task = TestAgent.create_task(
-                self.test_agent,
-                f"""New Implementation: {code_task.output if hasattr(code_task, 'output') else ''}
-                Feature Description: {feature_desc}
-                Write tests for the new feature"""
-            )
+            logger.info("Executing manifest crew")
+            # Pass the Crew object to execute_with_retry
+            manifest_raw = self.execute_with_retry(manifest_crew).raw
+            self.checkpoints.save(ManifestAgent.stage, manifest_raw)
+            self.metrics.record_bytes(len(manifest_raw.encode('utf-8')))
+            return manifest_raw
 
-            run_task = RunAgent.create_task(
-                self.run_agent,
-                self.project_spec,
+    def _run_review_stage(self, generated_code, path=None):
+        """
+        Reviews the generated code and returns the review text. Code that
+        matches already reviewed code up to formatting and comments gets
+        the stored review instead of a new ReviewAgent call.
+        """
+        with self._stage(ReviewAgent.stage):
+            review_output = self.checkpoints.load(ReviewAgent.stage)
+            if review_output is not None:
+                logger.info("Resuming review from checkpoint")
+                self.metrics.set_source('checkpoint')
+                return review_output
+
+            review_key = None
+            if self.review_cache:
+                with self.tracer.span('review_cache_lookup', category='cache') as span:
+                    review_key = ReviewCache.make_review_key(
+                        self.agents.get(ReviewAgent), ReviewAgent, generated_code, path)
+                    cached = self.review_cache.get_review(review_key)
+                    span.set(hit=cached is not None)
+                if cached is not None:
+                    logger.info("Review cache hit (%s)", cached['verdict'])
+                    self.metrics.record_cache_hit()
+                    self.metrics.set_source('review_cache')
+                    review_output = cached['feedback']
+                    self._write_output(os.path.join(self.staging_dir, 'report.txt'), review_output)
+                    self.checkpoints.save(ReviewAgent.stage, review_output)
+                    return review_output
+
+            # Create and execute the review task
+            review_task = ReviewAgent.create_task(
+                self.agents.get(ReviewAgent), generated_code,
+                output_file=os.path.join(self.staging_dir, 'report.txt'))
+            review_crew = Crew(
+                agents=[review_task.agent],
+                tasks=[review_task],
+                verbose=0
             )
-
-            docs_task = DocsAgent.create_task(
-                self.docs_agent,
-                f"""Update documentation with:
-                1. New Feature: {feature_desc}
-                2. Implementation: {code_task.output if hasattr(code_task, 'output') else ''}
-                3. Test Coverage: {test_task.output if hasattr(test_task, 'output') else ''}"""
+            # Pass the Crew object to execute_with_retry
+            review_result = self.execute_with_retry(review_crew)
+            review_output = review_result[0] if isinstance(
+                review_result, list) else review_result.raw
+            self.checkpoints.save(ReviewAgent.stage, review_output)
+            if review_key is not None:
+                self.review_cache.set_review(review_key, review_output)
+            self.metrics.record_bytes(len(review_output.encode('utf-8')))
+            return review_output
+
+    def _run_stage(self, stage, upstream, file_paths):
+        """
+        Runs a single generation stage as its own crew and returns its raw
+        output. Stages finished by an earlier, interrupted run are restored
+        from their checkpoint, and in incremental mode stages whose inputs
+        match the previous build reuse its artifact.
+        """
+        with self._stage(stage):
+            output_file = os.path.join(self.staging_dir, file_paths[stage])
+            file_spec = self.file_specs.get(stage)
+            agent_cls = FileAgent if file_spec else STAGE_AGENT_CLASSES[stage]
+            inputs = BuildFingerprints.inputs_for(
+                self.project_spec, upstream, agent_cls, self.model)
+            if file_spec:
+                # The file's description is an input of its stage too
+                inputs['description'] = file_spec.description
+            if file_spec or stage in (TestAgent.stage, DocsAgent.stage):
+                # Compaction of the upstream code in the prompt depends on the budget
+                inputs['prompt_budget'] = self.prompt_budget
+            self.fingerprints.record(stage, inputs, file_paths[stage])
+
+            checkpoint = self.checkpoints.load(stage)
+            if checkpoint is not None:
+                logger.info("Resuming stage '%s' from checkpoint", stage)
+                self.metrics.set_source('checkpoint')
+                self._write_output(output_file, checkpoint)
+                return checkpoint
+
+            previous = self.fingerprints.reusable(stage, inputs)
+            if previous is not None:
+                self.metrics.set_source('previous_build')
+                self._write_output(output_file, previous)
+                self.checkpoints.save(stage, previous)
+                return previous
+
+            if file_spec and file_spec.content is not None:
+                self.metrics.set_source('local')
+                self._write_output(output_file, file_spec.content)
+                self.checkpoints.save(stage, file_spec.content)
+                self.metrics.record_bytes(len(file_spec.content.encode('utf-8')))
+                return file_spec.content
+
+            # Concurrent file stages must not share an agent
+            with (self.agents.checkout(FileAgent) if file_spec else nullcontext()) as file_agent:
+                for attempt in range(self.max_regenerations + 1):
+                    task = self._create_stage_task(stage, upstream, output_file, file_agent)
+                    if attempt:
+                        # The feedback changes the prompt, so this also bypasses
+                        # the cached answer that failed validation
+                        task.description = f"{task.description}\n\n{validation.feedback()}"
+                    crew = Crew(
+                        agents=[task.agent],
+                        tasks=[task],
+                        verbose=False
+                    )
+                    result = self.execute_with_retry(crew)
+                    validation = self._validate_stage_output(stage, file_paths[stage], result.raw)
+                    if validation.ok:
+                        break
+                    if attempt < self.max_regenerations:
+                        logger.warning("Stage '%s' output failed validation, regenerating: %s",
+                                       stage, "; ".join(validation.errors))
+                        self.metrics.record_regeneration()
+            self.checkpoints.save(stage, result.raw)
+            self.metrics.record_bytes(len(result.raw.encode('utf-8')))
+            return result.raw
+
+    def _validate_stage_output(self, stage, path, output):
+        with self.tracer.span('validate', category='validation', path=path) as span:
+            result = self.artifact_validator.validate(path, output)
+            span.set(checker=result.checker, ok=result.ok, errors=len(result.errors))
+        self.validation[stage] = result
+        return result
+
+    def _validation_gate(self, files, allow_empty=()):
+        """
+        Statically validates every artifact of the run concurrently,
+        including ones restored from checkpoints or a previous build.
+        """
+        with self.tracer.span('validation_gate', category='validation', files=len(files)) as span:
+            results = self.artifact_validator.validate_all(files, allow_empty)
+            failed = [path for path, result in results.items() if not result.ok]
+            span.set(failed=failed)
+        for path in failed:
+            logger.warning("Static validation failed for %s: %s",
+                           path, "; ".join(results[path].errors))
+        return results
+
+    def run_generation_stages(self, file_paths):
+        """
+        Runs the IDL, code, test, docs and run stages plus one stage per
+        extra file-mapping entry, executing independent stages concurrently
+        (at most `max_concurrency` at a time). Returns a dict of stage name
+        -> raw output.
+        """
+        scheduler = StageScheduler(max_concurrency=self.max_concurrency)
+        for agent_cls in GENERATION_AGENTS:
+            scheduler.add_stage(
+                agent_cls.stage,
+                partial(self._run_stage, agent_cls.stage, file_paths=file_paths),
+                depends_on=agent_cls.depends_on
             )
-
-            # Create crew for feature addition
-            crew = Crew(
-                agents=[self.code_agent, self.test_agent,
-                        self.docs_agent, self.run_agent],
-                tasks=[code_task, test_task, docs_task, run_task],
-                verbose=True
+        for spec in self.file_specs.values():
+            scheduler.add_stage(
+                spec.stage,
+                partial(self._run_stage, spec.stage, file_paths=file_paths),
+                depends_on=spec.depends_on
             )
+        results = scheduler.run()
+        for stage, queue_time in scheduler.queue_times.items():
+            self.metrics.set_queue_time(stage, queue_time)
+        for stage, (ready, started) in scheduler.queue_windows.items():
+            # Time a ready stage spent waiting for a free worker
+            self.tracer.add_span(
+                f"queued {stage}", ready, started, category='queue', track=f"queue: {stage}")
+        return results
 
-            # Execute and process results
-            results = crew.kickoff()
-            generated_files = self._process_results(results)
-            output_dir = self.file_handler.save_project_files(generated_files)
+    def add_feature(self, feature_desc):
+        """
+        Handles the addition of new features to the existing project.
+        """
+        with self._traced_run('add_feature'):
+            return self._add_feature(feature_desc)
 
-            logger.info(
-                f"Feature addition completed. Output directory: {output_dir}")
-            return results
+    def _add_feature(self, feature_desc):
+        """
+        Adds a feature to the latest generated project by patching it. Only
+        the implementation regions the feature is about are sent to the
+        CodeAgent, and only the tests and documentation sections that
+        mention the symbols the patch changed are sent on. Everything else
+        is copied from the previous project unchanged.
+        """
+        try:
+            logger.info("Starting feature addition: %s", feature_desc)
+            project_dir = self.output_dir or self.file_handler.latest_project()
+            if project_dir is None:
+                raise ValueError("There is no generated project to add a feature to")
+            self.metrics = MetricsRecorder()
+            self.validation = {}
+            self._start_run()
+            self.file_handler.copy_project(project_dir, self.staging_dir,
+                                           exclude=FEATURE_EXCLUDED_FILES)
+
+            manifest = self._project_manifest(project_dir)
+            implementation_file = manifest.get('implementation_file', 'src/app.py')
+            test_file = manifest.get('test_file', 'tests/test_app.py')
+            docs_file = manifest.get('docs_file', 'docs/README.md')
+
+            code = self._read_project_file(project_dir, implementation_file)
+            if code is None:
+                raise ValueError(f"{project_dir} has no implementation file {implementation_file}")
+            patched = {implementation_file: self._patch_implementation(
+                feature_desc, implementation_file, code)}
+
+            changed_names = symbols.changed(code, patched[implementation_file])
+            logger.info("Feature changed %s", ", ".join(changed_names) or "no Python symbols")
+            changed_code = self._changed_code(
+                implementation_file, code, patched[implementation_file], changed_names)
+            short_names = {name.rsplit('.', 1)[-1] for name in changed_names}
+
+            tests = self._read_project_file(project_dir, test_file)
+            if tests is not None:
+                patched[test_file] = self._patch_tests(
+                    feature_desc, test_file, tests, changed_code, short_names)
+            docs = self._read_project_file(project_dir, docs_file)
+            if docs is not None:
+                patched[docs_file] = self._patch_docs(
+                    feature_desc, docs_file, docs, changed_code, short_names)
+
+            if self.llm_cache:
+                self.metrics.record_cache_stats('llm', self.llm_cache.stats())
+            self.metrics.finish()
+            catalog = self.file_handler.get_catalog()
+            parent = catalog.for_project_dir(project_dir) if catalog else None
+            output_dir = self.file_handler.save_project_files(
+                patched, metrics=self.metrics, staging_dir=self.staging_dir,
+                metadata_files={'validation_report.json': json.dumps(
+                    ArtifactValidator.report({
+                        self.stage_paths.get(stage, stage): result
+                        for stage, result in self.validation.items()}), indent=2)},
+                run_info={
+                    'run_id': self.run_id,
+                    'kind': 'feature',
+                    'spec': self.project_spec,
+                    'language': manifest.get('language'),
+                    'parent_run_id': parent['run_id'] if parent else None,
+                })
+            self.output_dir = output_dir
+
+            logger.info("Feature addition completed. Output directory: %s", output_dir)
+            return patched
 
         except Exception as e:
-            logger.error(f"Error in feature addition: {str(e)}", exc_info=True)
+            logger.error("Error in feature addition: %s", e, exc_info=True)
+            if self.staging_dir:
+                self.file_handler.remove_workspace(self.staging_dir)
             raise
 
+    @staticmethod
+    def _project_manifest(project_dir):
+        path = os.path.join(project_dir, 'manifest.json')
+        if not os.path.isfile(path):
+            return {}
+        with open(path, 'r') as f:
+            objects = extract_json(f.read())
+        return objects[0] if objects else {}
+
+    @staticmethod
+    def _read_project_file(project_dir, path):
+        full_path = os.path.join(project_dir, path)
+        if not os.path.isfile(full_path):
+            logger.warning("Project file not found: %s", full_path)
+            return None
+        with open(full_path, 'r') as f:
+            return f.read()
+
+    def _patch_implementation(self, feature_desc, path, code):
+        with self._stage('feature:code'):
+            located = symbols.relevant(symbols.symbols_for(path, code), feature_desc)
+            api = self.context_compactor.compact(
+                code, path, self.prompt_budget // 4, allow_full=False)
+            regions = symbols.format_regions(path, code, located)
+            self.metrics.record_context(estimate_tokens(code), api.tokens_after + estimate_tokens(regions))
+            logger.info("Sending %s of %s to the code agent",
+                        ", ".join(symbol.name for symbol in located) or "the end", path)
+            return self._patch_file('feature:code', path, code, lambda: CodeAgent.create_patch_task(
+                self.agents.get(CodeAgent), feature_desc, path, api.text, regions,
+                output_file=self._patch_output(path)))
+
+    def _patch_tests(self, feature_desc, path, tests, changed_code, names):
+        with self._stage('feature:test'):
+            related = symbols.referencing(symbols.symbols_for(path, tests), names)
+            related = symbols.outermost(related)[:MAX_PATCH_REGIONS]
+            regions = symbols.format_regions(path, tests, related)
+            self.metrics.record_context(
+                estimate_tokens(tests), estimate_tokens(regions) + estimate_tokens(changed_code))
+            return self._patch_file('feature:test', path, tests, lambda: TestAgent.create_patch_task(
+                self.agents.get(TestAgent), feature_desc, path, changed_code, regions,
+                output_file=self._patch_output(path)))
+
+    def _patch_docs(self, feature_desc, path, docs, changed_code, names):
+        with self._stage('feature:docs'):
+            sections = symbols.symbols_for(path, docs)
+            related = (symbols.referencing(sections, names)
+                       or symbols.relevant(sections, feature_desc, limit=2))[:MAX_PATCH_REGIONS]
+            outline = "\n".join(
+                f"- {section.name} (lines {section.start}-{section.end})" for section in sections)
+            regions = symbols.format_regions(path, docs, related)
+            self.metrics.record_context(
+                estimate_tokens(docs),
+                estimate_tokens(outline) + estimate_tokens(regions) + estimate_tokens(changed_code))
+            return self._patch_file('feature:docs', path, docs, lambda: DocsAgent.create_patch_task(
+                self.agents.get(DocsAgent), feature_desc, path, changed_code, outline, regions,
+                output_file=self._patch_output(path)))
+
+    @staticmethod
+    def _changed_code(path, code, patched, changed_names):
+        """The new source of the changed symbols, or the whole patched file when it is not Python."""
+        changed = [symbol for symbol in symbols.symbols_for(path, patched)
+                   if symbol.name in changed_names]
+        if changed:
+            return symbols.format_regions(path, patched, changed)
+        return patched if patched != code else ""
+
+    def _patch_output(self, path):
+        return os.path.join(self.staging_dir, 'patches', f"{path}.diff")
+
+    def _patch_file(self, stage, path, original, make_task):
+        """
+        Asks for a diff against `original` and returns the patched content.
+        Diffs that do not apply, or whose result fails static validation,
+        are asked for again with the problem in the prompt, up to
+        `max_regenerations` times.
+        """
+        self.stage_paths[stage] = path
+        for attempt in range(self.max_regenerations + 1):
+            task = make_task()
+            if attempt:
+                task.description = f"{task.description}\n\n{feedback}"
+            crew = Crew(
+                agents=[task.agent],
+                tasks=[task],
+                verbose=False
+            )
+            diff = self.execute_with_retry(crew).raw
+            try:
+                with self.tracer.span('apply_patch', category='io', path=path) as span:
+                    result = apply_unified_diff(original, diff)
+                    span.set(diff_bytes=len(diff.encode('utf-8')))
+            except PatchError as e:
+                feedback = (f"Your previous diff did not apply to {path}: {e}.\n"
+                            "Return a corrected diff whose context lines match the excerpts exactly.")
+            else:
+                validation = self._validate_stage_output(stage, path, result)
+                if validation.ok:
+                    self.metrics.record_bytes(len(result.encode('utf-8')))
+                    return result
+                problems = "\n".join(f"- {error}" for error in validation.errors)
+                feedback = (f"Applying your previous diff to {path} failed the "
+                            f"{validation.checker} check:\n{problems}\n"
+                            "Return a corrected diff against the original excerpts.")
+            if attempt < self.max_regenerations:
+                logger.warning("Patch for %s rejected, asking again: %s", path, feedback)
+                self.metrics.record_regeneration()
+        raise PatchError(f"No usable patch for {path}: {feedback}")
+
+def create_llm():
+    """
+    Creates the LLM shared by all agents of a workflow. Responses are
+    streamed unless LLM_STREAMING=0.
+    """
+    load_environment()
+    if os.environ.get("LLM_STREAMING", "1") == "0":
+        return LLM(
+            model='gemini/gemini-2.0-flash',
+            api_key=os.environ["GOOGLE_API_KEY"]
+        )
+    from utils.streaming_llm import StreamingLLM
+    return StreamingLLM(
+        model='gemini/gemini-2.0-flash',
+        api_key=os.environ["GOOGLE_API_KEY"]
+    )
 
-llm = LLM(
-    model='gemini/gemini-2.0-flash',
-    api_key=os.environ["GOOGLE_API_KEY"]
-)
 
-file_path = 'config/project_spec.txt'
-file_handler = FileHandler()
-project_spec = file_handler.read_specification(file_path)
+if __name__ == "__main__":
+    llm = create_llm()
 
-print(project_spec)
+    file_path = 'config/project_spec.txt'
+    file_handler = FileHandler()
+    project_spec = file_handler.read_specification(file_path)
 
+    logger.debug("Specification:\n%s", project_spec)
 
-if __name__ == "__main__":
-    
     # Initialize and run the project workflow
-    workflow = ProjectWorkflow(project_spec, llm=llm)
+    workflow = ProjectWorkflow(
+        project_spec, llm=llm,
+        max_concurrency=int(os.environ.get("MAX_STAGE_CONCURRENCY", 3)),
+        incremental=os.environ.get("INCREMENTAL", "0") == "1",
+        manifest_confidence=float(os.environ.get("MANIFEST_CONFIDENCE", 0.75)))
     result = workflow.execute()
     print(result)
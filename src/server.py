@@ -0,0 +1,404 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import itertools
+import mimetypes
+import threading
+import socketserver
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from batch import BatchJob
+from utils.custom_logger import get_logger, configure_logging
+from utils.metrics import percentile
+
+
+logger = get_logger(__name__)
+
+
+# Largest accepted request body (a specification)
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class QueueFull(Exception):
+    """Raised when a submission would exceed the service's queue limit."""
+
+
+class ServiceJob(BatchJob):
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id, spec, priority=0):
+        super().__init__(job_id, spec)
+        self.priority = priority
+        self.started_at = None
+        # Seconds spent waiting for a worker
+        self.queue_time = None
+
+    def to_dict(self):
+        data = super().to_dict()
+        data['priority'] = self.priority
+        data['queue_time'] = self.queue_time
+        return data
+
+
+class GenerationService:
+    """
+    Runs submitted specifications on resident worker threads.
+
+    Each worker creates its LLM client and agents once, when it starts, and
+    reuses them for every job it runs, so a job costs its LLM calls and
+    little else. Jobs wait in a priority queue (higher priority first, FIFO
+    within a priority). At most `max_queue` jobs may wait; beyond that
+    `submit` raises QueueFull and callers have to back off.
+    """
+
+    def __init__(self, workers=2, max_queue=32, stage_concurrency=3, llm_factory=None,
+                 max_finished=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.stage_concurrency = stage_concurrency
+        # Builds each worker's LLM; create_llm() when not given
+        self.llm_factory = llm_factory
+        # Finished jobs kept for status and artifact requests
+        self.max_finished = max_finished
+        self.jobs = OrderedDict()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._threads = []
+        self._ready = threading.Barrier(workers + 1)
+        self._startup_errors = []
+
+    def start(self):
+        """Starts the workers and returns once each has warmed up its agents."""
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, args=(index,), name=f"generation-worker-{index}",
+                daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._ready.wait()
+        if self._startup_errors:
+            self.stop()
+            raise RuntimeError(
+                f"{len(self._startup_errors)} workers failed to start: {self._startup_errors[0]}")
+        logger.info("Generation service ready with %d workers", self.workers)
+
+    def stop(self):
+        """Lets running jobs finish, then stops the workers. Queued jobs are cancelled."""
+        with self._lock:
+            for job in self.jobs.values():
+                if job.status == ServiceJob.QUEUED:
+                    job.status = ServiceJob.CANCELLED
+                    self._queued -= 1
+        for _ in self._threads:
+            # Sentinels sort after every job
+            self._queue.put((float('inf'), next(self._order), None))
+        for thread in self._threads:
+            thread.join()
+
+    def submit(self, spec, priority=0, job_id=None):
+        """Queues a specification and returns its ServiceJob."""
+        if not isinstance(spec, str) or not spec.strip():
+            raise ValueError("The specification must be a non-empty string")
+        with self._lock:
+            if self._queued >= self.max_queue:
+                raise QueueFull(f"{self._queued} jobs are already waiting")
+            job_id = job_id or f"job-{next(self._order)}-{os.urandom(3).hex()}"
+            if job_id in self.jobs:
+                raise ValueError(f"Job {job_id} already exists")
+            job = ServiceJob(job_id, spec.strip(), priority)
+            job.submitted_at = time.monotonic()
+            self.jobs[job_id] = job
+            self._queued += 1
+            self._queue.put((-priority, next(self._order), job_id))
+        logger.info("Job %s queued (priority %d)", job_id, priority)
+        return job
+
+    def cancel(self, job_id):
+        """Cancels a queued job; returns False for unknown, running or finished jobs."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != ServiceJob.QUEUED:
+                return False
+            job.status = ServiceJob.CANCELLED
+            self._queued -= 1
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self.jobs.values())
+            queued, running = self._queued, self._running
+        finished = [job for job in jobs if job.duration is not None]
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'workers': self.workers,
+            'queued': queued,
+            'running': running,
+            'max_queue': self.max_queue,
+            'jobs': counts,
+            'job_latency_p50': percentile([job.duration for job in finished], 0.50),
+            'job_latency_p95': percentile([job.duration for job in finished], 0.95),
+            'queue_time_p50': percentile(
+                [job.queue_time for job in jobs if job.queue_time is not None], 0.50),
+        }
+
+    def artifacts(self, job):
+        """Paths of the files of a finished job's project, relative to its directory."""
+        if not job.output_dir or not os.path.isdir(job.output_dir):
+            return []
+        paths = []
+        for directory, _, files in os.walk(job.output_dir):
+            for name in files:
+                path = os.path.relpath(os.path.join(directory, name), job.output_dir)
+                paths.append(path.replace(os.sep, '/'))
+        return sorted(paths)
+
+    def artifact_path(self, job, path):
+        """Absolute path of one artifact, or None if it is missing or outside the project."""
+        if not job.output_dir:
+            return None
+        root = os.path.realpath(job.output_dir)
+        full_path = os.path.realpath(os.path.join(root, path))
+        if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+            return None
+        return full_path
+
+    def _worker(self, index):
+        # Imported here so the service starts listening without waiting for crewai
+        from agents import AgentRegistry
+        from main import ProjectWorkflow, WORKFLOW_AGENTS, create_llm
+
+        try:
+            llm = (self.llm_factory or create_llm)()
+            agents = AgentRegistry(llm)
+            agents.warm(WORKFLOW_AGENTS)
+        except Exception as e:
+            logger.error("Worker %d could not start: %s", index, e, exc_info=True)
+            self._startup_errors.append(e)
+            return
+        finally:
+            self._ready.wait()
+
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self.jobs[job_id]
+                if job.status != ServiceJob.QUEUED:
+                    continue
+                job.status = ServiceJob.RUNNING
+                self._queued -= 1
+                self._running += 1
+            job.started_at = time.monotonic()
+            job.queue_time = job.started_at - job.submitted_at
+            logger.info("Job %s running on worker %d", job_id, index)
+            try:
+                workflow = ProjectWorkflow(
+                    job.spec, llm=llm, max_concurrency=self.stage_concurrency, agents=agents,
+                    resume_key=job.job_id)
+                workflow.execute()
+                job.output_dir = workflow.output_dir
+                job.status = ServiceJob.SUCCEEDED
+            except Exception as e:
+                logger.error("Job %s failed: %s", job_id, e, exc_info=True)
+                job.status = ServiceJob.FAILED
+                job.error = str(e)
+            job.finished_at = time.monotonic()
+            job.duration = job.finished_at - job.started_at
+            logger.info("Job %s %s in %.1fs", job_id, job.status, job.duration)
+            with self._lock:
+                self._running -= 1
+                self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job.status not in (ServiceJob.QUEUED, ServiceJob.RUNNING)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of a GenerationService:
+
+        POST   /jobs                       submit a spec (JSON {"spec", "priority", "id"} or plain text)
+        GET    /jobs                       all known jobs
+        GET    /jobs/<id>                  job status
+        DELETE /jobs/<id>                  cancel a queued job
+        GET    /jobs/<id>/artifacts        files of the generated project
+        GET    /jobs/<id>/artifacts/<path> one file
+        GET    /health                     queue depth, running jobs and latencies
+    """
+
+    server_version = "ProjectGenerationService/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ['health']:
+            return self._send_json(HTTPStatus.OK, self.service.stats())
+        if parts == ['jobs']:
+            with self.service._lock:
+                jobs = [job.to_dict() for job in self.service.jobs.values()]
+            return self._send_json(HTTPStatus.OK, {'jobs': jobs})
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job {parts[1]}")
+            if len(parts) == 2:
+                return self._send_json(HTTPStatus.OK, job.to_dict())
+            if parts[2] == 'artifacts':
+                if len(parts) == 3:
+                    return self._send_json(
+                        HTTPStatus.OK, {'job_id': job.job_id, 'files': self.service.artifacts(job)})
+                return self._send_artifact(job, "/".join(parts[3:]))
+        self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self):
+        if self._path_parts() != ['jobs']:
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            return self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Specification too large")
+        body = self.rfile.read(length).decode('utf-8', errors='replace')
+        query = parse_qs(urlsplit(self.path).query)
+        try:
+            if self.headers.get_content_type() == 'application/json':
+                request = json.loads(body or '{}')
+                if not isinstance(request, dict):
+                    raise ValueError("The request body must be a JSON object")
+                spec, priority, job_id = (request.get('spec', ''), request.get('priority', 0),
+                                          request.get('id'))
+            else:
+                spec, priority, job_id = body, query.get('priority', [0])[0], None
+            job = self.service.submit(spec, int(priority), job_id)
+        except QueueFull as e:
+            return self._send_error(HTTPStatus.TOO_MANY_REQUESTS, str(e), {'Retry-After': '5'})
+        except (TypeError, ValueError) as e:
+            # TypeError: a priority of the wrong JSON type
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        self._send_json(HTTPStatus.ACCEPTED, job.to_dict(), {'Location': f"/jobs/{job.job_id}"})
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            return self._send_error(HTTPStatus.NOT_FOUND, "Not found")
+        if self.service.get(parts[1]) is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown job {parts[1]}")
+        if not self.service.cancel(parts[1]):
+            return self._send_error(HTTPStatus.CONFLICT, "Only queued jobs can be cancelled")
+        self._send_json(HTTPStatus.OK, self.service.get(parts[1]).to_dict())
+
+    def _path_parts(self):
+        return [unquote(part) for part in urlsplit(self.path).path.split('/') if part]
+
+    def _send_artifact(self, job, path):
+        full_path = self.service.artifact_path(job, path)
+        if full_path is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, f"No artifact {path}")
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        content_type = mimetypes.guess_type(full_path)[0] or 'text/plain'
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', f"{content_type}; charset=utf-8")
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {'error': message}, headers)
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """The HTTP API on a Unix domain socket, for local clients only."""
+
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects an (address, port) client address
+        return request, ('local', 0)
+
+
+def create_server(service, host='127.0.0.1', port=8765, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, ServiceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve project generation as a long-running service with warm workers.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', default=None,
+                        help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Workflows running at once, each with its own warm agents")
+    parser.add_argument('--max-queue', type=int, default=32,
+                        help="Waiting jobs allowed before submissions get 429")
+    parser.add_argument('--stage-concurrency', type=int, default=3,
+                        help="Concurrent stages inside each workflow")
+    parser.add_argument('--log-json', default=None,
+                        help="Also append structured JSON-lines logs to this file")
+    args = parser.parse_args(argv)
+
+    if args.log_json:
+        configure_logging(json_path=args.log_json)
+
+    service = GenerationService(
+        workers=args.workers, max_queue=args.max_queue,
+        stage_concurrency=args.stage_concurrency)
+    service.start()
+    server = create_server(service, args.host, args.port, args.socket)
+    logger.info("Listening on %s", args.socket or f"http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        service.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Content-addressed store of the files of published projects.
+
+    cd src
+    python -m tools.blob_store stats
+    python -m tools.blob_store materialize RUN_ID [DEST]
+    python -m tools.blob_store dedupe
+    python -m tools.blob_store gc
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import errno
+import hashlib
+import argparse
+import tempfile
+
+from tools.catalog import ProjectCatalog
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class MissingBlob(LookupError):
+    """Raised when a file's content is not in the store."""
+
+
+class BlobStore:
+    """
+    Stores each distinct file content once, zlib-compressed, under the
+    SHA-256 of the uncompressed bytes (`objects/ab/cdef...`).
+
+    Project directories are materialized from the store with hardlinks.
+    Hardlinks need uncompressed bytes, so each linked blob also has one
+    read-only uncompressed copy (`checkout/ab/cdef...`) that every project
+    containing that content links to. The checkout copy is a cache: `gc`
+    removes copies no project links to any more, and they are rebuilt from
+    the compressed objects when needed. Where hardlinks are not possible
+    the files are copied instead.
+
+    Linked project files are read-only and shared: writing one in place
+    fails, and making it writable would change every project with that
+    content, so projects that will be edited should be copied out first
+    (`materialize(..., link=False)`, FileHandler.copy_project). A blob that
+    only one project uses costs more than a plain file, since both the
+    compressed object and the checkout copy are kept; the store only saves
+    space when many projects share files. That is why FileHandler uses it
+    only when BLOB_STORE=1.
+
+    The store does not know which projects use a blob; `gc` is given the
+    digests that are still referenced (the catalog's file hashes).
+    """
+
+    DIR_NAME = '.blobs'
+    COMPRESSION_LEVEL = 6
+
+    def __init__(self, root, fsync=False):
+        self.root = root
+        # fsync blobs before they are renamed into place, like FileHandler.fsync
+        self.fsync = fsync
+        self.objects_dir = os.path.join(root, 'objects')
+        self.checkout_dir = os.path.join(root, 'checkout')
+
+    @staticmethod
+    def _relative(digest):
+        return os.path.join(digest[:2], digest[2:])
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, self._relative(digest))
+
+    def checkout_path(self, digest):
+        return os.path.join(self.checkout_dir, self._relative(digest))
+
+    def has(self, digest):
+        return os.path.exists(self.object_path(digest))
+
+    def put(self, data, digest=None):
+        """Stores `data` unless its content is already stored; returns its digest."""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if os.path.exists(path):
+            # A fresh mtime keeps `gc` from collecting it before the new reference is recorded
+            os.utime(path)
+        else:
+            self._write_atomic(path, zlib.compress(data, self.COMPRESSION_LEVEL), mode=0o444)
+        return digest
+
+    def get(self, digest):
+        """The uncompressed content of a blob; raises MissingBlob."""
+        try:
+            with open(self.object_path(digest), 'rb') as f:
+                return zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise MissingBlob(f"Blob {digest} is not in {self.root}") from None
+
+    def _write_atomic(self, path, data, mode=0o644):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(temp_path, mode)
+            # Concurrent writers of the same content all produce the same file
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def _checkout(self, digest, data=None):
+        path = self.checkout_path(digest)
+        if not os.path.exists(path):
+            # Read-only, since every project linking it shares the bytes
+            self._write_atomic(path, data if data is not None else self.get(digest), mode=0o444)
+        return path
+
+    def link(self, digest, dest, data=None):
+        """
+        Replaces or creates `dest` as a hardlink to the content `digest`.
+        Returns False if the file had to be written as a copy instead.
+        """
+        temp_path = os.path.join(os.path.dirname(dest), f".tmp-link-{os.path.basename(dest)}")
+        for _ in range(2):
+            try:
+                os.link(self._checkout(digest, data), temp_path)
+                os.replace(temp_path, dest)
+                return True
+            except FileNotFoundError:
+                # `gc` removed the checkout copy between creating and linking it
+                continue
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                break
+        self._write_atomic(dest, data if data is not None else self.get(digest))
+        return False
+
+    def store_tree(self, root, contents=None, link=True):
+        """
+        Stores every file below `root` and, with `link`, replaces each by a
+        hardlink into the store. Files whose text is in `contents` (keyed by
+        path relative to `root`) are taken from memory instead of read back.
+        Returns path -> (sha256, size), as ProjectCatalog.record expects.
+        """
+        contents = contents or {}
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, root).replace(os.sep, '/')
+                if path in contents:
+                    data = contents[path].encode('utf-8')
+                else:
+                    with open(full_path, 'rb') as f:
+                        data = f.read()
+                digest = self.put(data)
+                files[path] = (digest, len(data))
+                if link and not self._linked(full_path, digest):
+                    self.link(digest, full_path, data)
+        return files
+
+    def _linked(self, path, digest):
+        checkout = self.checkout_path(digest)
+        return os.path.exists(checkout) and os.path.samefile(path, checkout)
+
+    def materialize(self, files, dest, link=True):
+        """
+        Writes a project from the store into `dest`. `files` maps relative
+        paths to digests (or to (digest, size) pairs, as in the catalog).
+        """
+        for path, digest in files.items():
+            if isinstance(digest, (tuple, list)):
+                digest = digest[0]
+            target = os.path.join(dest, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if link:
+                self.link(digest, target)
+            else:
+                self._write_atomic(target, self.get(digest))
+
+    def _blobs(self, directory):
+        """Yields (digest, path, stat) of every blob file below `directory`."""
+        if not os.path.isdir(directory):
+            return
+        for prefix in os.listdir(directory):
+            prefix_dir = os.path.join(directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(prefix_dir, name)
+                yield prefix + name, path, os.stat(path)
+
+    def usage(self):
+        """Blob counts and bytes on disk of the compressed objects and the checkout copies."""
+        objects = [stat.st_size for _, _, stat in self._blobs(self.objects_dir)]
+        checkout = [stat.st_size for _, _, stat in self._blobs(self.checkout_dir)]
+        return {
+            'objects': len(objects),
+            'object_bytes': sum(objects),
+            'checkout_files': len(checkout),
+            'checkout_bytes': sum(checkout),
+        }
+
+    def gc(self, referenced, grace_seconds=3600):
+        """
+        Deletes checkout copies no project links to, and compressed objects
+        not in `referenced` that are older than `grace_seconds` (younger ones
+        may belong to a save that has not recorded its references yet).
+        Returns the number of files and bytes freed.
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - grace_seconds
+        freed_files = freed_bytes = 0
+        for digest, path, stat in self._blobs(self.checkout_dir):
+            if stat.st_nlink == 1:
+                os.unlink(path)
+                freed_files += 1
+                freed_bytes += stat.st_size
+        for digest, path, stat in self._blobs(self.objects_dir):
+            if digest not in referenced and stat.st_mtime < cutoff:
+                os.unlink(path)
+                freed_files += 1
+                freed_bytes += stat.st_size
+        return freed_files, freed_bytes
+
+
+def dedup_report(store, catalog):
+    """
+    Logical bytes of all catalogued project files against what the store
+    keeps on disk. `dedup_ratio` counts identical contents once;
+    `storage_ratio` also includes compression.
+    """
+    totals = catalog.file_totals()
+    logical_bytes, unique_bytes = totals['logical_bytes'], totals['unique_bytes']
+    usage = store.usage()
+    stored_bytes = usage['object_bytes'] + usage['checkout_bytes']
+    report = dict(totals)
+    report.update({
+        'dedup_ratio': logical_bytes / unique_bytes if unique_bytes else None,
+        'storage_ratio': logical_bytes / stored_bytes if stored_bytes else None,
+    })
+    report.update(usage)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('--projects', default='generated_projects',
+                        help="Directory holding the published projects, the catalog and the store")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help="Deduplication ratio and bytes on disk")
+
+    materialize = commands.add_parser(
+        'materialize', help="Write a catalogued run's project from the store")
+    materialize.add_argument('run_id')
+    materialize.add_argument('dest', nargs='?',
+                             help="Target directory (default: the run's project directory)")
+    materialize.add_argument('--copy', action='store_true',
+                             help="Write independent copies instead of hardlinks")
+
+    commands.add_parser(
+        'dedupe', help="Move the files of catalogued projects into the store and hardlink them")
+
+    gc = commands.add_parser('gc', help="Delete blobs no catalogued run references")
+    gc.add_argument('--grace-seconds', type=float, default=3600)
+    gc.add_argument('--forget-missing', action='store_true',
+                    help="First drop catalog runs whose project directory was deleted")
+    args = parser.parse_args(argv)
+
+    catalog = ProjectCatalog(os.path.join(args.projects, ProjectCatalog.FILE_NAME))
+    store = BlobStore(os.path.join(args.projects, BlobStore.DIR_NAME))
+
+    if args.command == 'stats':
+        print(json.dumps(dedup_report(store, catalog), indent=2))
+    elif args.command == 'materialize':
+        run = catalog.get(args.run_id)
+        if run is None:
+            print(f"Unknown run {args.run_id}")
+            return 1
+        dest = args.dest or run['project_dir']
+        store.materialize({file['path']: file['sha256'] for file in run['files']}, dest,
+                          link=not args.copy)
+        print(f"Materialized {len(run['files'])} files into {dest}")
+    elif args.command == 'dedupe':
+        linked = 0
+        for _, project_dir in catalog.project_dirs():
+            if os.path.isdir(project_dir):
+                store.store_tree(project_dir)
+                linked += 1
+        print(f"Stored {linked} projects")
+        print(json.dumps(dedup_report(store, catalog), indent=2))
+    elif args.command == 'gc':
+        if args.forget_missing:
+            for run_id, project_dir in catalog.project_dirs():
+                if not os.path.isdir(project_dir):
+                    catalog.remove(run_id)
+        files, freed = store.gc(catalog.file_hashes(), args.grace_seconds)
+        print(f"Deleted {files} blob files, {freed} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
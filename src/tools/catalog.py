@@ -0,0 +1,354 @@
+"""
+Catalog of the projects published under generated_projects/.
+
+    cd src
+    python -m tools.catalog find --language python --verdict approved
+    python -m tools.catalog find --spec config/project_spec.txt
+    python -m tools.catalog show RUN_ID
+    python -m tools.catalog reindex
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def spec_hash(spec):
+    """Hash of a specification, ignoring leading and trailing whitespace."""
+    return hashlib.sha256(spec.strip().encode('utf-8')).hexdigest()
+
+
+class ProjectCatalog:
+    """
+    SQLite index of published projects: one row per run (run id, project
+    directory, spec hash, language, review verdict, timings) and one per
+    file (path, SHA-256, size). Every column a query filters on is indexed,
+    so lookups stay fast with hundreds of thousands of runs.
+
+    The catalog lives next to the projects in a hidden file, which scans
+    for project directories skip. Projects published before it existed,
+    or while it could not be written, are added by `reindex`.
+    """
+
+    FILE_NAME = '.catalog.sqlite'
+    # Matching file rows above which a file filter is checked per run instead
+    COMMON_FILE_MATCHES = 1000
+
+    RUN_COLUMNS = ('run_id', 'project_dir', 'created_at', 'kind', 'spec_hash', 'language',
+                   'review_verdict', 'parent_run_id', 'total_time', 'stage_times',
+                   'file_count', 'total_bytes')
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                " run_id TEXT PRIMARY KEY,"
+                " project_dir TEXT NOT NULL UNIQUE,"
+                " created_at REAL NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " spec_hash TEXT,"
+                " language TEXT,"
+                " review_verdict TEXT,"
+                " parent_run_id TEXT,"
+                " total_time REAL,"
+                " stage_times TEXT,"
+                " file_count INTEGER NOT NULL,"
+                " total_bytes INTEGER NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,"
+                " path TEXT NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " PRIMARY KEY (run_id, path)) WITHOUT ROWID")
+            for name, columns in (('runs_created_at', 'runs (created_at)'),
+                                  ('runs_spec_hash', 'runs (spec_hash, created_at)'),
+                                  ('runs_language', 'runs (language, created_at)'),
+                                  ('runs_review_verdict', 'runs (review_verdict, created_at)'),
+                                  ('files_sha256', 'files (sha256)'),
+                                  ('files_path', 'files (path)')):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def record(self, run_id, project_dir, files, kind='generate', spec=None, language=None,
+               review_verdict=None, parent_run_id=None, metrics=None, created_at=None):
+        """
+        Adds a published project. `files` maps paths relative to the project
+        to (sha256, size). Timings come from a MetricsRecorder, if given.
+        """
+        stage_times = None
+        total_time = None
+        if metrics is not None:
+            total_time = metrics.total_time
+            stage_times = json.dumps(
+                {name: round(stage.wall_time, 3) for name, stage in metrics.stages.items()})
+        row = (run_id, project_dir, created_at or time.time(), kind,
+               spec_hash(spec) if spec else None, language.lower() if language else None,
+               review_verdict, parent_run_id, total_time, stage_times,
+               len(files), sum(size for _, size in files.values()))
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO runs ({', '.join(self.RUN_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(self.RUN_COLUMNS))})", row)
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (run_id, path, sha256, size) VALUES (?, ?, ?, ?)",
+                [(run_id, path, digest, size) for path, (digest, size) in files.items()])
+
+    def get(self, run_id):
+        """A run with its files, or None."""
+        conn = self._connection()
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = self._run(row)
+        run['files'] = [dict(file) for file in conn.execute(
+            "SELECT path, sha256, size FROM files WHERE run_id = ? ORDER BY path", (run_id,))]
+        return run
+
+    def for_project_dir(self, project_dir):
+        row = self._connection().execute(
+            "SELECT * FROM runs WHERE project_dir = ?", (project_dir,)).fetchone()
+        return self._run(row) if row else None
+
+    def find(self, spec=None, spec_hash_prefix=None, language=None, review_verdict=None,
+             kind=None, since=None, until=None, file_path=None, file_sha256=None, limit=50):
+        """
+        Runs matching every given filter, newest first. `since`/`until` are
+        Unix timestamps; `file_path` and `file_sha256` match runs containing
+        such a file.
+        """
+        clauses, params = [], []
+        if spec is not None:
+            clauses.append("spec_hash = ?")
+            params.append(spec_hash(spec))
+        if spec_hash_prefix:
+            # A range keeps the spec_hash index usable
+            clauses.append("spec_hash >= ? AND spec_hash < ?")
+            params.extend([spec_hash_prefix, spec_hash_prefix + 'g'])
+        for column, value in (('language', language and language.lower()),
+                              ('review_verdict', review_verdict), ('kind', kind)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        conn = self._connection()
+        for column, value in (('path', file_path), ('sha256', file_sha256)):
+            if value is not None:
+                clauses.append(self._file_clause(conn, column, value))
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = conn.execute(
+            f"SELECT * FROM runs {where} ORDER BY created_at DESC LIMIT ?", params + [limit])
+        return [self._run(row) for row in rows]
+
+    def _file_clause(self, conn, column, value):
+        """
+        A filter on runs containing a matching file. A rare file is looked up
+        in the files index first; a common one (a path every run has) is
+        checked run by run while walking the runs newest first, which stops
+        at the limit instead of collecting every matching run.
+        """
+        matches = conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM files WHERE {column} = ? LIMIT ?)",
+            (value, self.COMMON_FILE_MATCHES)).fetchone()[0]
+        if matches < self.COMMON_FILE_MATCHES:
+            return f"run_id IN (SELECT run_id FROM files WHERE {column} = ?)"
+        return (f"EXISTS (SELECT 1 FROM files WHERE files.run_id = runs.run_id "
+                f"AND files.{column} = ?)")
+
+    def latest(self, **filters):
+        """The newest run matching `find` filters, or None."""
+        runs = self.find(limit=1, **filters)
+        return runs[0] if runs else None
+
+    def remove(self, run_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    def project_dirs(self):
+        """(run_id, project_dir) of every run."""
+        return [tuple(row) for row in self._connection().execute(
+            "SELECT run_id, project_dir FROM runs")]
+
+    def file_hashes(self):
+        """The distinct file hashes of all runs."""
+        return {row[0] for row in self._connection().execute("SELECT DISTINCT sha256 FROM files")}
+
+    def file_totals(self):
+        """File references and bytes over all runs, and the same counting identical contents once."""
+        conn = self._connection()
+        references, logical_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        unique_contents, unique_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "
+            "(SELECT sha256, MAX(size) AS size FROM files GROUP BY sha256)").fetchone()
+        return {
+            'file_references': references,
+            'unique_contents': unique_contents,
+            'logical_bytes': logical_bytes,
+            'unique_bytes': unique_bytes,
+        }
+
+    def stats(self):
+        conn = self._connection()
+        runs, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(total_bytes), 0) FROM runs").fetchone()
+        return {
+            'runs': runs,
+            'total_bytes': total_bytes,
+            'languages': dict(conn.execute(
+                "SELECT COALESCE(language, '?'), COUNT(*) FROM runs GROUP BY language")),
+            'verdicts': dict(conn.execute(
+                "SELECT COALESCE(review_verdict, '?'), COUNT(*) FROM runs GROUP BY review_verdict")),
+        }
+
+    @staticmethod
+    def _run(row):
+        run = dict(row)
+        if run.get('stage_times'):
+            run['stage_times'] = json.loads(run['stage_times'])
+        return run
+
+    @staticmethod
+    def hash_files(project_dir, contents=None):
+        """
+        path -> (sha256, size) of every file below `project_dir`. Files whose
+        text is in `contents` are hashed from memory instead of read back.
+        """
+        contents = contents or {}
+        files = {}
+        for directory, _, names in os.walk(project_dir):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, project_dir).replace(os.sep, '/')
+                if path in contents:
+                    data = contents[path].encode('utf-8')
+                else:
+                    with open(full_path, 'rb') as f:
+                        data = f.read()
+                files[path] = (hashlib.sha256(data).hexdigest(), len(data))
+        return files
+
+    def reindex(self, base_output_dir):
+        """
+        Adds every published project under `base_output_dir` that the
+        catalog does not know yet, reading what it can from the project's
+        manifest. Returns the number of projects added.
+        """
+        # Imported here: the catalog is also used without the agents
+        from utils.utils import extract_json
+
+        conn = self._connection()
+        known = {row[0] for row in conn.execute("SELECT project_dir FROM runs")}
+        added = 0
+        for name in sorted(os.listdir(base_output_dir)):
+            project_dir = os.path.join(base_output_dir, name)
+            if name.startswith('.') or not os.path.isdir(project_dir) or project_dir in known:
+                continue
+            manifest = {}
+            manifest_path = os.path.join(project_dir, 'manifest.json')
+            if os.path.isfile(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    objects = extract_json(f.read())
+                if objects and isinstance(objects[0], dict):
+                    manifest = objects[0]
+            self.record(f"dir-{name}", project_dir, self.hash_files(project_dir),
+                        kind='unknown', language=manifest.get('language'),
+                        created_at=os.path.getmtime(project_dir))
+            added += 1
+        return added
+
+
+def print_runs(runs):
+    for run in runs:
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['created_at']))
+        total_time = f"{run['total_time']:.1f}s" if run['total_time'] is not None else '-'
+        print(f"{run['run_id']:<16} {created}  {run['kind']:<8} {run['language'] or '-':<12} "
+              f"{run['review_verdict'] or '-':<18} {total_time:>8}  {run['project_dir']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument('--projects', default='generated_projects',
+                        help="Directory holding the published projects and the catalog")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    find = commands.add_parser('find', help="List runs, newest first")
+    find.add_argument('--spec', help="Specification file whose runs to list")
+    find.add_argument('--spec-hash', help="Spec hash or a prefix of it")
+    find.add_argument('--language')
+    find.add_argument('--verdict', choices=('approved', 'revisions_required'))
+    find.add_argument('--kind', choices=('generate', 'feature', 'unknown'))
+    find.add_argument('--since', type=float, help="Unix timestamp")
+    find.add_argument('--file', help="Only runs containing this file path")
+    find.add_argument('--sha256', help="Only runs containing a file with this hash")
+    find.add_argument('--limit', type=int, default=20)
+    find.add_argument('--json', action='store_true')
+
+    show = commands.add_parser('show', help="One run with its files")
+    show.add_argument('run_id')
+
+    commands.add_parser('stats', help="Run counts by language and review verdict")
+    commands.add_parser('reindex', help="Add projects that are not in the catalog yet")
+    args = parser.parse_args(argv)
+
+    catalog = ProjectCatalog(os.path.join(args.projects, ProjectCatalog.FILE_NAME))
+    if args.command == 'find':
+        spec = None
+        if args.spec:
+            with open(args.spec, 'r') as f:
+                spec = f.read()
+        runs = catalog.find(
+            spec=spec, spec_hash_prefix=args.spec_hash, language=args.language,
+            review_verdict=args.verdict, kind=args.kind, since=args.since,
+            file_path=args.file, file_sha256=args.sha256, limit=args.limit)
+        if args.json:
+            print(json.dumps(runs, indent=2))
+        else:
+            print_runs(runs)
+    elif args.command == 'show':
+        run = catalog.get(args.run_id)
+        if run is None:
+            print(f"Unknown run {args.run_id}")
+            return 1
+        print(json.dumps(run, indent=2))
+    elif args.command == 'stats':
+        print(json.dumps(catalog.stats(), indent=2))
+    elif args.command == 'reindex':
+        print(f"Added {catalog.reindex(args.projects)} projects")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,41 +1,92 @@
 import os 
+import errno
 import shutil
-import re
-from typing import List
-import json
+import uuid
+import sqlite3
 
 
 from datetime import datetime
 
+from tools.blob_store import BlobStore
+from tools.catalog import ProjectCatalog
+from utils.custom_logger import get_logger
+from utils.tracing import NULL_TRACER
+
+
+logger = get_logger(__name__)
+
+
 class FileHandler:
-    def __init__(self):
+    def __init__(self, fsync=None, tracer=None, catalog=None, blob_store=None):
         self.base_output_dir = "generated_projects"
-
-    def move_files(self, src_dir, dest_dir):
-        # Ensure the destination directory exists
-        os.makedirs(dest_dir, exist_ok=True)
-
-        # Walk through the source directory
-        for root, dirs, files in os.walk(src_dir):
-            # Calculate the relative path from the source directory
-            rel_path = os.path.relpath(root, src_dir)
-            # Create the corresponding directory structure in the destination
-            dest_path = os.path.join(dest_dir, rel_path)
-            os.makedirs(dest_path, exist_ok=True)
-
-            # Move each file
-            for file in files:
-                src_file = os.path.join(root, file)
-                dest_file = os.path.join(dest_path, file)
-                shutil.move(src_file, dest_file)
-                print(f"Moved: {src_file} to {dest_file}")
-
-    def cleanup_directories(self, src_dir):
-        remaining_directories = [f for f in os.listdir(src_dir)]
-        for d in remaining_directories:
-            cleanup_dir = "/".join([src_dir, d])
-            print(f"Move Cleanup: {src_dir}, removing {cleanup_dir}")
-            shutil.rmtree(cleanup_dir, ignore_errors=True)
+        # Receives spans for the file I/O below; the workflow sets it per run
+        self.tracer = tracer or NULL_TRACER
+        # fsync published projects before they become visible (PUBLISH_FSYNC=1)
+        if fsync is None:
+            fsync = os.environ.get("PUBLISH_FSYNC", "0") == "1"
+        self.fsync = fsync
+        # Per-run staging directories; must stay relative for crewai output_file paths
+        self.workspace_root = os.environ.get("WORKSPACE_ROOT", ".workspaces")
+        # Index of published projects; opened on the first save unless PROJECT_CATALOG=0
+        self.catalog = catalog
+        self.use_catalog = catalog is not None or os.environ.get("PROJECT_CATALOG", "1") != "0"
+        # Content-addressed store that published files are hardlinked from when
+        # BLOB_STORE=1; off by default since the links are read-only and shared
+        self.blob_store = blob_store
+        self.use_blob_store = blob_store is not None or (
+            self.use_catalog and os.environ.get("BLOB_STORE", "0") == "1")
+
+    def get_catalog(self):
+        """The ProjectCatalog of `base_output_dir`, or None when cataloguing is off."""
+        if self.catalog is None and self.use_catalog:
+            self.catalog = ProjectCatalog(
+                os.path.join(self.base_output_dir, ProjectCatalog.FILE_NAME))
+        return self.catalog
+
+    def get_blob_store(self):
+        """The BlobStore of `base_output_dir`, or None when it is off."""
+        if self.blob_store is None and self.use_blob_store:
+            self.blob_store = BlobStore(
+                os.path.join(self.base_output_dir, BlobStore.DIR_NAME), fsync=self.fsync)
+        return self.blob_store
+
+    def create_workspace(self, run_id):
+        """Creates the private staging directory that a run's tasks write into."""
+        workspace = os.path.join(self.workspace_root, run_id)
+        with self.tracer.span('create_workspace', category='io', path=workspace):
+            os.makedirs(workspace)
+        return workspace
+
+    def remove_workspace(self, workspace):
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    def latest_project(self):
+        """The most recently published project directory, or None if there is none."""
+        if not os.path.isdir(self.base_output_dir):
+            return None
+        catalog_path = os.path.join(self.base_output_dir, ProjectCatalog.FILE_NAME)
+        if self.use_catalog and os.path.exists(catalog_path):
+            # An indexed lookup instead of a stat of every project directory
+            run = self.get_catalog().latest()
+            if run is not None and os.path.isdir(run['project_dir']):
+                return run['project_dir']
+        candidates = []
+        for name in os.listdir(self.base_output_dir):
+            path = os.path.join(self.base_output_dir, name)
+            # Hidden directories are projects still being assembled
+            if not name.startswith('.') and os.path.isdir(path):
+                candidates.append((os.path.getmtime(path), name, path))
+        return max(candidates)[2] if candidates else None
+
+    def copy_project(self, project_dir, dest_dir, exclude=()):
+        """Copies a published project into `dest_dir`, leaving out the top-level files in `exclude`."""
+        with self.tracer.span('copy_project', category='io', source=project_dir):
+            # copyfile: published files may be read-only hardlinks into the blob store
+            shutil.copytree(
+                project_dir, dest_dir, dirs_exist_ok=True, copy_function=shutil.copyfile,
+                ignore=lambda directory, names: [
+                    name for name in names
+                    if name in exclude and os.path.samefile(directory, project_dir)])
 
     def read_specification(self, file_path):
         """
@@ -49,51 +100,188 @@ class FileHandler:
 
         return content
 
-    def save_project_files(self, project_files):
+    def save_project_files(self, project_files, metrics=None, staging_dir=None,
+                           metadata_files=None, run_info=None, project_name=None):
         """
         Saves generated project files to disk in an organized structure.
 
+        The project is assembled in a hidden temporary directory next to its
+        final location and published with a single atomic rename, so readers
+        never see a half-written project. The run's `staging_dir`, if given,
+        becomes the assembly directory (one rename instead of a move per
+        file), and the generated files, summary, `metadata_files` and metrics
+        are written into it in one batch. When `self.fsync` is set the whole
+        tree is fsynced once, right before the rename.
+
+        With the blob store enabled, every file is moved into it before
+        publishing and replaced by a read-only hardlink, so identical files
+        of different runs share their storage. The published project is then
+        recorded in the
+        catalog together with `run_info` (run_id, kind, spec, language,
+        review_verdict, parent_run_id); the run id also makes the directory
+        name unique. A `project_name` replaces the timestamped name; if it is
+        taken, the project gets a numbered directory next to it.
+
         Directory structure:
         generated_projects/
-        ├── YYYY-MM-DD_HH-MM-SS/  # Timestamp-based project folder
+        ├── YYYY-MM-DD_HH-MM-SS_<run id>/  # Timestamp-based project folder
         │   ├── src/              # Source code
         │   ├── tests/            # Test files
         │   ├── docs/             # Documentation
         │   └── README.md         # Project documentation
         """
-        # Create timestamp-based project directory
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        project_dir = os.path.join(self.base_output_dir, timestamp)
-
-        if not os.path.exists(project_dir):
-            os.makedirs(project_dir)
-
-        for file_path, content in project_files.items():
-            # Construct full path within project directory
-            full_path = os.path.join(project_dir, file_path)
-
-            # Create directory if it doesn't exist
-            directory = os.path.dirname(full_path)
-            if directory and not os.path.exists(directory):
-                os.makedirs(directory)
-
-            # Save the file
-            with open(full_path, 'w') as file:
-                file.write(content)
-
-        # Create a summary file
-        summary_path = os.path.join(project_dir, "generation_summary.txt")
-        with open(summary_path, 'w') as f:
-            f.write(f"Project generated at: {timestamp}\n")
-            f.write("Generated files:\n")
-            for file_path in project_files.keys():
-                f.write(f"- {file_path}\n")
-
-        # move source to the project directory
-        src_directory = './src'
-        self.move_files(src_directory, project_dir)
-        self.cleanup_directories(src_directory)
+        run_info = run_info or {}
+        created_at = datetime.now()
+        timestamp = created_at.strftime("%Y-%m-%d_%H-%M-%S")
+        os.makedirs(self.base_output_dir, exist_ok=True)
+        assembly_dir = os.path.join(self.base_output_dir, f".tmp-{uuid.uuid4().hex}")
+
+        with self.tracer.span('save_project_files', category='io',
+                              files=len(project_files)) as span:
+            try:
+                self._adopt_staging_dir(staging_dir, assembly_dir)
+
+                # Create a summary file
+                summary = [f"Project generated at: {timestamp}\n"]
+                if run_info.get('run_id'):
+                    summary.append(f"Run id: {run_info['run_id']}\n")
+                summary.append("Generated files:\n")
+                summary.extend(f"- {file_path}\n" for file_path in project_files.keys())
+                if metrics is not None:
+                    summary.append("\nStage metrics:\n")
+                    summary.append(metrics.summary())
+
+                files = dict(project_files)
+                files.update(metadata_files or {})
+                files["generation_summary.txt"] = "".join(summary)
+                self._write_files(assembly_dir, files)
+                if metrics is not None:
+                    with self.tracer.span('write_metrics', category='io'):
+                        metrics.write(assembly_dir)
+
+                file_hashes = self._store_blobs(assembly_dir, files)
+                name = project_name or (
+                    f"{timestamp}_{run_info['run_id']}" if run_info.get('run_id') else timestamp)
+                project_dir = self._publish(assembly_dir, name)
+                span.set(project_dir=project_dir)
+            except BaseException:
+                shutil.rmtree(assembly_dir, ignore_errors=True)
+                raise
+            self._catalog_project(project_dir, files, file_hashes, metrics, run_info,
+                                  created_at.timestamp())
+            return project_dir
+
+    def _store_blobs(self, assembly_dir, files):
+        """
+        Moves the assembled files into the blob store and hardlinks them back.
+        Returns their (sha256, size) by path, or None if the store is off or
+        failed, in which case the project keeps plain files.
+        """
+        if not self.use_blob_store:
+            return None
+        with self.tracer.span('store_blobs', category='io') as span:
+            try:
+                file_hashes = self.get_blob_store().store_tree(assembly_dir, files)
+            except OSError as e:
+                logger.warning("Could not move %s into the blob store: %s", assembly_dir, e)
+                return None
+            span.set(files=len(file_hashes))
+        return file_hashes
+
+    def _catalog_project(self, project_dir, files, file_hashes, metrics, run_info, created_at):
+        """Records a published project in the catalog. A failure only costs the catalog entry."""
+        if not self.use_catalog:
+            return
+        with self.tracer.span('catalog_project', category='io'):
+            try:
+                catalog = self.get_catalog()
+                info = dict(run_info)
+                catalog.record(
+                    info.pop('run_id', None) or uuid.uuid4().hex[:12], project_dir,
+                    file_hashes or catalog.hash_files(project_dir, files), metrics=metrics,
+                    created_at=created_at, **info)
+            except sqlite3.Error as e:
+                logger.warning("Could not add %s to the catalog "
+                               "(recover with `python -m tools.catalog reindex`): %s", project_dir, e)
+
+    def _adopt_staging_dir(self, staging_dir, assembly_dir):
+        """Turns the staging directory into the assembly directory, copying only across filesystems."""
+        with self.tracer.span('adopt_staging_dir', category='io') as span:
+            if staging_dir is None or not os.path.isdir(staging_dir):
+                os.makedirs(assembly_dir)
+                span.set(method='mkdir')
+                return
+            try:
+                os.rename(staging_dir, assembly_dir)
+                span.set(method='rename')
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copytree(staging_dir, assembly_dir)
+                self.remove_workspace(staging_dir)
+                span.set(method='copy')
+
+    def _write_files(self, root, files):
+        """Writes a batch of files below `root`, creating each directory once."""
+        with self.tracer.span('write_files', category='io', files=len(files)) as span:
+            for directory in {os.path.dirname(os.path.join(root, path)) for path in files}:
+                os.makedirs(directory, exist_ok=True)
+            written = 0
+            for file_path, content in files.items():
+                with open(os.path.join(root, file_path), 'w') as file:
+                    written += file.write(content)
+            span.set(output_chars=written)
+
+    def _sync_tree(self, root):
+        """
+        fsyncs every file and directory below `root` when durability is
+        requested. Blobs are synced by the BlobStore as they are written.
+        """
+        if not self.fsync:
+            return
+        with self.tracer.span('fsync_tree', category='io'):
+            self._sync_files(root)
+
+    def _sync_files(self, root):
+        for directory, _, files in os.walk(root):
+            for name in files:
+                fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            self._sync_directory(directory)
 
+    @staticmethod
+    def _sync_directory(directory):
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _publish(self, assembly_dir, base_name):
+        """Atomically renames the assembled project to the directory `base_name`."""
+        self._sync_tree(assembly_dir)
+        with self.tracer.span('publish', category='io', fsync=self.fsync) as span:
+            name = base_name
+            suffix = 1
+            while True:
+                project_dir = os.path.join(self.base_output_dir, name)
+                # A name that is taken gets a numbered directory
+                if not os.path.exists(project_dir):
+                    try:
+                        os.rename(assembly_dir, project_dir)
+                        break
+                    except OSError as e:
+                        if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                            raise
+                suffix += 1
+                name = f"{base_name}_{suffix}"
+            if self.fsync:
+                self._sync_directory(self.base_output_dir)
+            span.set(project_dir=project_dir)
+        logger.info("Published project to %s", project_dir)
         return project_dir
 
 
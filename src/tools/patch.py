@@ -0,0 +1,126 @@
+import re
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+FENCE = re.compile(r"\A\s*```[\w.+-]*[ \t]*\n(.*?)\n?```\s*\Z", re.DOTALL)
+
+
+class PatchError(ValueError):
+    """A diff that cannot be parsed or does not apply to the file."""
+
+
+class Hunk:
+    def __init__(self, old_start):
+        # 1-based line the hunk claims to start at; only a hint
+        self.old_start = old_start
+        self.lines = []
+
+    @property
+    def old(self):
+        return [line for tag, line in self.lines if tag in ' -']
+
+    @property
+    def new(self):
+        return [line for tag, line in self.lines if tag in ' +']
+
+
+def _starts_section(lines, number):
+    """Whether lines[number] opens a file section: a `diff ` line or `--- `, `+++ `, `@@`."""
+    line = lines[number]
+    if line.startswith('diff '):
+        return True
+    following = lines[number + 1:number + 3]
+    return (line.startswith('--- ') and len(following) == 2
+            and following[0].startswith('+++ ') and HUNK_HEADER.match(following[1]) is not None)
+
+
+def parse_unified_diff(diff):
+    """
+    Returns the hunks of a single-file unified diff, ignoring file headers.
+
+    `--- `/`+++ ` lines are file headers only before the first hunk of a
+    file section; inside a hunk they remove or add lines starting with
+    `-- ` or `++ `. A section starts at a `diff ` line or at a `--- `,
+    `+++ `, `@@` sequence.
+    """
+    match = FENCE.match(diff)
+    if match:
+        diff = match.group(1)
+    lines = diff.splitlines()
+    hunks = []
+    in_header = True
+    for number, line in enumerate(lines):
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append(Hunk(int(header.group(1))))
+            in_header = False
+        elif _starts_section(lines, number):
+            in_header = True
+        elif in_header or line.startswith('\\'):
+            continue
+        elif line[:1] in (' ', '-', '+'):
+            hunks[-1].lines.append((line[0], line[1:]))
+        elif not line.strip():
+            # Editors and models drop the space of empty context lines
+            hunks[-1].lines.append((' ', ''))
+        else:
+            raise PatchError(f"unexpected line in hunk {len(hunks)}: {line[:60]!r}")
+    if not hunks:
+        raise PatchError("no hunks found in the diff")
+    return hunks
+
+
+def _matches(lines, index, old, loose):
+    if loose:
+        return all(lines[index + offset].strip() == line.strip() for offset, line in enumerate(old))
+    return lines[index:index + len(old)] == old
+
+
+def _locate(lines, old, expected, start):
+    """Index of the occurrence of `old` at or after `start` closest to `expected`."""
+    last = len(lines) - len(old)
+    for loose in (False, True):
+        candidates = [index for index in range(start, last + 1)
+                      if _matches(lines, index, old, loose)]
+        if candidates:
+            return min(candidates, key=lambda index: abs(index - expected))
+    return None
+
+
+def apply_unified_diff(original, diff):
+    """
+    Applies a single-file unified diff to `original` and returns the result.
+
+    Line numbers in hunk headers are only used to choose between several
+    places a hunk's context matches, since generated diffs often get them
+    wrong. Context that differs only in indentation or trailing whitespace
+    still matches, and the file's own text is kept for it. Raises
+    PatchError when a hunk's context is not found.
+    """
+    lines = original.splitlines()
+    result = []
+    position = 0
+    for number, hunk in enumerate(parse_unified_diff(diff), 1):
+        old = hunk.old
+        if not old:
+            # Pure insertion after line `old_start`
+            index = min(max(hunk.old_start, position), len(lines))
+        else:
+            index = _locate(lines, old, hunk.old_start - 1, position)
+            if index is None:
+                raise PatchError(
+                    f"hunk {number} does not apply: its context near line "
+                    f"{hunk.old_start} is not in the file")
+        result.extend(lines[position:index])
+        # Context lines keep the file's text, which may differ in whitespace
+        # from the diff's when the hunk matched loosely
+        position = index
+        for tag, line in hunk.lines:
+            if tag == '+':
+                result.append(line)
+                continue
+            if tag == ' ':
+                result.append(lines[position])
+            position += 1
+    result.extend(lines[position:])
+    return "\n".join(result) + ("\n" if original.endswith("\n") or not original else "")
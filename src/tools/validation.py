@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.file_hanler import ProjectValidator
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class ValidationResult:
+    def __init__(self, path, checker, errors=(), warnings=(), seconds=0.0):
+        self.path = path
+        self.checker = checker
+        self.errors = list(errors)
+        self.warnings = list(warnings)
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def feedback(self):
+        """The errors phrased as instructions for regenerating the artifact."""
+        problems = "\n".join(f"- {error}" for error in self.errors)
+        return (
+            f"Your previous answer for {self.path} failed the {self.checker} check:\n"
+            f"{problems}\n"
+            "Return the complete, corrected file.")
+
+    def to_dict(self):
+        return {
+            'checker': self.checker,
+            'ok': self.ok,
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'seconds': self.seconds,
+        }
+
+
+class ArtifactValidator:
+    """
+    Static checks for generated artifacts, picked by file type:
+    compiling Python, `bash -n` for shell scripts, JSON parsing for
+    manifests and structural checks for IDL. Everything else only has to
+    be non-empty. `validate_all` checks a whole project concurrently.
+
+    A single markdown code fence around the whole file is removed before
+    checking, since agents often wrap their answer in one.
+    """
+
+    FENCE = re.compile(r"\A\s*```[\w.+-]*[ \t]*\n(.*?)\n?```\s*\Z", re.DOTALL)
+    COMMENTS = re.compile(r"//[^\n]*|/\*.*?\*/", re.DOTALL)
+    SHELL_EXTENSIONS = ('.sh', '.bash')
+
+    def __init__(self, max_workers=4, bash='bash', timeout=10):
+        self.max_workers = max_workers
+        self.bash = bash
+        self.timeout = timeout
+
+    @classmethod
+    def strip_fence(cls, content):
+        match = cls.FENCE.match(content)
+        return match.group(1) if match else content
+
+    def checker_for(self, path, content):
+        """Returns (name, check) for the artifact; checks return (errors, warnings)."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.py':
+            return 'python', self.check_python
+        if extension in self.SHELL_EXTENSIONS or (
+                content.startswith('#!') and content.split('\n', 1)[0].endswith('sh')):
+            return 'bash', self.check_shell
+        if extension == '.json':
+            return 'json', self.check_json
+        if extension == '.idl':
+            return 'idl', self.check_idl
+        return 'non-empty', self.check_not_empty
+
+    def validate(self, path, content, allow_empty=False):
+        started = time.perf_counter()
+        body = self.strip_fence(content or "")
+        name, check = self.checker_for(path, body.lstrip())
+        if not body.strip():
+            errors, warnings = ([], []) if allow_empty else (["file is empty"], [])
+        else:
+            errors, warnings = check(path, body)
+        return ValidationResult(path, name, errors, warnings, time.perf_counter() - started)
+
+    def validate_all(self, files, allow_empty=()):
+        """
+        Validates a dict of path -> content concurrently; returns path ->
+        ValidationResult. Paths in `allow_empty` are meant to be empty.
+        """
+        if not files:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(files)),
+                                thread_name_prefix="validate") as executor:
+            futures = {path: executor.submit(self.validate, path, content, path in allow_empty)
+                       for path, content in files.items()}
+            return {path: future.result() for path, future in futures.items()}
+
+    @staticmethod
+    def check_python(path, source):
+        try:
+            compile(source, path, 'exec', dont_inherit=True)
+        except SyntaxError as e:
+            return [f"line {e.lineno}: {e.msg}"], []
+        except ValueError as e:
+            # e.g. null bytes in the source
+            return [str(e)], []
+        return [], []
+
+    def check_shell(self, path, script):
+        try:
+            completed = subprocess.run(
+                [self.bash, '-n'], input=script, capture_output=True, text=True,
+                timeout=self.timeout)
+        except FileNotFoundError:
+            return [], [f"{self.bash} not found, syntax not checked"]
+        except subprocess.TimeoutExpired:
+            return [], [f"{self.bash} -n timed out"]
+        if completed.returncode != 0:
+            # bash reports the script as "bash: line N: ..." when it is read from stdin
+            return [line.replace(f"{self.bash}: ", "", 1)
+                    for line in completed.stderr.strip().splitlines()], []
+        return [], []
+
+    @staticmethod
+    def check_json(path, text):
+        try:
+            json.loads(text)
+        except ValueError as e:
+            return [f"invalid JSON: {e}"], []
+        return [], []
+
+    @classmethod
+    def check_idl(cls, path, idl):
+        errors = []
+        try:
+            ProjectValidator.validate_idl_output(idl)
+        except ValueError as e:
+            errors.append(str(e))
+        # Braces must balance once comments are removed (commented-out IDL is fine)
+        depth = 0
+        for line_number, line in enumerate(cls.COMMENTS.sub("", idl).splitlines(), 1):
+            for char in line:
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth < 0:
+                        errors.append(f"line {line_number}: unmatched '}}'")
+                        depth = 0
+        if depth > 0:
+            errors.append(f"{depth} unclosed '{{'")
+        return errors, []
+
+    @staticmethod
+    def check_not_empty(path, text):
+        return [], []
+
+    @staticmethod
+    def report(results):
+        """A JSON-serialisable summary of `validate_all` results."""
+        return {
+            'ok': all(result.ok for result in results.values()),
+            'files': {path: result.to_dict() for path, result in sorted(results.items())},
+        }
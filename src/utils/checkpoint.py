@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from urllib.parse import quote, unquote
+
+from utils.custom_logger import get_logger
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; runs there do not lock their checkpoints
+    fcntl = None
+
+
+logger = get_logger(__name__)
+
+
+class CheckpointStore:
+    """
+    Persists the output of each finished workflow stage so an interrupted
+    run can resume from the first unfinished stage.
+
+    Checkpoints live in `<base_dir>/<run_key>/<stage>.json`. The run key is
+    derived from the specification, the model and an optional scope (a
+    batch, service or queue job id), so re-running the same spec or job
+    after a crash picks up where the previous run stopped.
+
+    A run holds an exclusive lock on its key (`<base_dir>/<run_key>.lock`)
+    while it uses the checkpoints. A lock that cannot be taken means
+    another live run owns them, and the caller must not resume from them.
+    The lock goes away with the process that held it, so the checkpoints
+    of a crashed run can be resumed.
+    """
+
+    DEFAULT_DIR = '.checkpoints'
+
+    def __init__(self, run_key, base_dir=DEFAULT_DIR):
+        self.run_key = run_key
+        self.base_dir = base_dir
+        self.directory = os.path.join(base_dir, run_key)
+        self.lock_path = os.path.join(base_dir, f"{run_key}.lock")
+        self._lock_file = None
+
+    @staticmethod
+    def key_for(project_spec, model=None, scope=None):
+        material = json.dumps({'spec': project_spec, 'model': model, 'scope': scope},
+                              sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
+    def acquire(self):
+        """Locks this run key's checkpoints; returns False if another run holds them."""
+        if fcntl is None or self._lock_file is not None:
+            return True
+        os.makedirs(self.base_dir, exist_ok=True)
+        while True:
+            lock_file = open(self.lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+            try:
+                # The previous holder may have removed the file after we opened it
+                current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(self.lock_path))
+            except FileNotFoundError:
+                current = False
+            if current:
+                self._lock_file = lock_file
+                return True
+            lock_file.close()
+
+    def release(self):
+        """Unlocks the checkpoints; the lock file goes too once they have been cleared."""
+        if self._lock_file is None:
+            return
+        if not os.path.isdir(self.directory):
+            os.unlink(self.lock_path)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _path(self, stage):
+        # File stages are named after their path ("file:src/cli.py")
+        return os.path.join(self.directory, f"{quote(stage, safe='')}.json")
+
+    def load(self, stage):
+        """Returns the saved output of `stage`, or None if it has not finished."""
+        try:
+            with open(self._path(stage), 'r') as f:
+                return json.load(f)['output']
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.warning("Ignoring unreadable checkpoint for stage '%s': %s", stage, e)
+            return None
+
+    def save(self, stage, output):
+        """Atomically writes the output of a finished stage."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'stage': stage, 'output': output}, f)
+            os.replace(tmp_path, self._path(stage))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.debug("Checkpointed stage '%s'", stage)
+
+    def completed(self):
+        """Names of the stages that have a checkpoint."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(name[:-len('.json')]) for name in os.listdir(self.directory)
+                      if name.endswith('.json'))
+
+    def discard(self, stages):
+        """Drops the checkpoints of `stages` so they run again."""
+        for stage in stages:
+            try:
+                os.unlink(self._path(stage))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Removes every checkpoint of this run once it has been published."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,204 @@
+import re
+import ast
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+FENCE = re.compile(r"\A\s*```[\w.+-]*[ \t]*\n(.*?)\n?```\s*\Z", re.DOTALL)
+# Lines that declare something in most languages the agents generate
+DECLARATION = re.compile(
+    r"^\s*(?:(?:export|public|protected|abstract|static|final|async|pub(?:\(\w+\))?)\s+)*"
+    r"(?:class|interface|struct|enum|trait|impl|type|typedef|def|function|func|fn|module|"
+    r"namespace|package|exception|const|val|var)\b")
+COMMENT = re.compile(r"^\s*(?://|#|/?\*)")
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Rough token count of `text` (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class CompactedContext:
+    """A piece of prompt context and how much compaction it took to fit."""
+
+    def __init__(self, path, text, tokens_before, method):
+        self.path = path
+        self.text = text
+        self.tokens_before = tokens_before
+        self.tokens_after = estimate_tokens(text)
+        # full, api, api-summary, api-bare, declarations or truncated
+        self.method = method
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'tokens_before': self.tokens_before,
+            'tokens_after': self.tokens_after,
+        }
+
+
+class ContextCompactor:
+    """
+    Shrinks generated code passed on to downstream agents until it fits a
+    token budget. Code that fits is passed through unchanged; otherwise it
+    is replaced by its public API (classes, signatures, docstrings and the
+    exceptions each function raises), with docstrings shortened and then
+    dropped as needed. Non-Python code keeps its declaration lines. Only
+    if that is still too large is the text cut at a line boundary.
+    """
+
+    DOCSTRING_LEVELS = (('api', 'full'), ('api-summary', 'summary'), ('api-bare', None))
+    MAX_CONSTANT_LENGTH = 80
+
+    def __init__(self, budget_tokens=8000):
+        self.budget_tokens = budget_tokens
+
+    @staticmethod
+    def strip_fence(code):
+        match = FENCE.match(code)
+        return match.group(1) if match else code
+
+    def compact(self, code, path=None, budget=None, allow_full=True):
+        """
+        Returns a CompactedContext of `code` within `budget` tokens. With
+        `allow_full=False` the result is a summary even if the code fits.
+        """
+        budget = self.budget_tokens if budget is None else budget
+        tokens_before = estimate_tokens(code)
+        if allow_full and tokens_before <= budget:
+            return CompactedContext(path, code, tokens_before, 'full')
+
+        source = self.strip_fence(code)
+        candidates = []
+        if path is None or path.endswith('.py'):
+            try:
+                tree = ast.parse(source)
+            except (SyntaxError, ValueError):
+                tree = None
+            if tree is not None:
+                candidates = [(method, self.public_api(tree, path, docstrings))
+                              for method, docstrings in self.DOCSTRING_LEVELS]
+        if not candidates:
+            candidates = [('declarations', self.declarations(source, path))]
+
+        for method, text in candidates:
+            if estimate_tokens(text) <= budget:
+                return CompactedContext(path, text, tokens_before, method)
+        return CompactedContext(
+            path, self.truncate(candidates[-1][1], budget), tokens_before, 'truncated')
+
+    def compact_all(self, files, budget=None):
+        """
+        Compacts a dict of path -> content under one shared budget. Small
+        files are kept whole; what they leave over is shared by the rest.
+        Returns path -> CompactedContext in the order of `files`.
+        """
+        budget = self.budget_tokens if budget is None else budget
+        results = {}
+        remaining = max(0, budget)
+        pending = sorted(files, key=lambda path: estimate_tokens(files[path]))
+        for index, path in enumerate(pending):
+            share = remaining // (len(pending) - index)
+            results[path] = self.compact(files[path], path, share)
+            remaining -= min(share, results[path].tokens_after)
+        return {path: results[path] for path in files}
+
+    def public_api(self, tree, path=None, docstrings='full'):
+        """Python stubs for the public definitions of a parsed module."""
+        lines = [f"# Public API of {path or 'the module'} (bodies omitted)"]
+        self._docstring(ast.get_docstring(tree), '', docstrings, lines)
+        for node in tree.body:
+            self._definition(node, '', docstrings, lines)
+        return "\n".join(lines) + "\n"
+
+    def _definition(self, node, indent, docstrings, lines):
+        if isinstance(node, ast.ClassDef):
+            if not self._public(node.name):
+                return
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+            lines.append(f"{indent}class {node.name}{f'({bases})' if bases else ''}:")
+            start = len(lines)
+            self._docstring(ast.get_docstring(node), indent + "    ", docstrings, lines)
+            for child in node.body:
+                self._definition(child, indent + "    ", docstrings, lines)
+            if len(lines) == start:
+                lines.append(f"{indent}    ...")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if not self._public(node.name):
+                return
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+            lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+            self._docstring(ast.get_docstring(node), indent + "    ", docstrings, lines)
+            raised = self._raised(node)
+            if raised:
+                lines.append(f"{indent}    # raises: {', '.join(raised)}")
+            lines.append(f"{indent}    ...")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            # Constants and annotated class fields (e.g. dataclass fields)
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [target.id for target in targets if isinstance(target, ast.Name)]
+            if not names or not all(self._public(name) for name in names):
+                return
+            text = ast.unparse(node)
+            if len(text) > self.MAX_CONSTANT_LENGTH:
+                text = text[:self.MAX_CONSTANT_LENGTH - 3] + "..."
+            lines.append(f"{indent}{text}")
+
+    @staticmethod
+    def _public(name):
+        return not name.startswith('_') or (name.startswith('__') and name.endswith('__'))
+
+    @staticmethod
+    def _docstring(docstring, indent, docstrings, lines):
+        if not docstring or docstrings is None:
+            return
+        if docstrings == 'summary':
+            docstring = docstring.strip().split('\n', 1)[0]
+        docstring = docstring.replace('"""', r'\"\"\"')
+        body = docstring.replace('\n', '\n' + indent)
+        lines.append(f'{indent}"""{body}"""')
+
+    @staticmethod
+    def _raised(function):
+        """Names of the exceptions raised directly in a function, in order."""
+        raised = []
+        for node in ast.walk(function):
+            if not isinstance(node, ast.Raise) or node.exc is None:
+                continue
+            exc = node.exc.func if isinstance(node.exc, ast.Call) else node.exc
+            name = ast.unparse(exc)
+            if name not in raised:
+                raised.append(name)
+        return raised
+
+    @staticmethod
+    def declarations(source, path=None):
+        """Declaration lines, with the comment lines just above them, of code in any language."""
+        kept = [f"# Declarations of {path or 'the file'} (bodies omitted)"]
+        comments = []
+        for line in source.splitlines():
+            if DECLARATION.match(line):
+                kept.extend(comments)
+                kept.append(line.rstrip())
+                comments = []
+            elif COMMENT.match(line):
+                comments.append(line.rstrip())
+            else:
+                comments = []
+        return "\n".join(kept) + "\n"
+
+    @staticmethod
+    def truncate(text, budget):
+        """Cuts `text` at a line boundary so it fits `budget` tokens, marker included."""
+        marker = "# ... (truncated to fit the prompt budget)\n"
+        limit = max(0, budget * CHARS_PER_TOKEN - len(marker))
+        cut = text.rfind('\n', 0, limit) + 1
+        return text[:cut] + marker
@@ -1,4 +1,15 @@
+import os
+import copy
+import json
+import queue
+import atexit
 import logging
+import threading
+from multiprocessing import util as multiprocessing_util
+from logging.handlers import QueueHandler, QueueListener
+
+
+LOG_FILE = "logfile.log"
 
 
 class CustomFormatter(logging.Formatter):
@@ -19,10 +30,15 @@ class CustomFormatter(logging.Formatter):
             logging.ERROR: self.bold_red + self.fmt + self.reset,
             logging.CRITICAL: self.bold_red + self.fmt + self.reset
         }
+        # One formatter per level, built once instead of once per record
+        self.formatters = {
+            level: logging.Formatter(level_fmt, datefmt="%m/%d/%Y %H:%M:%S")
+            for level, level_fmt in self.FORMATS.items()
+        }
+        self.default_formatter = logging.Formatter(self.fmt, datefmt="%m/%d/%Y %H:%M:%S")
 
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt, datefmt="%m/%d/%Y %H:%M:%S")
+        formatter = self.formatters.get(record.levelno, self.default_formatter)
         return formatter.format(record)
 
 
@@ -35,30 +51,174 @@ class ConsoleHandler(logging.StreamHandler):
 
 
 class CustomFileHandler(logging.FileHandler):
-    def __init__(self):
-        super().__init__("logfile.log", encoding="UTF-8")
+    def __init__(self, filename=LOG_FILE):
+        super().__init__(filename, encoding="UTF-8")
         self.setLevel(logging.INFO)
         self.setFormatter(logging.Formatter(
             "%(message)s",
         ))
 
 
-class Logger(logging.Logger):
-    def __init__(self, name: str):
-        super().__init__(name, level=logging.DEBUG)
-        self.propagate = False
-        self.addHandler(ConsoleHandler())
-        self.addHandler(CustomFileHandler())
+class JSONLinesHandler(logging.Handler):
+    """
+    Appends one JSON object per record to `path`.
+
+    The file is opened with O_APPEND and every record is written with a
+    single os.write, so several processes of a batch run can share one
+    file without interleaving lines.
+    """
+
+    def __init__(self, path, level=logging.DEBUG):
+        super().__init__(level)
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def to_dict(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'process': record.processName,
+            'thread': record.threadName,
+        }
+        if record.exc_info:
+            entry['exception'] = logging.Formatter().formatException(record.exc_info)
+        elif record.exc_text:
+            # Records from BackgroundHandler carry the traceback pre-formatted
+            entry['exception'] = record.exc_text
+        return entry
+
+    def emit(self, record):
+        try:
+            line = json.dumps(self.to_dict(record), default=str) + "\n"
+            os.write(self.fd, line.encode('utf-8'))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+        finally:
+            self.release()
+        super().close()
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to a queue drained by a QueueListener thread, so callers
+    never block on terminal or disk I/O.
+
+    The listener and its handlers are shared by every logger. A forked
+    worker process inherits the queue but not the listener thread, so the
+    first record logged in a new process starts a fresh listener there.
+    """
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(
+                self.queue, *_sink_handlers(), respect_handler_level=True)
+            self.listener.start()
+            self.pid = os.getpid()
+            # Pool worker processes skip atexit; multiprocessing runs finalizers instead
+            multiprocessing_util.Finalize(self, self.stop, exitpriority=10)
+
+    def stop(self):
+        with self.start_lock:
+            if self.listener is not None and self.pid == os.getpid():
+                self.listener.stop()
+                for handler in self.listener.handlers:
+                    handler.close()
+            self.listener = None
+            self.pid = None
+
+    def prepare(self, record):
+        """
+        Renders the message and traceback for the listener thread. Unlike
+        QueueHandler.prepare, the traceback stays in `exc_text` instead of
+        being folded into the message, so the JSON sink can report it.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            # The text is all the sinks need; do not keep the frames alive in the queue
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+
+_loggers = set()
+_loggers_lock = threading.Lock()
+_settings = {
+    'level': os.environ.get("LOG_LEVEL", "DEBUG").upper(),
+    'json_path': os.environ.get("LOG_JSON"),
+}
+_exception_formatter = logging.Formatter()
+_background = BackgroundHandler()
+atexit.register(_background.stop)
+
 
+def _sink_handlers():
+    handlers = [ConsoleHandler(), CustomFileHandler()]
+    if _settings['json_path']:
+        handlers.append(JSONLinesHandler(_settings['json_path']))
+    return handlers
 
-def get_logger(name: str) -> Logger:
+
+def configure_logging(level=None, json_path=None):
+    """
+    Changes the level of every logger from `get_logger` and/or enables the
+    JSON-lines sink (also set by the LOG_LEVEL and LOG_JSON environment
+    variables). Restarts the background writer to pick up the new sinks.
+    """
+    if level is not None:
+        _settings['level'] = level.upper() if isinstance(level, str) else level
+        for name in _loggers:
+            logging.getLogger(name).setLevel(_settings['level'])
+    if json_path is not None:
+        _settings['json_path'] = json_path
+        _background.stop()
+
+
+def get_logger(name: str) -> logging.Logger:
     """
-    Get a custom logger with console and file handlers.
-    
+    Get a logger that writes to the shared console and file handlers.
+
+    Records below the configured level (LOG_LEVEL, default DEBUG) are
+    discarded before their message is rendered, so pass arguments lazily:
+    `logger.debug("Output: %s", output)` rather than an f-string.
+
     Args:
         name (str): The name of the logger.
-    
+
     Returns:
-        Logger: A custom logger instance.
+        logging.Logger: The logger, configured once per name.
     """
-    return Logger(name)
+    logger = logging.getLogger(name)
+    with _loggers_lock:
+        if name not in _loggers:
+            logger.setLevel(_settings['level'])
+            logger.propagate = False
+            logger.addHandler(_background)
+            _loggers.add(name)
+    return logger
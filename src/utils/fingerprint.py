@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+import inspect
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def content_hash(content):
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def template_hash(agent_cls):
+    """Hashes the source of an agent class, which holds its prompt templates."""
+    try:
+        return content_hash(inspect.getsource(agent_cls))
+    except (OSError, TypeError):
+        return content_hash(agent_cls.__qualname__)
+
+
+class BuildFingerprints:
+    """
+    Build-system style bookkeeping of the inputs that produced each stage.
+
+    A stage's inputs are the specification, the outputs of its upstream
+    stages, its agent's prompt template and the model. Every published
+    project records them in `build_fingerprints.json`; an incremental run
+    compares its own inputs against the latest recorded build and reuses
+    that build's artifact for every stage whose inputs are unchanged.
+    """
+
+    FILE_NAME = 'build_fingerprints.json'
+
+    def __init__(self, base_output_dir, incremental=False):
+        self.incremental = incremental
+        self.records = {}
+        self.report = {}
+        self.previous_dir, self.previous = (None, {})
+        if incremental:
+            self.previous_dir, self.previous = self.latest_build(base_output_dir)
+            if self.previous_dir:
+                logger.info("Incremental build against %s", self.previous_dir)
+
+    @classmethod
+    def latest_build(cls, base_output_dir):
+        """Returns (project_dir, records) of the newest project with fingerprints."""
+        if not os.path.isdir(base_output_dir):
+            return None, {}
+        candidates = []
+        for name in os.listdir(base_output_dir):
+            if name.startswith('.'):
+                # Projects still being assembled are not builds yet
+                continue
+            path = os.path.join(base_output_dir, name, cls.FILE_NAME)
+            if os.path.isfile(path):
+                candidates.append((os.path.getmtime(path), name))
+        if not candidates:
+            return None, {}
+        project_dir = os.path.join(base_output_dir, max(candidates)[1])
+        with open(os.path.join(project_dir, cls.FILE_NAME), 'r') as f:
+            return project_dir, json.load(f)
+
+    @staticmethod
+    def inputs_for(spec, upstream, agent_cls, model):
+        return {
+            'spec': content_hash(spec),
+            'upstream': {name: content_hash(output) for name, output in sorted(upstream.items())},
+            'template': template_hash(agent_cls),
+            'model': model,
+        }
+
+    @staticmethod
+    def _changes(inputs, previous_inputs):
+        """Describes which inputs differ from the previous build."""
+        reasons = []
+        if inputs['spec'] != previous_inputs.get('spec'):
+            reasons.append("specification changed")
+        previous_upstream = previous_inputs.get('upstream', {})
+        for name, digest in inputs['upstream'].items():
+            if previous_upstream.get(name) != digest:
+                reasons.append(f"upstream '{name}' changed")
+        if inputs['template'] != previous_inputs.get('template'):
+            reasons.append("prompt template changed")
+        if inputs['model'] != previous_inputs.get('model'):
+            reasons.append("model changed")
+        return reasons
+
+    def reusable(self, stage, inputs):
+        """
+        Returns the previous artifact of `stage` when its inputs are unchanged,
+        otherwise None. Records the decision and its reason for the report.
+        """
+        fingerprint = content_hash(inputs)
+        if not self.incremental:
+            return self._decide(stage, None, "incremental mode disabled")
+
+        record = self.previous.get(stage)
+        if record is None:
+            return self._decide(stage, None, "no previous build of this stage")
+        if record['fingerprint'] != fingerprint:
+            reasons = self._changes(inputs, record.get('inputs', {}))
+            return self._decide(stage, None, ", ".join(reasons) or "inputs changed")
+
+        artifact = os.path.join(self.previous_dir, record['artifact'])
+        if not os.path.isfile(artifact):
+            return self._decide(stage, None, f"previous artifact missing: {record['artifact']}")
+        with open(artifact, 'r') as f:
+            return self._decide(stage, f.read(), "inputs unchanged")
+
+    def _decide(self, stage, content, reason):
+        self.report[stage] = {
+            'action': 'reused' if content is not None else 'rebuilt',
+            'reason': reason,
+        }
+        level = logger.info if content is not None or self.incremental else logger.debug
+        level("Stage '%s' %s: %s", stage, self.report[stage]['action'], reason)
+        return content
+
+    def record(self, stage, inputs, artifact):
+        """Remembers the inputs and artifact path (relative to the project) of a stage."""
+        self.records[stage] = {
+            'fingerprint': content_hash(inputs),
+            'inputs': inputs,
+            'artifact': artifact,
+        }
+
+    def files(self):
+        """The fingerprint record (and, for incremental runs, the build report) to publish with the project."""
+        files = {self.FILE_NAME: json.dumps(self.records, indent=2, sort_keys=True)}
+        if self.incremental:
+            files['build_report.json'] = json.dumps(self.report, indent=2, sort_keys=True)
+        return files
@@ -0,0 +1,201 @@
+import re
+import json
+
+
+class _BraceScanner:
+    """
+    Splits text into balanced `{...}` candidates in a single pass.
+
+    Text is fed in chunks as it arrives. Outside a candidate the scanner
+    only looks for the next `{`; inside one it tracks nesting depth and
+    string literals (with escapes), so braces and backticks inside strings
+    never confuse it and markdown fences of any shape are simply skipped.
+    Each balanced candidate is passed to `_candidate` together with its
+    offset in the stream. Only the text of the current candidate is buffered.
+    """
+
+    # Inside a candidate: everything up to the next brace or unterminated
+    # string, with complete string literals skipped whole.
+    _SKIP = re.compile(r'[^"{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}]*)*', re.DOTALL)
+    # Inside a string continued from an earlier chunk: everything up to its closing quote.
+    _STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+    _TRAILING_BACKSLASHES = re.compile(r'\\+$')
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Stream offsets of the current chunk and of the current candidate
+        self._offset = 0
+        self._start = None
+
+    @property
+    def done(self):
+        return False
+
+    def _scan(self, chunk):
+        position = 0
+        segment_start = 0 if self._depth else None
+        length = len(chunk)
+
+        while position < length and not self.done:
+            if self._depth == 0:
+                start = chunk.find('{', position)
+                if start < 0:
+                    break
+                self._depth = 1
+                self._start = self._offset + start
+                segment_start = start
+                position = start + 1
+            elif self._in_string:
+                if self._escape:
+                    # The previous chunk ended on a backslash; skip the escaped character
+                    self._escape = False
+                    position += 1
+                    continue
+                match = self._STRING_END.match(chunk, position)
+                if match is None:
+                    self._escape = self._ends_with_escape(chunk, position)
+                    break
+                self._in_string = False
+                position = match.end()
+            else:
+                position = self._SKIP.match(chunk, position).end()
+                if position == length:
+                    break
+                token = chunk[position]
+                position += 1
+                if token == '"':
+                    # A string literal that is not terminated within this chunk
+                    self._in_string = True
+                elif token == '{':
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._buffer.append(chunk[segment_start:position])
+                        self._candidate(''.join(self._buffer), self._start)
+                        self._buffer = []
+                        segment_start = None
+
+        if self._depth and segment_start is not None and not self.done:
+            self._buffer.append(chunk[segment_start:])
+        self._offset += length
+
+    def _ends_with_escape(self, chunk, position):
+        """Whether the string content running to the end of `chunk` ends on an unpaired backslash."""
+        match = self._TRAILING_BACKSLASHES.search(chunk, position)
+        return bool(match) and len(match.group()) % 2 == 1
+
+    def _finish(self):
+        """Ends the stream; returns the unterminated candidate and its offset, or None."""
+        tail = None
+        if self._depth and not self.done:
+            tail = (''.join(self._buffer), self._start)
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        return tail
+
+    def _candidate(self, text, offset):
+        raise NotImplementedError
+
+
+class _CandidateList(_BraceScanner):
+    """Collects the candidates of a text, ending with its unterminated one if any."""
+
+    def __init__(self):
+        super().__init__()
+        self.candidates = []
+
+    def _candidate(self, text, offset):
+        self.candidates.append((text, offset))
+
+    def scan(self, text, offset):
+        self._offset = offset
+        self._scan(text)
+        tail = self._finish()
+        if tail is not None:
+            self.candidates.append(tail)
+        return self.candidates
+
+
+class JSONStreamExtractor(_BraceScanner):
+    """
+    Incrementally pulls JSON objects out of LLM output in a single pass.
+
+    Balanced candidates are decoded one at a time, so a candidate that is
+    not JSON costs time proportional to its own length, however much text
+    came before it. A candidate that is not valid JSON (for example prose
+    such as "use {name} here", or a block of generated code) is rescanned
+    from its second character, so a real object nested inside it is still
+    found. Rescans use an explicit stack rather than recursion, so deeply
+    nested text cannot exhaust the interpreter stack.
+
+    `ends` holds the stream offset just past each object in `objects`.
+    """
+
+    # What every JSON object starts with; code blocks rarely do, and a
+    # candidate without it anywhere inside needs no rescan
+    _OBJECT_START = re.compile(r'\{\s*["}]')
+
+    def __init__(self, limit=None):
+        super().__init__()
+        self.limit = limit
+        self.objects = []
+        self.ends = []
+
+    @property
+    def done(self):
+        """True once `limit` objects have been found; further input is ignored."""
+        return self.limit is not None and len(self.objects) >= self.limit
+
+    def feed(self, chunk):
+        """Consumes the next chunk and returns the objects completed by it."""
+        found = len(self.objects)
+        self._scan(chunk)
+        return self.objects[found:]
+
+    def close(self):
+        """Ends the stream, recovering objects nested in an unterminated candidate."""
+        tail = self._finish()
+        if tail is not None:
+            text, offset = tail
+            self._decode(_CandidateList().scan(text[1:], offset + 1))
+        return self.objects
+
+    def _candidate(self, text, offset):
+        self._decode([(text, offset)])
+
+    def _decode(self, candidates):
+        """Decodes candidates in order, rescanning invalid ones for objects nested inside."""
+        pending = candidates[::-1]
+        while pending and not self.done:
+            text, offset = pending.pop()
+            if self._OBJECT_START.match(text):
+                try:
+                    self.objects.append(json.loads(text))
+                    self.ends.append(offset + len(text))
+                    continue
+                except (ValueError, RecursionError):
+                    pass
+            if self._OBJECT_START.search(text, 1):
+                pending.extend(_CandidateList().scan(text[1:], offset + 1)[::-1])
+
+
+def extract_json_objects(text, limit=None):
+    """Returns every JSON object in `text` (at most `limit`), in order of appearance."""
+    extractor = JSONStreamExtractor(limit=limit)
+    extractor.feed(text)
+    return extractor.close()
+
+
+def iter_json_objects(chunks):
+    """Yields JSON objects as soon as they are complete in a stream of text chunks."""
+    extractor = JSONStreamExtractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    found = len(extractor.objects)
+    yield from extractor.close()[found:]
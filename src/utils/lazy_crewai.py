@@ -0,0 +1,26 @@
+"""
+crewai constructors that import crewai on their first call. Importing
+crewai (and litellm, openai and httpx behind it) is most of the start-up
+time of the workflow, so agent definitions and the workflow build their
+agents, tasks and crews through these and modules stay cheap to import.
+"""
+
+
+def Agent(*args, **kwargs):
+    from crewai import Agent
+    return Agent(*args, **kwargs)
+
+
+def Task(*args, **kwargs):
+    from crewai import Task
+    return Task(*args, **kwargs)
+
+
+def Crew(*args, **kwargs):
+    from crewai import Crew
+    return Crew(*args, **kwargs)
+
+
+def LLM(*args, **kwargs):
+    from crewai import LLM
+    return LLM(*args, **kwargs)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# LLM attributes that change what a completion looks like
+SAMPLING_PARAMETERS = ('temperature', 'top_p', 'n', 'stop', 'max_tokens',
+                       'max_completion_tokens', 'presence_penalty',
+                       'frequency_penalty', 'seed', 'response_format')
+
+
+class CachedOutput:
+    """Stands in for a crew output when a response is served from the cache."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.token_usage = None
+
+    def __str__(self):
+        return self.raw
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed store of LLM responses.
+
+    Entries are keyed by a hash of the model, the agent's role, goal and
+    backstory, the rendered prompt and the sampling parameters. The store is
+    a SQLite database in WAL mode so several processes can share it; once it
+    grows past `max_bytes` the least recently used entries are evicted.
+    """
+
+    DEFAULT_PATH = '.llm_cache/responses.sqlite'
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(agent, prompt):
+        """Hashes everything that determines the agent's response to `prompt`."""
+        llm = getattr(agent, 'llm', None)
+        material = {
+            'model': getattr(llm, 'model', None),
+            'role': getattr(agent, 'role', None),
+            'goal': getattr(agent, 'goal', None),
+            'backstory': getattr(agent, 'backstory', None),
+            'prompt': prompt,
+            'parameters': {name: getattr(llm, name, None) for name in SAMPLING_PARAMETERS},
+        }
+        encoded = json.dumps(material, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def task_prompt(task):
+        """The rendered prompt of a task: its description and expected output."""
+        return f"{task.description}\n{task.expected_output}"
+
+    def _bump(self, conn, name):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """Returns the cached response for `key`, or None on a miss."""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump(conn, 'misses')
+            else:
+                conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._bump(conn, 'hits')
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row else None
+
+    def set(self, key, value):
+        """Stores a response and evicts least recently used entries over the size bound."""
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            logger.warning("Response of %d bytes exceeds the cache size, not caching", size)
+            return
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)", (key, value, size, now, now))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logger.info("Evicted %d cached responses", len(evicted))
+
+    def stats(self):
+        """Hit/miss counters for this instance and for the store as a whole."""
+        conn = self._connection()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'total_hits': counters.get('hits', 0),
+            'total_misses': counters.get('misses', 0),
+            'entries': entries,
+            'bytes': size,
+        }
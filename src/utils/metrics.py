@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`, `fraction` between 0 and 1."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StageMetrics:
+    FIELDS = ('wall_time', 'queue_time', 'prompt_tokens', 'completion_tokens',
+              'retries', 'cache_hits', 'bytes_written', 'regenerations',
+              'time_to_first_token', 'early_stops', 'context_tokens_before',
+              'context_tokens_after')
+
+    def __init__(self, name):
+        self.name = name
+        self.source = 'llm'
+        self.wall_time = 0.0
+        self.queue_time = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.bytes_written = 0
+        self.regenerations = 0
+        # Seconds until the first streamed token of the stage's first LLM call
+        self.time_to_first_token = 0.0
+        self.early_stops = 0
+        # Estimated tokens of upstream artifacts in the prompt, before and after compaction
+        self.context_tokens_before = 0
+        self.context_tokens_after = 0
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in StageMetrics.FIELDS}
+        data['source'] = self.source
+        return data
+
+
+class MetricsRecorder:
+    """
+    Collects wall time, queue time, token usage, retries, cache hits and
+    bytes written for every stage of a workflow run.
+
+    Code running inside `with recorder.stage(name):` reports into that
+    stage without passing it around; the current stage is tracked per
+    thread so concurrently running stages do not mix their numbers.
+    """
+
+    PROMETHEUS_METRICS = (
+        ('wall_time', 'workflow_stage_wall_seconds', "Wall time spent in the stage"),
+        ('queue_time', 'workflow_stage_queue_seconds', "Time the stage waited for a worker"),
+        ('prompt_tokens', 'workflow_stage_prompt_tokens', "Prompt tokens sent by the stage"),
+        ('completion_tokens', 'workflow_stage_completion_tokens', "Completion tokens received by the stage"),
+        ('retries', 'workflow_stage_retries', "LLM call retries in the stage"),
+        ('cache_hits', 'workflow_stage_cache_hits', "LLM responses served from the cache"),
+        ('bytes_written', 'workflow_stage_bytes_written', "Bytes of output produced by the stage"),
+        ('regenerations', 'workflow_stage_regenerations', "Outputs regenerated after failing static validation"),
+        ('time_to_first_token', 'workflow_stage_time_to_first_token_seconds', "Time until the first streamed token"),
+        ('early_stops', 'workflow_stage_early_stops', "Streams stopped once the answer was complete"),
+        ('context_tokens_before', 'workflow_stage_context_tokens_before', "Upstream context tokens before compaction"),
+        ('context_tokens_after', 'workflow_stage_context_tokens_after', "Upstream context tokens sent after compaction"),
+    )
+
+    def __init__(self):
+        self.stages = {}
+        self.started_at = time.time()
+        self.total_time = None
+        # Hit/miss statistics of the caches used by the run, by cache name
+        self.caches = {}
+        self._clock = time.monotonic()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block and attributes reports inside it to `name`."""
+        metrics = self._stage(name)
+        previous = getattr(self._local, 'current', None)
+        self._local.current = metrics
+        started = time.monotonic()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_time += time.monotonic() - started
+            self._local.current = previous
+
+    def current(self):
+        return getattr(self._local, 'current', None)
+
+    def set_queue_time(self, name, seconds):
+        self._stage(name).queue_time = seconds
+
+    def set_source(self, source):
+        """Records where the current stage's output came from (llm, cache, checkpoint, ...)."""
+        metrics = self.current()
+        if metrics is not None:
+            metrics.source = source
+
+    def record_usage(self, usage):
+        """Adds the token usage of a crew output to the current stage."""
+        metrics = self.current()
+        if metrics is None or usage is None:
+            return
+        metrics.prompt_tokens += getattr(usage, 'prompt_tokens', 0) or 0
+        metrics.completion_tokens += getattr(usage, 'completion_tokens', 0) or 0
+
+    def record_retry(self):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.retries += 1
+
+    def record_cache_hit(self):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.cache_hits += 1
+            metrics.source = 'cache'
+
+    def record_regeneration(self):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.regenerations += 1
+
+    def record_first_token(self, seconds):
+        metrics = self.current()
+        if metrics is not None and not metrics.time_to_first_token:
+            metrics.time_to_first_token = seconds
+
+    def record_early_stop(self):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.early_stops += 1
+
+    def record_context(self, tokens_before, tokens_after):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.context_tokens_before = tokens_before
+            metrics.context_tokens_after = tokens_after
+
+    def record_bytes(self, count):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.bytes_written += count
+
+    def record_cache_stats(self, name, stats):
+        self.caches[name] = stats
+
+    def finish(self):
+        self.total_time = time.monotonic() - self._clock
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'total_time': self.total_time,
+            'stages': {name: stage.to_dict() for name, stage in self.stages.items()},
+            'caches': self.caches,
+        }
+
+    def to_prometheus(self):
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines = []
+        for field, metric, description in MetricsRecorder.PROMETHEUS_METRICS:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, stage in self.stages.items():
+                lines.append(f'{metric}{{stage="{name}",source="{stage.source}"}} {getattr(stage, field)}')
+        if self.caches:
+            lines.append("# HELP workflow_cache_hit_rate Hit rate of a cache during the run")
+            lines.append("# TYPE workflow_cache_hit_rate gauge")
+            for name, stats in self.caches.items():
+                lines.append(f'workflow_cache_hit_rate{{cache="{name}"}} {stats["hit_rate"]}')
+        if self.total_time is not None:
+            lines.append("# HELP workflow_wall_seconds Wall time of the whole workflow run")
+            lines.append("# TYPE workflow_wall_seconds gauge")
+            lines.append(f"workflow_wall_seconds {self.total_time}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """A human readable table of the stage metrics."""
+        lines = [
+            f"{'stage':<10} {'source':<14} {'wall_s':>8} {'queue_s':>8} {'prompt_tok':>10} "
+            f"{'compl_tok':>10} {'retries':>7} {'cache':>5} {'bytes':>9} {'regen':>5} {'ttft_s':>7}"
+        ]
+        for name, stage in self.stages.items():
+            lines.append(
+                f"{name:<10} {stage.source:<14} {stage.wall_time:>8.2f} {stage.queue_time:>8.2f} "
+                f"{stage.prompt_tokens:>10} {stage.completion_tokens:>10} {stage.retries:>7} "
+                f"{stage.cache_hits:>5} {stage.bytes_written:>9} {stage.regenerations:>5} "
+                f"{stage.time_to_first_token:>7.2f}")
+        for name, stage in self.stages.items():
+            if stage.context_tokens_after < stage.context_tokens_before:
+                lines.append(
+                    f"{name} context compacted from ~{stage.context_tokens_before} "
+                    f"to ~{stage.context_tokens_after} tokens")
+        for name, stats in self.caches.items():
+            lines.append(
+                f"{name} cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate)")
+        if self.total_time is not None:
+            lines.append(f"Total wall time: {self.total_time:.2f}s")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory):
+        """Writes metrics.json and metrics.prom into `directory`."""
+        with open(os.path.join(directory, 'metrics.json'), 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(os.path.join(directory, 'metrics.prom'), 'w') as f:
+            f.write(self.to_prometheus())
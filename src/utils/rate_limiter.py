@@ -0,0 +1,162 @@
+import os
+import re
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class RateLimiter:
+    """
+    Process-wide token bucket limiting LLM requests per minute and tokens
+    per minute across every agent and workflow.
+
+    The effective rate adapts to the provider: each observed 429 halves it
+    and pauses all callers until the Retry-After deadline, and each
+    successful call raises it again by a small step up to the configured
+    quota. Callers therefore queue on the bucket instead of retrying on
+    independent timers and stampeding back at the same moment.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=None,
+                 min_fraction=0.1, recovery_step=0.05):
+        self.max_rpm = float(requests_per_minute)
+        self.max_tpm = float(tokens_per_minute) if tokens_per_minute else None
+        self.min_fraction = min_fraction
+        self.recovery_step = recovery_step
+        self.fraction = 1.0
+        self.blocked_until = 0.0
+        self.rate_limited = 0
+        now = time.monotonic()
+        self._requests = self.max_rpm
+        self._tokens = self.max_tpm or 0.0
+        self._updated = now
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.max_rpm,
+                             self._requests + elapsed * self.max_rpm * self.fraction / 60)
+        if self.max_tpm:
+            self._tokens = min(self.max_tpm,
+                               self._tokens + elapsed * self.max_tpm * self.fraction / 60)
+
+    def _wait_time(self, now, tokens):
+        """Seconds until a request of `tokens` fits in both buckets."""
+        wait = max(0.0, self.blocked_until - now)
+        if self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / (self.max_rpm * self.fraction))
+        if self.max_tpm and tokens:
+            # A request larger than the whole bucket only waits for a full one
+            needed = min(tokens, self.max_tpm)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / (self.max_tpm * self.fraction))
+        return wait
+
+    def acquire(self, tokens=0):
+        """Blocks until a request of roughly `tokens` tokens may be sent."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._requests -= 1
+                    if self.max_tpm:
+                        self._tokens -= min(tokens, self.max_tpm)
+                    return
+                self._condition.wait(wait)
+
+    def record_usage(self, estimated, actual):
+        """Corrects the token bucket once the real usage of a request is known."""
+        if not self.max_tpm or actual is None:
+            return
+        with self._condition:
+            self._tokens -= actual - estimated
+
+    def on_success(self):
+        with self._condition:
+            if self.fraction < 1.0:
+                self.fraction = min(1.0, self.fraction + self.recovery_step)
+
+    def on_rate_limited(self, retry_after=None):
+        """Backs the shared rate off after a 429 and honours its Retry-After hint."""
+        with self._condition:
+            self.rate_limited += 1
+            self.fraction = max(self.min_fraction, self.fraction / 2)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            # Nothing may be sent until the pause is over
+            self._requests = min(self._requests, 0.0)
+            self._condition.notify_all()
+        if retry_after:
+            logger.warning("Rate limited by provider; running at %.0f%% of quota, pausing %.1fs",
+                           self.fraction * 100, retry_after)
+        else:
+            logger.warning("Rate limited by provider; running at %.0f%% of quota",
+                           self.fraction * 100)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """The limiter shared by the whole process, configured from LLM_RPM / LLM_TPM."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_minute=float(os.environ.get("LLM_RPM", 60)),
+                tokens_per_minute=float(os.environ["LLM_TPM"]) if os.environ.get("LLM_TPM") else None,
+            )
+        return _rate_limiter
+
+
+RETRY_DELAY_PATTERN = re.compile(r'retry[_ ]?delay\W*(\d+(?:\.\d+)?)s', re.IGNORECASE)
+
+
+def retry_after_seconds(error):
+    """Extracts a Retry-After hint (in seconds) from a provider error, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    # Gemini reports the delay in the error body, e.g. "retryDelay": "23s"
+    match = RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def is_rate_limit_error(error):
+    if type(error).__name__ == 'RateLimitError':
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 429
+
+
+def wait_for_rate_limit(retry_state):
+    """
+    Tenacity wait strategy. Rate-limit errors are reported to the shared
+    limiter, which then paces every caller, so the retry itself only adds a
+    little jitter; other errors back off exponentially with jitter.
+    """
+    error = retry_state.outcome.exception()
+    if error is not None and is_rate_limit_error(error):
+        get_rate_limiter().on_rate_limited(retry_after_seconds(error))
+        return random.uniform(0, 1)
+    return random.uniform(0, min(60, 2 ** retry_state.attempt_number))
@@ -0,0 +1,75 @@
+import re
+import ast
+import json
+import hashlib
+
+from utils.custom_logger import get_logger
+from utils.fingerprint import template_hash
+from utils.llm_cache import LLMCache
+
+
+logger = get_logger(__name__)
+
+
+FENCE = re.compile(r"\A\s*```[\w.+-]*[ \t]*\n(.*?)\n?```\s*\Z", re.DOTALL)
+WHITESPACE = re.compile(r"\s+")
+
+APPROVED = 'approved'
+REVISIONS_REQUIRED = 'revisions_required'
+
+
+def normalize_code(code, path=None):
+    """
+    Returns (kind, normalized) where semantically identical code gives the
+    same text: the AST dump for Python (comments, blank lines and
+    formatting disappear), whitespace-collapsed text for anything else.
+    """
+    match = FENCE.match(code)
+    if match:
+        code = match.group(1)
+    if path is None or path.endswith('.py'):
+        try:
+            return 'python-ast', ast.dump(ast.parse(code))
+        except (SyntaxError, ValueError):
+            pass
+    return 'text', WHITESPACE.sub(" ", code).strip()
+
+
+def review_verdict(review_output):
+    """The verdict the workflow reads from a review: approved or revisions required."""
+    return APPROVED if "Approved" in review_output else REVISIONS_REQUIRED
+
+
+class ReviewCache(LLMCache):
+    """
+    Review verdicts and feedback keyed by a normalized fingerprint of the
+    reviewed code, so code that only differs from reviewed code in
+    whitespace or comments is not sent to the reviewer again.
+
+    The key also covers the reviewer agent (model, role, goal, backstory)
+    and the source of the review prompt, so changing either starts afresh.
+    Storage, LRU eviction and hit counters are those of `LLMCache`.
+    """
+
+    DEFAULT_PATH = '.llm_cache/reviews.sqlite'
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=64 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def make_review_key(agent, agent_cls, code, path=None):
+        kind, normalized = normalize_code(code, path)
+        fingerprint = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        reviewer = f"{kind}:{fingerprint}:{template_hash(agent_cls)}"
+        return LLMCache.make_key(agent, reviewer)
+
+    def get_review(self, key):
+        """Returns {'verdict', 'feedback'} for a previously reviewed fingerprint, or None."""
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_review(self, key, review_output):
+        self.set(key, json.dumps({
+            'verdict': review_verdict(review_output),
+            'feedback': review_output,
+        }))
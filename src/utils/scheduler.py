@@ -0,0 +1,151 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from utils.custom_logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class Stage:
+    def __init__(self, name, func, depends_on=()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+
+class StageScheduler:
+    """
+    Runs a graph of workflow stages, starting each stage as soon as all of
+    its dependencies have finished.
+
+    Every stage function receives a dict with the results of its direct
+    dependencies and returns its own result. At most `max_concurrency`
+    stages run at the same time.
+    """
+
+    def __init__(self, max_concurrency=3):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.stages = {}
+        # Seconds each stage waited for a free worker after becoming ready
+        self.queue_times = {}
+        # (ready, started) time.monotonic() pair of every stage, for tracing
+        self.queue_windows = {}
+
+    def add_stage(self, name, func, depends_on=()):
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        self.stages[name] = Stage(name, func, depends_on)
+
+    def _topological_order(self):
+        """Returns the stage names in dependency order, validating the graph."""
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(
+                        f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+
+        order = []
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                cycle = " -> ".join(path + [name])
+                raise ValueError(f"Stage graph contains a cycle: {cycle}")
+            state[name] = 'visiting'
+            for dependency in self.stages[name].depends_on:
+                visit(dependency, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def critical_path(self):
+        """Returns the longest dependency chain, in stage count."""
+        depth = {}
+        previous = {}
+        for name in self._topological_order():
+            stage = self.stages[name]
+            depth[name] = 1
+            for dependency in stage.depends_on:
+                if depth[dependency] + 1 > depth[name]:
+                    depth[name] = depth[dependency] + 1
+                    previous[name] = dependency
+        if not depth:
+            return []
+        name = max(depth, key=depth.get)
+        path = [name]
+        while name in previous:
+            name = previous[name]
+            path.append(name)
+        return list(reversed(path))
+
+    def run(self):
+        """
+        Executes every stage and returns a dict of stage name -> result.
+        The first stage failure cancels all stages that have not started
+        yet and is re-raised once the running ones have finished.
+        """
+        order = self._topological_order()
+        results = {}
+        lock = threading.Lock()
+        pending = list(order)
+        running = {}
+        ready_at = {}
+        error = None
+
+        logger.info("Scheduling %d stages, critical path: %s",
+                    len(order), ' -> '.join(self.critical_path()))
+
+        def ready(name):
+            return all(dep in results for dep in self.stages[name].depends_on)
+
+        def call(stage):
+            started = time.monotonic()
+            self.queue_times[stage.name] = started - ready_at[stage.name]
+            self.queue_windows[stage.name] = (ready_at[stage.name], started)
+            with lock:
+                upstream = {dep: results[dep] for dep in stage.depends_on}
+            logger.info("Stage '%s' started", stage.name)
+            return stage.func(upstream)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                thread_name_prefix="stage") as executor:
+            while pending or running:
+                if error is None:
+                    ready_now = [n for n in pending if ready(n)]
+                    for name in ready_now:
+                        ready_at.setdefault(name, time.monotonic())
+                    for name in ready_now:
+                        if len(running) >= self.max_concurrency:
+                            break
+                        pending.remove(name)
+                        running[executor.submit(call, self.stages[name])] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error("Stage '%s' failed: %s", name, e)
+                        if error is None:
+                            error = e
+                        continue
+                    with lock:
+                        results[name] = result
+                    logger.info("Stage '%s' finished", name)
+
+        if error is not None:
+            raise error
+        return results
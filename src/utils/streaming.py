@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+
+from utils.json_stream import JSONStreamExtractor
+
+
+FINAL_ANSWER = "Final Answer:"
+
+# Stop conditions for a streamed answer
+STOP_AT_FENCE = 'fence'
+STOP_AT_JSON = 'json'
+
+# Markdown answers may legitimately contain fenced blocks of their own
+NO_EARLY_STOP_EXTENSIONS = ('.md', '.rst', '.txt')
+
+_local = threading.local()
+
+
+def stop_condition_for(path):
+    """How a streamed answer destined for `path` is recognised as complete."""
+    if path is None:
+        return STOP_AT_FENCE
+    if path.endswith('.json'):
+        return STOP_AT_JSON
+    if path.endswith(NO_EARLY_STOP_EXTENSIONS):
+        return None
+    return STOP_AT_FENCE
+
+
+class StreamSink:
+    """
+    Receives the streamed text of one LLM call on behalf of a task.
+
+    Everything after the agent's "Final Answer:" marker is appended to
+    `path` as it arrives. `feed` returns True once the answer is complete:
+    for STOP_AT_FENCE when an answer that opened with a code fence closes
+    it, for STOP_AT_JSON when the first JSON object is complete. Fences
+    nested in the answer (a fence line with an info string such as
+    ```bash opens one, a bare fence line closes one) are counted, so a
+    fenced example inside a docstring does not end the answer. Each chunk
+    is only scanned together with a short tail of the text before it.
+    """
+
+    OPENING_FENCE = re.compile(r"\s*(`{3,})[^\n]*\n")
+    WINDOW = 64
+
+    def __init__(self, path=None, stop_at=STOP_AT_FENCE, on_first_token=None):
+        self.path = path
+        self.stop_at = stop_at
+        self.on_first_token = on_first_token
+        self.parts = []
+        self.length = 0
+        self.answer_start = None
+        self.answer_length = 0
+        self.stopped_early = False
+        self.time_to_first_token = None
+        self._tail = ""
+        self._head = ""
+        self._fence = None
+        self._fence_depth = 0
+        self._file = None
+        self._json = JSONStreamExtractor(limit=1) if stop_at == STOP_AT_JSON else None
+        self._started = time.monotonic()
+
+    def feed(self, chunk):
+        """Consumes a streamed chunk; returns True when generation can stop."""
+        if not chunk:
+            return self.stopped_early
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self._started
+            if self.on_first_token is not None:
+                self.on_first_token(self.time_to_first_token)
+        self.parts.append(chunk)
+        self.length += len(chunk)
+
+        if self.answer_start is None:
+            # The marker may be split across chunks
+            window = self._tail + chunk
+            index = window.find(FINAL_ANSWER)
+            if index < 0:
+                self._tail = window[-len(FINAL_ANSWER):]
+                return False
+            self._tail = ""
+            self.answer_start = self.length - len(window) + index + len(FINAL_ANSWER)
+            chunk = window[index + len(FINAL_ANSWER):]
+        return self._feed_answer(chunk)
+
+    def _feed_answer(self, chunk):
+        if not self.answer_length:
+            # Skip the space after the marker, however the chunks split it
+            stripped = chunk.lstrip(" ")
+            self.answer_start += len(chunk) - len(stripped)
+            chunk = stripped
+            if not chunk:
+                return False
+        # The start of the answer tells whether it is fenced
+        head_added = chunk[:max(0, self.WINDOW - len(self._head))]
+        self._head += head_added
+        excess = None
+        if self.stop_at == STOP_AT_JSON and self._head.lstrip().startswith('```'):
+            # A fenced JSON answer ends with its fence
+            self.stop_at = STOP_AT_FENCE
+        if self.stop_at == STOP_AT_FENCE:
+            excess = self._past_closing_fence(chunk, chunk[len(head_added):])
+        elif self.stop_at == STOP_AT_JSON and self._json.feed(chunk):
+            # The extractor was fed exactly the answer, so its offsets are the answer's
+            excess = self.answer_length + len(chunk) - self._json.ends[0]
+        if excess is not None:
+            self.stopped_early = True
+            if excess:
+                # Drop whatever followed the end of the answer in this chunk
+                chunk = chunk[:len(chunk) - excess]
+                self.parts[-1] = self.parts[-1][:len(self.parts[-1]) - excess]
+                self.length -= excess
+        self._write(chunk)
+        self.answer_length += len(chunk)
+        return self.stopped_early
+
+    def _past_closing_fence(self, chunk, beyond_head):
+        """
+        How many characters of `chunk` follow the closing fence of an answer
+        that opened with one, or None while the fence is still open.
+        """
+        if self._fence is None:
+            match = self.OPENING_FENCE.match(self._head)
+            if match is None:
+                if self._head.strip() and not self._head.lstrip().startswith('`'):
+                    # Not fenced; the answer runs to the end of the completion
+                    self.stop_at = None
+                return None
+            # Fence lines at least as long as the opening one, with their info string
+            self._fence = re.compile(rf"\n{match.group(1)}`*([^\n`]*)(?=\n)")
+            self._fence_depth = 1
+            window = self._head[match.end() - 1:] + beyond_head
+            counted = 0
+        else:
+            window = self._tail + chunk
+            # Fence lines ending inside the tail were counted with the previous chunk
+            counted = len(self._tail)
+        for match in self._fence.finditer(window):
+            end = match.end() + 1
+            if end <= counted:
+                continue
+            self._fence_depth += 1 if match.group(1).strip() else -1
+            if self._fence_depth == 0:
+                return len(window) - end
+        self._tail = window[-self.WINDOW:]
+        return None
+
+    def answer(self):
+        if self.answer_start is None:
+            return ""
+        return self.result()[self.answer_start:]
+
+    def result(self):
+        return "".join(self.parts)
+
+    def _write(self, chunk):
+        if self.path is None or not chunk:
+            return
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = open(self.path, 'w')
+        self._file.write(chunk)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@contextmanager
+def stream_to(path, stop_at=STOP_AT_FENCE, on_first_token=None):
+    """
+    Streams the LLM calls made on this thread inside the block into `path`.
+    Yields a list that collects the StreamSink of every call.
+    """
+    previous = getattr(_local, 'target', None)
+    sinks = []
+    _local.target = (path, stop_at, on_first_token, sinks)
+    try:
+        yield sinks
+    finally:
+        _local.target = previous
+
+
+def open_sink():
+    """A StreamSink for one LLM call on this thread, registered with `stream_to` if active."""
+    target = getattr(_local, 'target', None)
+    if target is None:
+        return StreamSink()
+    path, stop_at, on_first_token, sinks = target
+    sink = StreamSink(path, stop_at, on_first_token)
+    sinks.append(sink)
+    return sink
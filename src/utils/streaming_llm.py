@@ -0,0 +1,97 @@
+from crewai import BaseLLM
+
+from utils.custom_logger import get_logger
+from utils.llm_cache import SAMPLING_PARAMETERS
+from utils.streaming import open_sink
+
+
+logger = get_logger(__name__)
+
+
+class StreamingLLM(BaseLLM):
+    """
+    Calls the model through litellm with `stream=True`.
+
+    Chunks go to the StreamSink registered by `stream_to` on the calling
+    thread. The stream is abandoned as soon as the sink has a complete
+    answer, so runaway completions stop costing time and tokens.
+    """
+
+    # Share of the context window left to the prompt, as crewai.LLM reserves
+    CONTEXT_WINDOW_USAGE_RATIO = 0.75
+    # Window assumed for models litellm has no information about
+    DEFAULT_CONTEXT_WINDOW = 8192
+
+    def __init__(self, model, api_key=None, temperature=None, top_p=None, n=None, stop=None,
+                 max_tokens=None, max_completion_tokens=None, presence_penalty=None,
+                 frequency_penalty=None, seed=None, response_format=None,
+                 context_window_size=None, **kwargs):
+        super().__init__(model=model, temperature=temperature)
+        self.api_key = api_key
+        # Attributes, as on crewai.LLM, so that LLMCache keys include them
+        self.top_p = top_p
+        self.n = n
+        self.stop = stop or []
+        self.max_tokens = max_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.presence_penalty = presence_penalty
+        self.frequency_penalty = frequency_penalty
+        self.seed = seed
+        self.response_format = response_format
+        self.context_window_size = context_window_size
+        self.completion_kwargs = kwargs
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, **kwargs):
+        import litellm
+
+        if isinstance(messages, str):
+            messages = [{'role': 'user', 'content': messages}]
+        params = dict(self.completion_kwargs, model=self.model, messages=messages, stream=True)
+        if self.api_key:
+            params['api_key'] = self.api_key
+        for name in SAMPLING_PARAMETERS:
+            value = getattr(self, name)
+            if value is not None and value != []:
+                params[name] = value
+
+        sink = open_sink()
+        response = litellm.completion(**params)
+        try:
+            for chunk in response:
+                choices = getattr(chunk, 'choices', None)
+                if not choices:
+                    continue
+                if sink.feed(getattr(choices[0].delta, 'content', None) or ""):
+                    logger.debug("Stopping the stream early after %d answer characters",
+                                 sink.answer_length)
+                    break
+        finally:
+            close = getattr(response, 'close', None)
+            if close is not None:
+                close()
+            sink.close()
+        return sink.result()
+
+    def supports_function_calling(self):
+        return False
+
+    def supports_stop_words(self):
+        return True
+
+    def get_context_window_size(self):
+        """
+        The share of the model's input window crewai may fill, from litellm's
+        model information unless `context_window_size` was given.
+        """
+        if self.context_window_size is None:
+            window = None
+            try:
+                import litellm
+                info = litellm.get_model_info(self.model)
+                window = info.get('max_input_tokens') or info.get('max_tokens')
+            except Exception as e:
+                logger.debug("No context window known for %s: %s", self.model, e)
+            self.context_window_size = int(
+                (window or self.DEFAULT_CONTEXT_WINDOW) * self.CONTEXT_WINDOW_USAGE_RATIO)
+        return self.context_window_size
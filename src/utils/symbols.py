@@ -0,0 +1,157 @@
+import re
+import ast
+
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_LINE = re.compile(r"^\s*```")
+FENCE = re.compile(r"\A\s*```[\w.+-]*[ \t]*\n(.*?)\n?```\s*\Z", re.DOTALL)
+# Words that say nothing about which code a feature touches
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or that the this
+    to with add adds adding new support supports allow allows make makes should when
+    which will can feature command function method class value values use uses using
+""".split())
+
+
+class Symbol:
+    """A named region of a file: a function, class or method, or a markdown section."""
+
+    def __init__(self, name, kind, start, end, lines, doc=""):
+        self.name = name
+        self.kind = kind
+        # 1-based, inclusive
+        self.start = start
+        self.end = end
+        self.source = "\n".join(lines[start - 1:end])
+        self.doc = doc
+
+
+def words(text):
+    """Lowercase words of `text`, with identifiers split at underscores and case changes."""
+    found = set()
+    for identifier in IDENTIFIER.findall(text):
+        for word in WORD.findall(identifier):
+            word = word.lower()
+            if len(word) > 2 and word not in STOP_WORDS:
+                found.add(word)
+    return found
+
+
+def python_symbols(source):
+    """
+    Top-level functions and classes and their methods; [] if `source` does
+    not parse. Line numbers refer to `source` even if it is wrapped in a
+    code fence.
+    """
+    match = FENCE.match(source)
+    offset = source[:match.start(1)].count('\n') if match else 0
+    try:
+        tree = ast.parse(match.group(1) if match else source)
+    except (SyntaxError, ValueError):
+        return []
+    lines = source.splitlines()
+    symbols = []
+
+    def visit(nodes, prefix):
+        for node in nodes:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            kind = 'class' if isinstance(node, ast.ClassDef) else ('method' if prefix else 'function')
+            symbols.append(Symbol(f"{prefix}{node.name}", kind, start + offset,
+                                  node.end_lineno + offset, lines,
+                                  ast.get_docstring(node) or ""))
+            if isinstance(node, ast.ClassDef):
+                visit(node.body, f"{prefix}{node.name}.")
+
+    visit(tree.body, "")
+    return symbols
+
+
+def markdown_sections(text):
+    """One symbol per heading, running to the next heading of any level."""
+    lines = text.splitlines()
+    headings = []
+    in_fence = False
+    for number, line in enumerate(lines, 1):
+        if FENCE_LINE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = HEADING.match(line)
+            if match:
+                headings.append((number, match.group(2)))
+    return [Symbol(title, 'section', start,
+                   headings[index + 1][0] - 1 if index + 1 < len(headings) else len(lines), lines)
+            for index, (start, title) in enumerate(headings)]
+
+
+def symbols_for(path, content):
+    if path.endswith('.py'):
+        return python_symbols(content)
+    if path.endswith(('.md', '.rst')):
+        return markdown_sections(content)
+    return []
+
+
+def relevant(symbols, query, limit=3):
+    """
+    The symbols that best match a free-text `query`: name words count
+    three times as much as docstring words. Classes that have methods
+    are left out in favour of their methods, which are smaller regions.
+    """
+    wanted = words(query)
+    parents = {symbol.name.rsplit('.', 1)[0] for symbol in symbols if symbol.kind == 'method'}
+    scored = []
+    for symbol in symbols:
+        if symbol.kind == 'class' and symbol.name in parents:
+            continue
+        score = 3 * len(wanted & words(symbol.name)) + len(wanted & words(symbol.doc))
+        if score:
+            scored.append((-score, symbol.start, symbol))
+    return [symbol for _, _, symbol in sorted(scored, key=lambda item: item[:2])[:limit]]
+
+
+def referencing(symbols, names):
+    """The symbols whose text mentions any of `names` as a whole word."""
+    if not names:
+        return []
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(name) for name in sorted(names)) + r")\b")
+    return [symbol for symbol in symbols if pattern.search(symbol.source)]
+
+
+def changed(old_source, new_source):
+    """
+    Names of the Python symbols that were added or whose source changed. A
+    class only counts when the change is not inside one of its methods.
+    """
+    old = {symbol.name: symbol.source for symbol in python_symbols(old_source)}
+    names = [symbol.name for symbol in python_symbols(new_source)
+             if old.get(symbol.name) != symbol.source]
+    return [name for name in names
+            if not any(other.startswith(f"{name}.") for other in names)]
+
+
+def outermost(symbols):
+    """Drops symbols nested inside another selected symbol."""
+    ordered = sorted(symbols, key=lambda symbol: (symbol.start, -symbol.end))
+    kept = []
+    for symbol in ordered:
+        if not kept or symbol.start > kept[-1].end:
+            kept.append(symbol)
+    return kept
+
+
+def format_regions(path, content, symbols, tail_lines=8):
+    """
+    Excerpts of `content` for a prompt, each headed with its line range.
+    Without symbols the end of the file is shown, where new code can go.
+    """
+    lines = content.splitlines()
+    if not symbols:
+        start = max(1, len(lines) - tail_lines + 1)
+        return f"Lines {start}-{len(lines)} of {path} (end of file):\n" + "\n".join(lines[start - 1:])
+    return "\n\n".join(
+        f"Lines {symbol.start}-{symbol.end} of {path} ({symbol.kind} {symbol.name}):\n{symbol.source}"
+        for symbol in outermost(symbols))
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+
+class Span:
+    """A timed section of a run; `set` adds attributes that end up in the trace."""
+
+    def __init__(self, span_id, name, category, parent_id, attributes):
+        self.span_id = span_id
+        self.name = name
+        self.category = category
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = None
+        self.end = None
+        self.track = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Tracer:
+    """
+    Records nested timing spans of a workflow run and exports them as a
+    Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev).
+
+    Spans nest per thread: a span opened while another one is open on the
+    same thread becomes its child. Spans opened on a thread with nothing
+    open (for example a stage on a scheduler worker) are attached to the
+    first span of the trace, the workflow span. Each thread, plus any
+    named track passed to `add_span`, gets its own row in the viewer.
+    """
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.spans = []
+        self.instants = []
+        self.root = None
+        self._origin = time.monotonic()
+        self._next_id = 1
+        self._tracks = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _track(self, name=None):
+        """Returns the viewer row id of `name`, or of the current thread."""
+        key = name or threading.get_ident()
+        with self._lock:
+            if key not in self._tracks:
+                label = name or threading.current_thread().name
+                self._tracks[key] = (len(self._tracks) + 1, label)
+            return self._tracks[key][0]
+
+    def _new_span(self, name, category, attributes):
+        stack = self._stack()
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+            parent = stack[-1] if stack else self.root
+            span = Span(span_id, name, category, parent.span_id if parent else None, attributes)
+            if self.root is None:
+                self.root = span
+        return span
+
+    @contextmanager
+    def span(self, name, category='workflow', **attributes):
+        """Times the enclosed block as a child of the span currently open on this thread."""
+        span = self._new_span(name, category, attributes)
+        span.track = self._track()
+        stack = self._stack()
+        stack.append(span)
+        span.start = time.monotonic()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end = time.monotonic()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def add_span(self, name, start, end, category='workflow', track=None, **attributes):
+        """
+        Records a span measured elsewhere, from `time.monotonic()` values.
+        Without `track` it is placed on the current thread.
+        """
+        span = self._new_span(name, category, attributes)
+        span.track = self._track(track)
+        span.start, span.end = start, end
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def instant(self, name, category='workflow', **attributes):
+        """Marks a point in time on the current thread."""
+        event = (name, category, time.monotonic(), self._track(), attributes)
+        with self._lock:
+            self.instants.append(event)
+
+    def _micros(self, timestamp):
+        return round((timestamp - self._origin) * 1_000_000, 3)
+
+    def to_chrome_trace(self):
+        """Returns the trace in the Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+            instants = list(self.instants)
+            tracks = list(self._tracks.values())
+
+        events = [
+            {'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': label}}
+            for tid, label in tracks
+        ]
+        for span in spans:
+            args = dict(span.attributes, span_id=span.span_id)
+            if span.parent_id is not None:
+                args['parent_id'] = span.parent_id
+            events.append({
+                'ph': 'X', 'name': span.name, 'cat': span.category, 'pid': pid,
+                'tid': span.track, 'ts': self._micros(span.start),
+                'dur': round((span.end - span.start) * 1_000_000, 3), 'args': args,
+            })
+        for name, category, timestamp, tid, attributes in instants:
+            events.append({
+                'ph': 'i', 's': 't', 'name': name, 'cat': category, 'pid': pid,
+                'tid': tid, 'ts': self._micros(timestamp), 'args': attributes,
+            })
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'trace_id': self.trace_id, 'started_at': self.started_at},
+        }
+
+    def write(self, path):
+        """Writes the Chrome trace to `path` and returns the path."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        os.replace(temp_path, path)
+        return path
+
+
+class NullTracer:
+    """Stands in for a Tracer where nothing is being traced."""
+
+    class _NullSpan:
+        def set(self, **attributes):
+            pass
+
+    _span = _NullSpan()
+
+    @contextmanager
+    def span(self, name, category='workflow', **attributes):
+        yield self._span
+
+    def add_span(self, name, start, end, category='workflow', track=None, **attributes):
+        return self._span
+
+    def instant(self, name, category='workflow', **attributes):
+        pass
+
+
+NULL_TRACER = NullTracer()
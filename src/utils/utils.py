@@ -1,35 +1,28 @@
 import json
-import re
 from typing import List
 
+from utils.json_stream import extract_json_objects
+
 
 def extract_json_to_str(str):
-    """Extract JSON content from triple-backtick markdown-style blocks."""
-    json_match = re.search(r"```json\n(.*?)```", str, re.DOTALL)
-    if json_match:
-        return json.loads(json_match.group(1))
-    else:
-        # Fall back if no backticks
-        return json.loads(str)
+    """Extract the first JSON object from LLM output, fenced or not; raises json.JSONDecodeError."""
+    objects = extract_json_objects(str, limit=1)
+    if not objects:
+        raise json.JSONDecodeError("No JSON object found", str, 0)
+    return objects[0]
 
 
 def extract_json(text: str) -> List[dict]:
-    """Extracts JSON content from a string where JSON is embedded between \`\`\`json and \`\`\` tags.
+    """Extracts every JSON object embedded in a string, e.g. between \`\`\`json and \`\`\` tags.
+
+    Fences are optional and may be of any shape (no newline after the opening
+    fence, nested backticks inside strings); objects are found by tracking
+    balanced braces in a single pass.
 
     Parameters:
         text (str): The text containing the JSON content.
 
     Returns:
-        list: A list of extracted JSON strings.
+        list: A list of the parsed JSON objects, empty if there are none.
     """
-    # Define the regular expression pattern to match JSON blocks
-    pattern = r"\`\`\`json(.*?)\`\`\`"
-
-    # Find all non-overlapping matches of the pattern in the string
-    matches = re.findall(pattern, text, re.DOTALL)
-
-    # Return the list of matched JSON strings, stripping any leading or trailing whitespace
-    try:
-        return [json.loads(match.strip()) for match in matches]
-    except Exception:
-        raise ValueError(f"Failed to parse: {text}")
+    return extract_json_objects(text)
@@ -0,0 +1,493 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+
+from batch import SPEC_EXTENSIONS, load_specs
+from tools.file_hanler import FileHandler
+from utils.custom_logger import get_logger, configure_logging
+
+
+logger = get_logger(__name__)
+
+
+class LeaseLost(Exception):
+    """Raised when a worker's lease on a job expired and the job went back to the queue."""
+
+
+def project_name_for(job_id):
+    """The directory a queue job publishes its project to, the same for every attempt."""
+    name = re.sub(r'[^\w.-]', '_', job_id)
+    if name != job_id:
+        # Keep ids that only differ in replaced characters apart
+        name = f"{name}_{hashlib.sha256(job_id.encode('utf-8')).hexdigest()[:8]}"
+    return f"job_{name}"
+
+
+class Lease:
+    """A worker's claim on one job, valid until `expires_at` unless renewed."""
+
+    def __init__(self, job_id, spec, token, attempt, expires_at):
+        self.job_id = job_id
+        self.spec = spec
+        # Fencing token: only the holder of the current lease may finish the job
+        self.token = token
+        self.attempt = attempt
+        self.expires_at = expires_at
+
+
+class WorkQueue:
+    """
+    Durable job queue in a SQLite database shared by any number of worker
+    processes or machines.
+
+    A worker claims a job by taking a lease on it for `lease_seconds` and
+    renews the lease with heartbeats while the job runs. A job whose lease
+    runs out (its worker died, hung or lost the database) becomes visible
+    to other workers again, until it has been attempted `max_attempts`
+    times. Each claim gets a new token, and a job can only be completed or
+    failed with the token of its current lease, so a worker that lost its
+    lease cannot overwrite the result of the worker that took over.
+
+    Every state change is a single short transaction, so claims from many
+    workers only contend for milliseconds. The database must be on a
+    filesystem with working POSIX locks (a local disk or a shared volume
+    that supports them, not most network filesystems), and the workers'
+    clocks must be roughly in sync, since lease expiry compares timestamps.
+    """
+
+    DEFAULT_PATH = 'work_queue.sqlite'
+
+    QUEUED = 'queued'
+    LEASED = 'leased'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    def __init__(self, path=DEFAULT_PATH, lease_seconds=120, max_attempts=3, retry_delay=10):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Seconds before a failed job is retried; doubles with every attempt
+        self.retry_delay = retry_delay
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " spec TEXT NOT NULL,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL,"
+                " visible_at REAL NOT NULL,"
+                " lease_token TEXT,"
+                " lease_owner TEXT,"
+                " lease_expires REAL,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " output_dir TEXT,"
+                " error TEXT)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_claim "
+                "ON jobs (status, priority DESC, visible_at, created_at)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_lease_expires ON jobs (status, lease_expires)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Job state must survive power loss, not only process crashes
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def submit(self, spec, job_id=None, priority=0):
+        """
+        Adds a job and returns its id. Submitting an id that already exists
+        changes nothing and returns None, so a retried submission cannot
+        queue the same job twice.
+        """
+        if not spec or not spec.strip():
+            raise ValueError("The specification is empty")
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, spec, priority, status, max_attempts, "
+                "visible_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, spec.strip(), priority, self.QUEUED, self.max_attempts, now, now)).rowcount
+        if not inserted:
+            logger.warning("Job %s already exists, not submitted again", job_id)
+            return None
+        return job_id
+
+    def claim(self, owner):
+        """Leases the next visible job for `owner`; returns a Lease, or None if there is none."""
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT job_id, spec, attempts FROM jobs WHERE status = ? AND visible_at <= ? "
+                "ORDER BY priority DESC, visible_at, created_at LIMIT 1",
+                (self.QUEUED, now)).fetchone()
+            if row is None:
+                return None
+            job_id, spec, attempts = row
+            token = uuid.uuid4().hex
+            expires_at = now + self.lease_seconds
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_token = ?, "
+                "lease_owner = ?, lease_expires = ?, started_at = ? WHERE job_id = ?",
+                (self.LEASED, token, owner, expires_at, now, job_id))
+        return Lease(job_id, spec, token, attempts + 1, expires_at)
+
+    def heartbeat(self, lease):
+        """Extends a lease by `lease_seconds`; raises LeaseLost if it is no longer current."""
+        expires_at = time.time() + self.lease_seconds
+        with self._connection() as conn:
+            renewed = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND lease_token = ? "
+                "AND status = ?", (expires_at, lease.job_id, lease.token, self.LEASED)).rowcount
+        if not renewed:
+            raise LeaseLost(f"Lease on job {lease.job_id} was lost")
+        lease.expires_at = expires_at
+
+    def complete(self, lease, output_dir):
+        """Records a job's result; raises LeaseLost if another worker owns the job now."""
+        self._finish(lease, self.SUCCEEDED, output_dir=output_dir)
+
+    def fail(self, lease, error):
+        """
+        Records a failed attempt. The job is retried after a growing delay
+        until it has used up its attempts, then it stays failed.
+        """
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND lease_token = ?",
+                (lease.job_id, lease.token)).fetchone()
+        if row is not None and row[0] < row[1]:
+            delay = self.retry_delay * 2 ** (row[0] - 1)
+            self._finish(lease, self.QUEUED, error=error, visible_at=time.time() + delay)
+        else:
+            self._finish(lease, self.FAILED, error=error)
+
+    def _finish(self, lease, status, output_dir=None, error=None, visible_at=None):
+        now = time.time()
+        with self._connection() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, output_dir = ?, error = ?, finished_at = ?, "
+                "visible_at = COALESCE(?, visible_at), lease_token = NULL, lease_owner = NULL, "
+                "lease_expires = NULL WHERE job_id = ? AND lease_token = ? AND status = ?",
+                (status, output_dir, error, now, visible_at, lease.job_id, lease.token,
+                 self.LEASED)).rowcount
+        if not updated:
+            raise LeaseLost(f"Lease on job {lease.job_id} was lost")
+
+    def _requeue_expired(self, conn, now):
+        """Returns jobs whose lease ran out to the queue, or fails them when out of attempts."""
+        expired = conn.execute(
+            "SELECT job_id, lease_owner, attempts, max_attempts FROM jobs "
+            "WHERE status = ? AND lease_expires < ?", (self.LEASED, now)).fetchall()
+        for job_id, owner, attempts, max_attempts in expired:
+            status = self.QUEUED if attempts < max_attempts else self.FAILED
+            logger.warning("Lease of %s on job %s expired, job is %s", owner, job_id, status)
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, visible_at = ?, lease_token = NULL, "
+                "lease_owner = NULL, lease_expires = NULL WHERE job_id = ?",
+                (status, f"lease of {owner} expired", now, job_id))
+        return len(expired)
+
+    def requeue_expired(self):
+        """Re-queues abandoned jobs now instead of at the next claim; returns how many."""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return self._requeue_expired(conn, time.time())
+
+    def retry(self, job_id):
+        """Queues a failed job again with a fresh set of attempts."""
+        with self._connection() as conn:
+            return bool(conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, visible_at = ?, error = NULL "
+                "WHERE job_id = ? AND status = ?",
+                (self.QUEUED, time.time(), job_id, self.FAILED)).rowcount)
+
+    def job(self, job_id):
+        with self._connection() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                "SELECT job_id, priority, status, attempts, max_attempts, lease_owner, "
+                "lease_expires, created_at, started_at, finished_at, output_dir, error "
+                "FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            conn.row_factory = None
+        return dict(row) if row else None
+
+    def counts(self):
+        """Number of jobs in each status."""
+        with self._connection() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def pending(self):
+        """Queued or leased jobs, i.e. work that is not finished yet."""
+        counts = self.counts()
+        return counts.get(self.QUEUED, 0) + counts.get(self.LEASED, 0)
+
+
+class QueueWorker:
+    """
+    Pulls jobs from a WorkQueue and runs each with `ProjectWorkflow.execute`.
+
+    `threads` jobs run at once, each thread with its own warm LLM client and
+    agents. One heartbeat thread renews all of the worker's leases every
+    third of the lease time. A job whose lease is lost while it runs is
+    still allowed to finish, but its result is discarded and its project
+    removed, since the job has been handed to another worker.
+
+    Each job publishes to a directory named after its id. An attempt that
+    finds it already published (the previous worker crashed before
+    recording the result) completes the job with it instead of generating
+    the project again.
+
+    A worker thread that cannot start or loses the queue database logs the
+    error and stops; `errors` holds these errors once `run` returns.
+    """
+
+    def __init__(self, queue, threads=1, worker_id=None, poll_interval=2.0,
+                 stage_concurrency=3, llm_factory=None, exit_when_empty=False):
+        self.queue = queue
+        self.threads = threads
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stage_concurrency = stage_concurrency
+        self.llm_factory = llm_factory
+        # Stop once no job is queued or leased, instead of polling forever
+        self.exit_when_empty = exit_when_empty
+        self.completed = 0
+        self.failed = 0
+        self.errors = []
+        self._active = {}
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Set once every job thread has exited, so the heartbeat can stop
+        self._finished = threading.Event()
+        self.file_handler = FileHandler()
+
+    def stop(self):
+        """Finishes the running jobs, then returns from `run`; claims no new jobs."""
+        self._stopping.set()
+
+    def run(self):
+        heartbeat = threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        # Daemon threads: if the process is killed, its leases expire and other workers take over
+        workers = [threading.Thread(target=self._work, args=(index,),
+                                    name=f"queue-worker-{index}", daemon=True)
+                   for index in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self._stopping.set()
+        self._finished.set()
+        heartbeat.join()
+        logger.info("Worker %s stopped: %d completed, %d failed",
+                    self.worker_id, self.completed, self.failed)
+
+    def _work(self, index):
+        try:
+            self._run_jobs(index)
+        except Exception as e:
+            logger.error("Worker thread %d stopped: %s", index, e, exc_info=True)
+            with self._lock:
+                self.errors.append(e)
+
+    def _run_jobs(self, index):
+        # Imported here so that claiming and heartbeats never wait for crewai
+        from agents import AgentRegistry
+        from main import ProjectWorkflow, WORKFLOW_AGENTS, create_llm
+
+        llm = (self.llm_factory or create_llm)()
+        agents = AgentRegistry(llm)
+        agents.warm(WORKFLOW_AGENTS)
+        owner = f"{self.worker_id}/{index}"
+
+        while not self._stopping.is_set():
+            lease = self.queue.claim(owner)
+            if lease is None:
+                if self.exit_when_empty and not self.queue.pending():
+                    return
+                self._stopping.wait(self.poll_interval)
+                continue
+
+            project_name = project_name_for(lease.job_id)
+            published = os.path.join(self.file_handler.base_output_dir, project_name)
+            if os.path.isdir(published):
+                logger.info("Job %s was already published to %s, completing it", lease.job_id,
+                            published)
+                self._record(lease, published, discard=False)
+                continue
+
+            logger.info("%s running job %s (attempt %d)", owner, lease.job_id, lease.attempt)
+            with self._lock:
+                self._active[lease.token] = lease
+            try:
+                workflow = ProjectWorkflow(
+                    lease.spec, llm=llm, max_concurrency=self.stage_concurrency, agents=agents,
+                    resume_key=lease.job_id, project_name=project_name)
+                workflow.execute()
+                self._record(lease, workflow.output_dir)
+            except Exception as e:
+                logger.error("Job %s failed: %s", lease.job_id, e, exc_info=True)
+                self._record(lease, None, str(e))
+            finally:
+                with self._lock:
+                    self._active.pop(lease.token, None)
+                    self._lost.discard(lease.token)
+
+    def _record(self, lease, output_dir, error=None, discard=True):
+        """Completes or fails a job; with `discard`, removes the project if the lease was lost."""
+        try:
+            if lease.token in self._lost:
+                raise LeaseLost(f"Lease on job {lease.job_id} was lost")
+            if error is None:
+                self.queue.complete(lease, output_dir)
+                self.completed += 1
+            else:
+                self.queue.fail(lease, error)
+                self.failed += 1
+        except LeaseLost:
+            logger.warning("Discarding the result of job %s: another worker owns it", lease.job_id)
+            if output_dir and discard:
+                self._discard(lease, output_dir)
+
+    def _discard(self, lease, output_dir):
+        """Removes a project and its catalog entry unless the job's new owner completed with it."""
+        job = self.queue.job(lease.job_id)
+        if job is not None and job['output_dir'] == output_dir:
+            return
+        shutil.rmtree(output_dir, ignore_errors=True)
+        catalog = self.file_handler.get_catalog()
+        if catalog is not None:
+            run = catalog.for_project_dir(output_dir)
+            if run is not None:
+                catalog.remove(run['run_id'])
+
+    def _heartbeat(self):
+        interval = max(self.queue.lease_seconds / 3, 0.1)
+        while True:
+            with self._lock:
+                leases = [lease for token, lease in self._active.items()
+                          if token not in self._lost]
+            if not leases and self._stopping.is_set():
+                return
+            for lease in leases:
+                try:
+                    self.queue.heartbeat(lease)
+                except LeaseLost:
+                    logger.warning("Lost the lease on job %s", lease.job_id)
+                    with self._lock:
+                        self._lost.add(lease.token)
+                except sqlite3.Error as e:
+                    # The lease is only lost if this keeps failing until it expires
+                    logger.warning("Heartbeat for job %s failed: %s", lease.job_id, e)
+            self._finished.wait(interval)
+
+
+def submit_specs(queue, source, priority=0):
+    """Submits one spec file, or every spec of a directory or JSONL file; returns the new ids."""
+    if os.path.isfile(source) and source.endswith(SPEC_EXTENSIONS):
+        with open(source, 'r') as f:
+            specs = [(os.path.splitext(os.path.basename(source))[0], f.read().strip())]
+    else:
+        specs = load_specs(source)
+    return [job_id for job_id in (queue.submit(spec, job_id, priority) for job_id, spec in specs)
+            if job_id]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Shared, crash-safe generation queue that any number of workers pull from.")
+    parser.add_argument('--db', default=os.environ.get('WORK_QUEUE_DB', WorkQueue.DEFAULT_PATH),
+                        help="Queue database shared by all workers (env WORK_QUEUE_DB)")
+    parser.add_argument('--lease-seconds', type=float, default=120,
+                        help="How long a claimed job stays invisible without a heartbeat")
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--log-json', default=None,
+                        help="Also append structured JSON-lines logs to this file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help="Queue a spec file, a directory or a JSONL file")
+    submit.add_argument('source')
+    submit.add_argument('--priority', type=int, default=0)
+
+    work = commands.add_parser('work', help="Run jobs from the queue")
+    work.add_argument('--threads', type=int, default=1,
+                      help="Jobs this worker runs at once")
+    work.add_argument('--stage-concurrency', type=int, default=3,
+                      help="Concurrent stages inside each workflow")
+    work.add_argument('--poll-interval', type=float, default=2.0)
+    work.add_argument('--drain', action='store_true',
+                      help="Exit once the queue has no queued or running jobs")
+
+    status = commands.add_parser('status', help="Show job counts, or one job")
+    status.add_argument('job_id', nargs='?')
+
+    retry = commands.add_parser('retry', help="Queue a failed job again")
+    retry.add_argument('job_id')
+    args = parser.parse_args(argv)
+
+    if args.log_json:
+        configure_logging(json_path=args.log_json)
+
+    queue = WorkQueue(args.db, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+    if args.command == 'submit':
+        job_ids = submit_specs(queue, args.source, args.priority)
+        print(f"Queued {len(job_ids)} jobs")
+    elif args.command == 'work':
+        worker = QueueWorker(
+            queue, threads=args.threads, poll_interval=args.poll_interval,
+            stage_concurrency=args.stage_concurrency, exit_when_empty=args.drain)
+        # SIGTERM lets running jobs finish; Ctrl-C abandons them to their lease expiry
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            # Running jobs' leases expire and other workers pick them up
+            logger.info("Interrupted")
+            return 130
+        if worker.errors:
+            return 1
+    elif args.command == 'status':
+        report = queue.job(args.job_id) if args.job_id else queue.counts()
+        if report is None:
+            print(f"Unknown job {args.job_id}")
+            return 1
+        print(json.dumps(report, indent=2))
+    elif args.command == 'retry':
+        if not queue.retry(args.job_id):
+            print(f"Job {args.job_id} is not failed")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())